@@ -0,0 +1,100 @@
+"""Benchmark the throughput of each available JSON backend on LSP traffic.
+
+By default a synthetic session is generated, alternatively pass the path to a file
+created with ``lsp-devtools record --to-file`` to benchmark against recorded traffic.
+
+Usage::
+
+   python benchmarks/bench_codec.py [FILE]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import pathlib
+import time
+
+from lsp_devtools import codec
+
+
+def synthetic_session() -> list[bytes]:
+    """Generate a session dominated by the kinds of messages that are expensive to
+    process: document contents, completion results and semantic tokens."""
+    text = 'def fn(arg):\n    return arg * 2  # comment with "quotes"\n' * 2000
+    messages = [
+        dict(
+            jsonrpc="2.0",
+            method="textDocument/didOpen",
+            params=dict(
+                textDocument=dict(uri="file:///a.py", languageId="python", text=text)
+            ),
+        ),
+        dict(
+            jsonrpc="2.0",
+            id=1,
+            result=dict(
+                isIncomplete=False,
+                items=[
+                    dict(label=f"item{i}", kind=3, detail="detail", sortText=f"{i:05}")
+                    for i in range(1000)
+                ],
+            ),
+        ),
+        dict(jsonrpc="2.0", id=2, result=dict(data=list(range(50_000)))),
+        *[
+            dict(
+                jsonrpc="2.0",
+                method="$/progress",
+                params=dict(token=1, value=dict(kind="report", percentage=i)),
+            )
+            for i in range(100)
+        ],
+    ]
+
+    return [json.dumps(m).encode() for m in messages]
+
+
+def main():
+    cli = argparse.ArgumentParser(description=__doc__)
+    cli.add_argument("file", nargs="?", type=pathlib.Path)
+    cli.add_argument("--repeat", type=int, default=10)
+    args = cli.parse_args()
+
+    if args.file:
+        data = [line.encode() for line in args.file.read_text().splitlines() if line]
+    else:
+        data = synthetic_session()
+
+    total = sum(len(d) for d in data)
+    print(f"{len(data)} messages, {total / 1e6:.1f}MB total")
+
+    for name, loader in codec.BACKENDS.items():
+        try:
+            backend = loader()
+        except ImportError:
+            print(f"{name:>8}: not installed")
+            continue
+
+        decoded = [backend.loads(d) for d in data]
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for d in data:
+                backend.loads(d)
+        load_time = (time.perf_counter() - start) / args.repeat
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for obj in decoded:
+                backend.dumps(obj, None, None)
+        dump_time = (time.perf_counter() - start) / args.repeat
+
+        print(
+            f"{name:>8}: loads {total / load_time / 1e6:8.1f}MB/s"
+            f"  dumps {total / dump_time / 1e6:8.1f}MB/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
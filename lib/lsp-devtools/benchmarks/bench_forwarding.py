@@ -0,0 +1,132 @@
+"""Benchmark the agent's forwarding path, against a server flooding the client with
+``$/progress`` notifications.
+
+Compares forwarding each message with its own write (``--max-burst-size 0``) with
+forwarding the messages available after each read in bursts. The time taken is from the
+agent starting, until the client has received the last message.
+
+Usage::
+
+   python benchmarks/bench_forwarding.py [--messages N] [--size BYTES]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from lsp_devtools.agent import Agent
+from lsp_devtools.agent.agent import MAX_BURST_SIZE
+
+FLOOD_SERVER = """\
+import sys
+
+frame = bytes.fromhex(sys.argv[1])
+out = sys.stdout.buffer
+for _ in range(int(sys.argv[2])):
+    out.write(frame)
+
+out.flush()
+
+# Wait for the agent to close our stdin.
+sys.stdin.buffer.read()
+"""
+
+
+def make_frame(size: int) -> bytes:
+    body = json.dumps(
+        dict(
+            jsonrpc="2.0",
+            method="$/progress",
+            params=dict(token=1, value=dict(kind="report", message="x" * size)),
+        )
+    ).encode()
+    return b"Content-Length: %d\r\n\r\n%s" % (len(body), body)
+
+
+async def run(frame: bytes, n_messages: int, max_burst_size: int) -> float:
+    """Return the time taken for the agent to forward ``n_messages`` copies of the
+    given frame from the server to the client."""
+    loop = asyncio.get_running_loop()
+    expected = len(frame) * n_messages
+
+    # The client's end of the agent's stdin/stdout
+    stdin_read, stdin_write = os.pipe()
+    stdout_read, stdout_write = os.pipe()
+
+    received = 0
+    done = asyncio.Event()
+
+    class Client(asyncio.Protocol):
+        def data_received(self, data: bytes):
+            nonlocal received
+            received += len(data)
+            if received >= expected:
+                done.set()
+
+    client_transport, _ = await loop.connect_read_pipe(
+        Client, os.fdopen(stdout_read, "rb", buffering=0)
+    )
+
+    start = time.perf_counter()
+    server = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-c",
+        FLOOD_SERVER,
+        frame.hex(),
+        str(n_messages),
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+    )
+    agent = Agent(
+        server,
+        os.fdopen(stdin_read, "rb", buffering=0),
+        os.fdopen(stdout_write, "wb", buffering=0),
+        lambda _: None,
+        max_burst_size=max_burst_size,
+    )
+    task = asyncio.create_task(agent.start())
+
+    await done.wait()
+    elapsed = time.perf_counter() - start
+
+    server.stdin.close()  # type: ignore[union-attr]
+    await server.wait()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+    client_transport.close()
+    os.close(stdin_write)
+    return elapsed
+
+
+def main():
+    cli = argparse.ArgumentParser(description=__doc__)
+    cli.add_argument("--messages", type=int, default=100_000)
+    cli.add_argument("--size", type=int, default=64, help="approx. body size in bytes")
+    cli.add_argument("--repeat", type=int, default=3)
+    args = cli.parse_args()
+
+    frame = make_frame(args.size)
+    nbytes = len(frame) * args.messages
+    print(f"{args.messages} messages, {nbytes / 1e6:.1f}MB total")
+
+    for name, max_burst_size in [("message", 0), ("burst", MAX_BURST_SIZE)]:
+        timings = [
+            asyncio.run(run(frame, args.messages, max_burst_size))
+            for _ in range(args.repeat)
+        ]
+
+        best = min(timings)
+        rate = args.messages / best
+        print(f"{name:>8}: {best * 1000:8.1f}ms  {rate:12,.0f} msg/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Micro-benchmark comparing the agent's frame decoder against the previous
+line-by-line ``aio_readline`` implementation.
+
+Usage::
+
+   python benchmarks/bench_framing.py [--messages N] [--size BYTES]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import inspect
+import json
+import re
+import time
+
+from lsp_devtools.agent.agent import aio_readline
+
+
+async def legacy_aio_readline(reader, message_handler):
+    """The original implementation of ``aio_readline``, kept here for comparison."""
+    CONTENT_LENGTH_PATTERN = re.compile(rb"^Content-Length: (\d+)\r\n$")
+
+    message = []
+    content_length = 0
+
+    while True:
+        header = await reader.readline()
+        if not header:
+            break
+        message.append(header)
+
+        if not content_length:
+            match = CONTENT_LENGTH_PATTERN.fullmatch(header)
+            if match:
+                content_length = int(match.group(1))
+
+        if content_length and not header.strip():
+            body = await reader.readexactly(content_length)
+            if not body:
+                break
+            message.append(body)
+
+            result = message_handler(b"".join(message))
+            if inspect.isawaitable(result):
+                await result
+
+            message = []
+            content_length = 0
+
+
+def make_stream(n_messages: int, size: int) -> bytes:
+    """Generate a stream of ``$/progress`` style notifications."""
+    frames = []
+    for idx in range(n_messages):
+        body = json.dumps(
+            dict(
+                jsonrpc="2.0",
+                method="$/progress",
+                params=dict(token=idx, value=dict(kind="report", message="x" * size)),
+            )
+        ).encode()
+        frames.append(
+            b"Content-Length: %d\r\n"
+            b"Content-Type: application/vscode-jsonrpc; charset=utf-8\r\n\r\n%s"
+            % (len(body), body)
+        )
+
+    return b"".join(frames)
+
+
+async def run(impl, data: bytes, chunk_size: int) -> tuple[float, int]:
+    reader = asyncio.StreamReader()
+    count = 0
+
+    def handler(frame: bytes):
+        nonlocal count
+        count += 1
+
+    async def feed():
+        for idx in range(0, len(data), chunk_size):
+            reader.feed_data(data[idx : idx + chunk_size])
+            await asyncio.sleep(0)
+
+        reader.feed_eof()
+
+    start = time.perf_counter()
+    await asyncio.gather(feed(), impl(reader, handler))
+    return time.perf_counter() - start, count
+
+
+def main():
+    cli = argparse.ArgumentParser(description=__doc__)
+    cli.add_argument("--messages", type=int, default=50_000)
+    cli.add_argument("--size", type=int, default=64, help="approx. body size in bytes")
+    cli.add_argument("--chunk-size", type=int, default=64 * 1024)
+    cli.add_argument("--repeat", type=int, default=5)
+    args = cli.parse_args()
+
+    data = make_stream(args.messages, args.size)
+    print(f"{args.messages} messages, {len(data) / 1e6:.1f}MB total")
+
+    for name, impl in [("legacy", legacy_aio_readline), ("decoder", aio_readline)]:
+        best = min(
+            asyncio.run(run(impl, data, args.chunk_size))[0] for _ in range(args.repeat)
+        )
+        rate = args.messages / best
+        print(f"{name:>8}: {best * 1000:8.1f}ms  {rate:12,.0f} msg/s")
+
+
+if __name__ == "__main__":
+    main()
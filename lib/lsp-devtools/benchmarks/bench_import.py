@@ -0,0 +1,83 @@
+"""Benchmark the startup time of each ``lsp-devtools`` subcommand.
+
+Each subcommand is run with ``--help`` in a fresh interpreter, so the time includes
+starting Python, importing the modules needed by that subcommand and building its
+command line parser. The packages taking the longest to import (as reported by
+``python -X importtime``) are also listed.
+
+Usage::
+
+   python benchmarks/bench_import.py [--repeat N] [--top N] [COMMAND ...]
+"""
+
+from __future__ import annotations
+
+import argparse
+import subprocess
+import sys
+import time
+
+from lsp_devtools.cli import BUILTIN_COMMANDS
+
+
+def run_command(args: list[str]) -> float:
+    """Return the time taken (in seconds) to run ``lsp-devtools`` with the given
+    arguments."""
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-m", "lsp_devtools", *args],
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - start
+
+
+def import_times(args: list[str]) -> dict[str, int]:
+    """Return the time (in microseconds) spent importing each top-level package, when
+    running ``lsp-devtools`` with the given arguments.
+
+    Only the time spent in the package's own modules is counted, not the packages they
+    import in turn.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "lsp_devtools", *args],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+
+    times: dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        self_time, _, name = line[len("import time:") :].split("|")
+        package = name.strip().split(".")[0]
+        times[package] = times.get(package, 0) + int(self_time)
+
+    return times
+
+
+def main():
+    cli = argparse.ArgumentParser(description=__doc__)
+    cli.add_argument("commands", nargs="*", default=list(BUILTIN_COMMANDS))
+    cli.add_argument("--repeat", type=int, default=5)
+    cli.add_argument("--top", type=int, default=5, help="number of packages to list")
+    args = cli.parse_args()
+
+    baseline = min(run_command(["--version"]) for _ in range(args.repeat))
+    print(f"{'(none)':>8}: {baseline * 1000:8.1f}ms")
+
+    for command in args.commands:
+        best = min(run_command([command, "--help"]) for _ in range(args.repeat))
+        times = import_times([command, "--help"])
+        top = sorted(times.items(), key=lambda item: item[1], reverse=True)
+        packages = ", ".join(
+            f"{name} {value / 1000:.0f}ms" for name, value in top[: args.top]
+        )
+        print(f"{command:>8}: {best * 1000:8.1f}ms  ({packages})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Benchmark the agent forwarding a single large message from the server to the client.
+
+Compares waiting for the complete message before forwarding it (``--stream-threshold
+0``) with forwarding it in pieces as it arrives, with and without a limit on the size of
+the recorded message. Reports the time until the client receives the first and last
+byte of the message (from the agent starting) and the peak memory allocated while
+forwarding it, as measured by ``tracemalloc``.
+
+Usage::
+
+   python benchmarks/bench_large_messages.py [--size BYTES] [--max-record-size BYTES]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+
+from lsp_devtools.agent import Agent
+from lsp_devtools.agent.agent import STREAM_THRESHOLD
+
+LARGE_SERVER = """\
+import sys
+
+size = int(sys.argv[1])
+body = b'{"jsonrpc": "2.0", "id": 1, "result": {"text": "%s"}}' % (b"x" * size)
+out = sys.stdout.buffer
+out.write(b"Content-Length: %d\\r\\n\\r\\n" % len(body))
+
+for idx in range(0, len(body), 65536):
+    out.write(body[idx : idx + 65536])
+    out.flush()
+
+# Wait for the agent to close our stdin.
+sys.stdin.buffer.read()
+"""
+
+
+async def run(
+    size: int, stream_threshold: int, max_record_size: int | None
+) -> tuple[float, float, int]:
+    """Return the time taken for the client to receive the first and last byte of the
+    message, and the peak memory allocated while forwarding it."""
+    loop = asyncio.get_running_loop()
+
+    # The client's end of the agent's stdin/stdout
+    stdin_read, stdin_write = os.pipe()
+    stdout_read, stdout_write = os.pipe()
+
+    expected = None
+    received = 0
+    first_byte = 0.0
+    done = asyncio.Event()
+
+    class Client(asyncio.Protocol):
+        def data_received(self, data: bytes):
+            nonlocal expected, received, first_byte
+            if received == 0:
+                first_byte = time.perf_counter()
+                header = data[: data.index(b"\r\n\r\n") + 4]
+                expected = len(header) + int(header.split(b":")[1])
+
+            received += len(data)
+            if received >= expected:  # type: ignore[operator]
+                done.set()
+
+    client_transport, _ = await loop.connect_read_pipe(
+        Client, os.fdopen(stdout_read, "rb", buffering=0)
+    )
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    server = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-c",
+        LARGE_SERVER,
+        str(size),
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+    )
+    agent = Agent(
+        server,
+        os.fdopen(stdin_read, "rb", buffering=0),
+        os.fdopen(stdout_write, "wb", buffering=0),
+        lambda _: None,
+        max_record_size=max_record_size,
+        stream_threshold=stream_threshold,
+    )
+    task = asyncio.create_task(agent.start())
+
+    await done.wait()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    server.stdin.close()  # type: ignore[union-attr]
+    await server.wait()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+    client_transport.close()
+    os.close(stdin_write)
+    return first_byte - start, elapsed, peak
+
+
+def main():
+    cli = argparse.ArgumentParser(description=__doc__)
+    cli.add_argument(
+        "--size", type=int, default=20 * 1024 * 1024, help="message size in bytes"
+    )
+    cli.add_argument("--max-record-size", type=int, default=64 * 1024)
+    cli.add_argument("--repeat", type=int, default=3)
+    args = cli.parse_args()
+
+    print(f"{args.size / 1e6:.1f}MB message")
+
+    configs = [
+        ("buffered", 0, None),
+        ("streamed", STREAM_THRESHOLD, None),
+        ("truncated", STREAM_THRESHOLD, args.max_record_size),
+    ]
+    for name, stream_threshold, max_record_size in configs:
+        results = [
+            asyncio.run(run(args.size, stream_threshold, max_record_size))
+            for _ in range(args.repeat)
+        ]
+
+        first = min(r[0] for r in results)
+        last = min(r[1] for r in results)
+        peak = min(r[2] for r in results)
+        print(
+            f"{name:>10}: first byte {first * 1000:8.1f}ms  "
+            f"last byte {last * 1000:8.1f}ms  peak memory {peak / 1e6:8.1f}MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""Benchmark the latency the agent adds to each message, while recording a flood of
+``textDocument/didChange`` notifications from the client.
+
+Each message carries the (monotonic) time it was sent by the client, once forwarded to
+the server the time taken is recorded. The agent's handler does work comparable to
+recording a session: the ``text`` of each change is truncated by a policy (decoding and
+re-encoding the message) and the records are compressed in batches. This is compared
+with the same work done on a dedicated observer thread (``--observer-thread``) and a
+baseline where nothing is recorded.
+
+Usage::
+
+   python benchmarks/bench_observer.py [--rate N] [--seconds N] [--size BYTES]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import zlib
+
+from lsp_devtools.agent import Agent
+from lsp_devtools.agent.observer import ObserverThread
+from lsp_devtools.agent.policies import Policy
+from lsp_devtools.agent.policies import RecordPolicies
+
+CLIENT = """\
+import os
+import sys
+import time
+
+rate, seconds, size = int(sys.argv[1]), float(sys.argv[2]), int(sys.argv[3])
+template = (
+    b'{"jsonrpc": "2.0", "method": "textDocument/didChange", "params": '
+    b'{"textDocument": {"uri": "file:///a.py", "version": %d}, '
+    b'"contentChanges": [{"text": "' + b"x" * size + b'"}], "sent": %d}}'
+)
+
+# Send a burst of messages every millisecond.
+per_tick = max(1, rate // 1000)
+start = time.monotonic()
+for tick in range(int(seconds * 1000)):
+    frames = []
+    for idx in range(per_tick):
+        body = template % (idx, time.monotonic_ns())
+        frames.append(b"Content-Length: %d\\r\\n\\r\\n%s" % (len(body), body))
+
+    os.write(1, b"".join(frames))
+    time.sleep(max(0, start + (tick + 1) / 1000 - time.monotonic()))
+"""
+
+SERVER = """\
+import re
+import sys
+import time
+
+# Report the time each message arrived, relative to when it was sent.
+pattern = re.compile(rb'"sent": (\\d+)}}')
+buffer = b""
+while data := sys.stdin.buffer.read1(65536):
+    now = time.monotonic_ns()
+    buffer += data
+    end = 0
+    for match in pattern.finditer(buffer):
+        sys.stderr.write(f"{now - int(match.group(1))}\\n")
+        end = match.end()
+
+    buffer = buffer[end:]
+
+sys.stderr.flush()
+"""
+
+BATCH_SIZE = 64
+
+
+class BatchCompressor:
+    """Stands in for an agent client, compressing records in batches."""
+
+    def __init__(self):
+        self.batch: list[bytes] = []
+        self.compressed = 0
+
+    def __call__(self, record: bytes):
+        self.batch.append(record)
+        if len(self.batch) >= BATCH_SIZE:
+            self.compressed += len(zlib.compress(b"".join(self.batch)))
+            self.batch = []
+
+
+async def run(mode: str, rate: int, seconds: float, size: int) -> list[int]:
+    """Return the latency (in nanoseconds) added to each message sent by the client."""
+
+    # The client's end of the agent's stdin/stdout
+    stdin_read, stdin_write = os.pipe()
+    stdout_read, stdout_write = os.pipe()
+
+    server = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-c",
+        SERVER,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    output = asyncio.create_task(server.stderr.read())  # type: ignore[union-attr]
+
+    observer = None
+    if mode == "thread":
+        observer = ObserverThread()
+        observer.start()
+
+    policies = None
+    if mode != "baseline":
+        policies = RecordPolicies(
+            [Policy.parse("textDocument/didChange:params.contentChanges.*.text=hash")]
+        )
+
+    agent = Agent(
+        server,
+        os.fdopen(stdin_read, "rb", buffering=0),
+        os.fdopen(stdout_write, "wb", buffering=0),
+        BatchCompressor() if mode != "baseline" else lambda _: None,
+        policies=policies,
+        observer=observer,
+    )
+    task = asyncio.create_task(agent.start())
+
+    client = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-c",
+        CLIENT,
+        str(rate),
+        str(seconds),
+        str(size),
+        stdout=stdin_write,
+    )
+    await client.wait()
+
+    # Once everything has been forwarded, close the server's stdin so it exits.
+    expected = max(1, rate // 1000) * int(seconds * 1000)
+    while agent._messages.values.get("client", 0) < expected:
+        await asyncio.sleep(0.01)
+
+    server.stdin.close()  # type: ignore[union-attr]
+    await server.wait()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+    if observer is not None:
+        await observer.stop()
+
+    os.close(stdin_write)
+    os.close(stdout_read)
+    return [int(line) for line in (await output).splitlines()]
+
+
+def main():
+    cli = argparse.ArgumentParser(description=__doc__)
+    cli.add_argument("--rate", type=int, default=20_000, help="messages per second")
+    cli.add_argument("--seconds", type=float, default=2.0)
+    cli.add_argument("--size", type=int, default=1024, help="approx. text size")
+    args = cli.parse_args()
+
+    print(f"{args.rate} msg/s for {args.seconds}s, {args.size} byte changes")
+    for mode in ["baseline", "inline", "thread"]:
+        latencies = asyncio.run(run(mode, args.rate, args.seconds, args.size))
+        quantiles = statistics.quantiles(latencies, n=100)
+        print(
+            f"{mode:>8}: {len(latencies):8} messages  "
+            f"p50 {quantiles[49] / 1e3:8.0f}us  "
+            f"p99 {quantiles[98] / 1e3:8.0f}us  "
+            f"max {max(latencies) / 1e3:8.0f}us"
+        )
+
+
+if __name__ == "__main__":
+    main()
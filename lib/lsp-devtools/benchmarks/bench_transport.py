@@ -0,0 +1,161 @@
+"""Benchmark comparing the transports available between an agent and agent server:
+TCP, Unix domain sockets and a shared-memory ring.
+
+The server runs in a separate process, the time taken is from the first message being
+forwarded by the client until the server has passed the last one to its handler.
+
+Usage::
+
+   python benchmarks/bench_transport.py [--messages N] [--size BYTES]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import pathlib
+import socket
+import tempfile
+import time
+
+from lsp_devtools.agent import AgentClient
+from lsp_devtools.agent import AgentServer
+from lsp_devtools.agent.metadata import pack_record
+from lsp_devtools.agent.ring import is_available
+
+
+def make_records(n_messages: int, size: int) -> list[bytes]:
+    """Generate ``$/progress`` style notifications, packed as records."""
+    records = []
+    for idx in range(n_messages):
+        body = json.dumps(
+            dict(
+                jsonrpc="2.0",
+                method="$/progress",
+                params=dict(token=idx, value=dict(kind="report", message="x" * size)),
+            )
+        ).encode()
+        frame = b"Content-Length: %d\r\n\r\n%s" % (len(body), body)
+        records.append(pack_record("server", 0, time.time_ns(), frame))
+
+    return records
+
+
+def serve(address: str, n_messages: int, ready, done):
+    """Run an agent server, until it has handled ``n_messages`` messages."""
+
+    async def main():
+        count = 0
+        finished = asyncio.Event()
+
+        def handler(data, metadata):
+            nonlocal count
+            count += 1
+            if count == n_messages:
+                finished.set()
+
+        server = AgentServer(handler=handler)
+        host, _, port = address.rpartition(":")
+        if port.isdigit():
+            task = asyncio.create_task(server.start_tcp(host, int(port)))
+        else:
+            task = asyncio.create_task(server.start_unix(address))
+
+        while server._tcp_server is None:
+            await asyncio.sleep(0.01)
+
+        ready.set()
+        await finished.wait()
+        done.set()
+
+        server.stop()
+        task.cancel()
+
+    asyncio.run(main())
+
+
+async def run(transport: str, address: str, records: list[bytes], batch_size: int):
+    # Use a fresh process so that it does not share our resource tracker, as it would
+    # for two unrelated processes.
+    context = multiprocessing.get_context("spawn")
+    ready, done = context.Event(), context.Event()
+    process = context.Process(target=serve, args=(address, len(records), ready, done))
+    process.start()
+    ready.wait()
+
+    client = AgentClient(batch_size=batch_size, shared_memory=transport == "shm")
+    if transport == "tcp":
+        host, _, port = address.rpartition(":")
+        await client.start_tcp(host, int(port))
+    else:
+        await client.start_unix(address)
+
+    # Wait for the server to reply to the hello.
+    while not client.binary:
+        await asyncio.sleep(0.01)
+
+    start = time.perf_counter()
+    for idx, record in enumerate(records):
+        client.forward_message(record)
+
+        # Give the event loop a chance to write to the socket
+        if idx % 256 == 0:
+            await asyncio.sleep(0)
+
+    client.flush()
+    while not done.is_set():
+        await asyncio.sleep(0.0005)
+
+    elapsed = time.perf_counter() - start
+
+    client.protocol.writer.close()
+    await client.stop()
+    process.join()
+
+    return elapsed
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def main():
+    cli = argparse.ArgumentParser(description=__doc__)
+    cli.add_argument("--messages", type=int, default=50_000)
+    cli.add_argument("--size", type=int, default=64, help="approx. body size in bytes")
+    cli.add_argument("--batch-size", type=int, default=0, help="for tcp and unix")
+    cli.add_argument("--repeat", type=int, default=3)
+    args = cli.parse_args()
+
+    records = make_records(args.messages, args.size)
+    nbytes = sum(len(r) for r in records)
+    print(f"{args.messages} messages, {nbytes / 1e6:.1f}MB total")
+
+    transports = ["tcp", "unix"]
+    if is_available():
+        transports.append("shm")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for transport in transports:
+            timings = []
+            for idx in range(args.repeat):
+                if transport == "tcp":
+                    address = f"127.0.0.1:{free_port()}"
+                else:
+                    address = str(pathlib.Path(tmpdir, f"{transport}-{idx}.sock"))
+
+                timings.append(
+                    asyncio.run(run(transport, address, records, args.batch_size))
+                )
+
+            best = min(timings)
+            rate = args.messages / best
+            print(f"{transport:>5}: {best * 1000:8.1f}ms  {rate:12,.0f} msg/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,41 +2,111 @@ from __future__ import annotations
 
 import argparse
 import asyncio
+import pathlib
 import subprocess
 import sys
+import typing
+from uuid import uuid4
 
+from .agent import STREAM_THRESHOLD
 from .agent import Agent
+from .agent import FanOut
+from .agent import LazyMessageBody
 from .agent import RPCMessage
+from .agent import aio_copy_lines
 from .agent import logger
 from .agent import parse_rpc_message
+from .buffer import MessageBuffer
+from .capture import CaptureWriter
 from .client import AgentClient
+from .daemon import AgentDaemon
+from .envelope import COMPRESSORS
+from .filters import MessageFilter
+from .filters import setup_filter_args
+from .journal import SpillJournal
+from .journal import default_journal_dir
+from .metrics import Metrics
+from .metrics import dump_on_signal
+from .metrics import start_metrics_server
+from .netsim import LinkConditions
+from .observer import OVERFLOW_POLICIES
+from .observer import ObservationQueue
+from .observer import ObserverThread
+from .policies import Policy
+from .policies import RecordPolicies
 from .server import AgentServer
+from .stalls import StallDetector
+from .stalls import parse_threshold
+
+if typing.TYPE_CHECKING:
+    from typing import BinaryIO
+    from typing import Callable
+
+    from .agent import MessageHandler
+    from .daemon import LaunchRequest
 
 __all__ = [
     "Agent",
     "AgentClient",
     "AgentServer",
+    "FanOut",
+    "LazyMessageBody",
+    "MessageBuffer",
+    "MessageFilter",
+    "ObservationQueue",
     "RPCMessage",
     "logger",
     "parse_rpc_message",
 ]
 
 
-async def forward_stderr(server: asyncio.subprocess.Process):
-    """Forward the server's stderr to the agent's stderr."""
+async def forward_stderr(
+    server: asyncio.subprocess.Process,
+    agent: Agent | None = None,
+    dest: BinaryIO | None = None,
+):
+    """Forward the server's stderr to the agent's stderr, or ``dest`` if given.
+
+    If given, each line is also recorded by the agent.
+    """
     if server.stderr is None:
         return
 
-    # EOF is signalled with an empty bytestring
-    while (line := await server.stderr.readline()) != b"":
-        sys.stderr.buffer.write(line)
+    line_handler = agent.observe_stderr if agent is not None else None
+    await aio_copy_lines(server.stderr, dest or sys.stderr.buffer, line_handler)
 
 
 async def main(args, extra: list[str]):
-    if extra is None:
+    if args.daemon is not None:
+        if extra is not None:
+            print("A server command cannot be given with --daemon", file=sys.stderr)
+            return 1
+
+        if args.record_to is not None:
+            print("--record-to cannot be used with --daemon", file=sys.stderr)
+            return 1
+
+    elif extra is None:
         print("Missing server start command", file=sys.stderr)
         return 1
 
+    if args.observer_thread and args.queue_size > 0:
+        print("--queue-size cannot be used with --observer-thread", file=sys.stderr)
+        return 1
+
+    if args.compression == "auto":
+        compression = list(COMPRESSORS.keys())
+    elif args.compression == "none":
+        compression = []
+    elif args.compression in COMPRESSORS:
+        compression = [args.compression]
+    else:
+        print(f"Compression {args.compression!r} is not available", file=sys.stderr)
+        return 1
+
+    if args.daemon is not None:
+        return await run_daemon(args, compression)
+
     command, *arguments = extra
     server = await asyncio.create_subprocess_exec(
         command,
@@ -45,13 +115,315 @@ async def main(args, extra: list[str]):
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
     )
-    client = AgentClient()
-    agent = Agent(server, sys.stdin.buffer, sys.stdout.buffer, client.forward_message)
+    await run_session(
+        args,
+        compression,
+        server,
+        sys.stdin.buffer,
+        sys.stdout.buffer,
+        sys.stderr.buffer,
+        serve_metrics=True,
+    )
+
+
+async def run_daemon(args, compression: list[str]):
+    """Run a session for each server started with ``lsp_devtools.launch``."""
+
+    async def handle_launch(request: LaunchRequest) -> int:
+        command, *arguments = request.command
+        server = await asyncio.create_subprocess_exec(
+            command,
+            *arguments,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=request.cwd,
+            env=request.env,
+        )
+        session = asyncio.ensure_future(
+            run_session(
+                args,
+                compression,
+                server,
+                request.stdin,
+                request.stdout,
+                request.stderr,
+            )
+        )
+        try:
+            # Unlike awaiting the session directly, this only raises if we are
+            # cancelled, not when the agent cancels its own tasks once the server exits.
+            await asyncio.wait([session])
+        except asyncio.CancelledError:
+            # The launcher has gone away, or the daemon is shutting down.
+            session.cancel()
+            if server.returncode is None:
+                if server.stdin is not None:
+                    server.stdin.close()
+
+                server.terminate()
+                await server.wait()
+
+            await asyncio.wait([session])
+            raise
+
+        if not session.cancelled():
+            # Raise any error in the session.
+            session.result()
+
+        return await server.wait()
+
+    await AgentDaemon(handle_launch).serve(str(args.daemon))
+
+
+async def run_session(
+    args,
+    compression: list[str],
+    server: asyncio.subprocess.Process,
+    stdin: BinaryIO,
+    stdout: BinaryIO,
+    stderr: BinaryIO,
+    serve_metrics: bool = False,
+):
+    """Proxy the given server's messages until it exits.
+
+    Parameters
+    ----------
+    args
+       The agent's command line arguments.
+
+    compression
+       The compression algorithms the client(s) are allowed to use.
+
+    server
+       The server process.
+
+    stdin, stdout, stderr
+       The agent's streams, connected to the client.
+
+    serve_metrics
+       If set, serve the agent's metrics and dump them when the process receives
+       ``SIGUSR1``.
+    """
+    session_id = str(uuid4())
+    capture: CaptureWriter | None = None
+    handlers: list[MessageHandler] = []
+
+    if args.record_to is not None:
+        capture = CaptureWriter(args.record_to, session_id)
+        handlers.append(capture.write)
+
+    destinations = args.connect or []
+    if len(destinations) == 0 and capture is None:
+        destinations = [args.socket or f"{args.host}:{args.port}"]
+
+    clients: dict[str, AgentClient] = {}
+    for idx, address in enumerate(destinations):
+        journal = None
+        if args.spill is not None:
+            suffix = f"-{idx}" if idx > 0 else ""
+            journal = SpillJournal(
+                args.spill / f"{session_id}{suffix}.journal",
+                max_bytes=args.spill_max_bytes,
+            )
+
+        client = AgentClient(
+            session_id=session_id,
+            batch_size=args.batch_size,
+            batch_delay=args.batch_delay,
+            compression=compression,
+            buffer=MessageBuffer(
+                max_messages=args.buffer_size, max_bytes=args.buffer_bytes
+            ),
+            journal=journal,
+            shared_memory=args.shared_memory,
+            write_buffer_limit=args.write_buffer_limit,
+        )
+        clients[str(address)] = client
+        handlers.append(client.forward_message)
+
+    handler = handlers[0] if len(handlers) == 1 else FanOut(handlers)
+
+    observer = None
+    if args.observer_thread:
+        observer = ObserverThread()
+        observer.start()
+
+    queue = None
+    if args.queue_size > 0:
+        queue = ObservationQueue(maxsize=args.queue_size, overflow=args.overflow)
+
+    stalls = None
+    if len(args.stall_thresholds) > 0:
+        stalls = StallDetector(dict(args.stall_thresholds))
+
+    message_filter: MessageFilter | None = MessageFilter.from_args(args)
+    if message_filter is not None and message_filter.is_empty:
+        message_filter = None
+
+    agent = Agent(
+        server,
+        stdin,
+        stdout,
+        handler,
+        queue=queue,
+        message_filter=message_filter,
+        session_id=session_id,
+        network=network_conditions(args),
+        max_record_size=args.max_record_size,
+        stream_threshold=args.stream_threshold,
+        policies=RecordPolicies(args.policies) if args.policies else None,
+        observer=observer,
+        stalls=stalls,
+    )
+
+    if len(clients) > 0:
+        add_client_metrics(agent.metrics, clients)
+
+    if capture is not None:
+        add_capture_metrics(agent.metrics, capture)
+
+    metrics_server = None
+    if serve_metrics:
+        dump_on_signal(agent.metrics)
 
-    await asyncio.gather(
-        client.start_tcp(args.host, args.port),
+        if args.metrics:
+            metrics_server = await start_metrics_server(agent.metrics, args.metrics)
+
+    tasks = [
         agent.start(),
-        forward_stderr(server),
+        forward_stderr(server, agent if args.capture_stderr else None, stderr),
+    ]
+    for address, client in clients.items():
+        host, sep, port = address.rpartition(":")
+        if sep and port.isdigit():
+            start = client.start_tcp(host or "localhost", int(port))
+        else:
+            start = client.start_unix(address)
+
+        # The clients are used by the handler, so must live on the observer's loop.
+        tasks.insert(0, start if observer is None else observer.run(start))
+
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        if metrics_server is not None:
+            metrics_server.close()
+
+        for client in clients.values():
+            if observer is None:
+                await stop_client(client)
+            else:
+                await observer.run(stop_client(client))
+
+        if observer is not None:
+            await observer.stop()
+
+        if capture is not None:
+            capture.close()
+
+
+async def stop_client(client: AgentClient):
+    """Send any remaining messages and disconnect the given client."""
+    client.flush()
+    if client.protocol.writer is not None:
+        client.protocol.writer.close()
+
+    await client.stop()
+
+
+def network_conditions(args) -> dict[str, LinkConditions]:
+    """Return the network conditions to simulate for each source of messages."""
+    return {
+        source: LinkConditions(
+            latency=args.latency[idx] / 1000,
+            jitter=args.jitter[idx] / 1000,
+            bandwidth=args.bandwidth[idx],
+            notifications_only=args.delay_notifications_only,
+        )
+        for idx, source in enumerate(["client", "server"])
+    }
+
+
+def per_direction(value: str) -> tuple[float, float]:
+    """Parse a value given either for both directions, or as ``CLIENT,SERVER``."""
+    client, sep, server = value.partition(",")
+    try:
+        result = (float(client), float(server if sep else client))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"expected NUMBER or NUMBER,NUMBER, got {value!r}"
+        ) from None
+
+    if min(result) < 0:
+        raise argparse.ArgumentTypeError(
+            f"expected a non-negative number, got {value!r}"
+        )
+
+    return result
+
+
+def record_policy(value: str) -> Policy:
+    """Parse a policy given as ``METHOD:PATH=ACTION``."""
+    try:
+        return Policy.parse(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc)) from None
+
+
+def stall_threshold(value: str) -> tuple[str, float]:
+    """Parse a stall threshold given as ``METHOD=SECONDS`` or ``SECONDS``."""
+    try:
+        return parse_threshold(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc)) from None
+
+
+def add_client_metrics(metrics: Metrics, clients: dict[str, AgentClient]):
+    """Add metrics describing the state of the given clients, indexed by the address
+    of the agent server they send messages to."""
+
+    def gauge(name: str, help_: str, get_value: Callable[[AgentClient], float]):
+        metrics.gauge(
+            name,
+            help_,
+            lambda: {address: get_value(c) for address, c in clients.items()},
+            label="destination",
+        )
+
+    gauge(
+        "client_buffer",
+        "Messages waiting to be sent to the agent server",
+        lambda c: c.buffered,
+    )
+    gauge(
+        "client_buffer_dropped",
+        "Messages discarded while waiting to be sent to the agent server",
+        lambda c: c.dropped,
+    )
+    gauge(
+        "client_tasks",
+        "Writes to the agent server yet to complete",
+        lambda c: c.pending_tasks,
+    )
+    gauge(
+        "client_journal_bytes",
+        "Size of the journal waiting to be sent to the agent server",
+        lambda c: c.journal_bytes,
+    )
+
+
+def add_capture_metrics(metrics: Metrics, capture: CaptureWriter):
+    """Add metrics describing the state of the given capture writer."""
+    metrics.gauge(
+        "capture_queue",
+        "Messages waiting to be written to the capture file",
+        capture.qsize,
+    )
+    metrics.gauge(
+        "capture_bytes",
+        "Bytes written to the capture file",
+        lambda: capture.nbytes,
     )
 
 
@@ -111,5 +483,267 @@ majority of the lsp-devtools suite of tools.
         help="the port to connect to",
         default=8765,
     )
+    cmd.add_argument(
+        "--socket",
+        type=pathlib.Path,
+        default=None,
+        metavar="PATH",
+        help="connect to the Unix domain socket at PATH, instead of a TCP port.",
+    )
+    cmd.add_argument(
+        "--daemon",
+        type=pathlib.Path,
+        default=None,
+        metavar="PATH",
+        help=(
+            "instead of wrapping a single server, listen on the Unix socket at PATH "
+            "and proxy every server started with "
+            "'python -m lsp_devtools.launch --socket PATH -- <command>'"
+        ),
+    )
+    cmd.add_argument(
+        "--connect",
+        action="append",
+        default=None,
+        metavar="ADDRESS",
+        help=(
+            "send messages to the agent server at ADDRESS, either HOST:PORT or the "
+            "path to a Unix socket. Can be given multiple times to send messages to "
+            "several servers at once, overrides --host, --port and --socket"
+        ),
+    )
+    cmd.add_argument(
+        "--write-buffer-limit",
+        type=int,
+        default=1024 * 1024,
+        metavar="BYTES",
+        help=(
+            "once this many bytes are waiting to be sent to an agent server, hold "
+            "further messages in its buffer until it catches up (0 to disable)"
+        ),
+    )
+    cmd.add_argument(
+        "--shared-memory",
+        action="store_true",
+        help=(
+            "when connected over a Unix socket, send messages through shared memory "
+            "rather than the socket itself (if the agent server supports it)"
+        ),
+    )
+    cmd.add_argument(
+        "--record-to",
+        type=pathlib.Path,
+        default=None,
+        metavar="FILE",
+        help=(
+            "write messages directly to FILE, rather than sending them to an agent "
+            "server (unless --connect is also given). Use "
+            "'lsp-devtools record --from-capture FILE' to view them"
+        ),
+    )
+    cmd.add_argument(
+        "--capture-stderr",
+        action="store_true",
+        help=(
+            "record each line the server writes to stderr, as a "
+            "'$/lsp-devtools/stderr' notification alongside its messages"
+        ),
+    )
+    cmd.add_argument(
+        "--max-record-size",
+        type=int,
+        default=None,
+        metavar="BYTES",
+        help=(
+            "record messages with a body larger than BYTES as a truncated preview, "
+            "along with their length and SHA-256 hash. Messages are always forwarded "
+            "in full"
+        ),
+    )
+    cmd.add_argument(
+        "--policy",
+        action="append",
+        type=record_policy,
+        default=[],
+        dest="policies",
+        metavar="METHOD:PATH=ACTION",
+        help=(
+            "reduce the size of recorded messages for METHOD ('*' for all methods) by "
+            "applying ACTION (drop, hash or truncate:N) to the value at PATH, e.g. "
+            "'textDocument/didOpen:params.textDocument.text=hash'. PATH starts from "
+            "params, result or error and may contain '*' to match every item. Can be "
+            "given multiple times"
+        ),
+    )
+    cmd.add_argument(
+        "--stall-threshold",
+        action="append",
+        type=stall_threshold,
+        default=[],
+        dest="stall_thresholds",
+        metavar="[METHOD=]SECONDS",
+        help=(
+            "report requests for METHOD ('*' or omitted for all methods) left "
+            "unanswered for longer than SECONDS, with a warning on stderr and a "
+            "'$/lsp-devtools/stall' notification alongside its messages. Can be given "
+            "multiple times"
+        ),
+    )
+    cmd.add_argument(
+        "--stream-threshold",
+        type=int,
+        default=STREAM_THRESHOLD,
+        metavar="BYTES",
+        help=(
+            "forward messages larger than BYTES in pieces as they arrive, rather than "
+            "waiting for the complete message (0 to disable)"
+        ),
+    )
+    cmd.add_argument(
+        "--queue-size",
+        type=int,
+        default=0,
+        metavar="N",
+        help=(
+            "if set, forward messages to the server without waiting for them to be "
+            "recorded, buffering up to N messages in a queue"
+        ),
+    )
+    cmd.add_argument(
+        "--observer-thread",
+        action="store_true",
+        help=(
+            "prepare and send messages to be recorded on a dedicated thread, so that "
+            "the work never delays the forwarding of messages. If the thread falls "
+            "behind, the oldest messages are discarded"
+        ),
+    )
+    cmd.add_argument(
+        "--overflow",
+        choices=OVERFLOW_POLICIES,
+        default="block",
+        help=(
+            "what to do when the queue is full: wait for space (block), discard the "
+            "oldest message (drop-oldest) or discard notifications (drop-notifications)"
+        ),
+    )
+
+    cmd.add_argument(
+        "--buffer-size",
+        type=int,
+        default=4096,
+        metavar="N",
+        help=(
+            "the maximum number of messages to hold while waiting to connect to the "
+            "agent server, once full the oldest messages are discarded"
+        ),
+    )
+    cmd.add_argument(
+        "--buffer-bytes",
+        type=int,
+        default=32 * 1024 * 1024,
+        metavar="BYTES",
+        help="the maximum size of the messages to hold while waiting to connect",
+    )
+    cmd.add_argument(
+        "--spill",
+        nargs="?",
+        type=pathlib.Path,
+        const=default_journal_dir(),
+        default=None,
+        metavar="DIR",
+        help=(
+            "while waiting to connect to the agent server, write messages to a "
+            "journal file in DIR rather than holding them in memory. The journal is "
+            f"replayed once connected. (default DIR: {default_journal_dir()})"
+        ),
+    )
+    cmd.add_argument(
+        "--spill-max-bytes",
+        type=int,
+        default=1024 * 1024 * 1024,
+        metavar="BYTES",
+        help="the maximum size of the journal, further messages are discarded",
+    )
+    cmd.add_argument(
+        "--batch-size",
+        type=int,
+        default=0,
+        metavar="BYTES",
+        help=(
+            "if set, send messages to the server in batches of up to BYTES bytes "
+            "(if the server supports it)"
+        ),
+    )
+    cmd.add_argument(
+        "--batch-delay",
+        type=float,
+        default=0.05,
+        metavar="SECONDS",
+        help="the maximum time to wait before sending an incomplete batch",
+    )
+    cmd.add_argument(
+        "--compression",
+        choices=["auto", "none", "zlib", "zstd"],
+        default="auto",
+        help="how to compress batches, zstd requires the 'zstandard' package",
+    )
+
+    cmd.add_argument(
+        "--metrics",
+        metavar="ADDRESS",
+        help=(
+            "serve metrics on the agent's behavior in the Prometheus text format, "
+            "ADDRESS is either the path to a Unix socket or HOST:PORT. Metrics are "
+            "also written to stderr when the agent receives SIGUSR1"
+        ),
+    )
+
+    network = cmd.add_argument_group(
+        title="network simulation",
+        description=(
+            "simulate a slow network link between the client and server. Each option\n"
+            "takes either a single value for both directions, or CLIENT,SERVER to\n"
+            "configure the messages sent by the client and server separately"
+        ),
+    )
+    network.add_argument(
+        "--latency",
+        type=per_direction,
+        default=(0, 0),
+        metavar="MS",
+        help="delay every message by this many milliseconds",
+    )
+    network.add_argument(
+        "--jitter",
+        type=per_direction,
+        default=(0, 0),
+        metavar="MS",
+        help="delay every message by up to this many additional milliseconds",
+    )
+    network.add_argument(
+        "--bandwidth",
+        type=per_direction,
+        default=(0, 0),
+        metavar="BYTES",
+        help="limit the link to this many bytes per second",
+    )
+    network.add_argument(
+        "--delay-notifications-only",
+        action="store_true",
+        help=(
+            "only delay notifications, other messages are still never delivered ahead "
+            "of the notifications sent before them"
+        ),
+    )
+
+    setup_filter_args(
+        cmd,
+        description=(
+            "select which messages are sent to the agent server, multiple options\n"
+            "will be ANDed together. All messages are still forwarded between the\n"
+            "client and server"
+        ),
+    )
 
     cmd.set_defaults(run=run_agent)
@@ -2,32 +2,72 @@ from __future__ import annotations
 
 import asyncio
 import inspect
-import json
 import logging
-import re
 import sys
+import time
 import typing
-from datetime import datetime
-from datetime import timezone
+from collections.abc import Mapping
 from functools import partial
 from uuid import uuid4
 
 import attrs
 
+from lsp_devtools import codec
+
+from .framing import FrameDecoder
+from .metadata import pack_record
+from .metrics import Metrics
+from .netsim import SimulatedLink
+from .observer import Observation
+from .observer import ObservationQueue
+from .scan import ROUTING_KEYS
+from .scan import RoutingFields
+from .scan import body_offset
+from .scan import scan_routing_fields
+from .stalls import STALL
+from .truncate import MessageTee
+from .truncate import truncate_message
+
 if typing.TYPE_CHECKING:
+    from collections.abc import Awaitable
     from collections.abc import Coroutine
+    from collections.abc import Iterator
+    from collections.abc import Sequence
     from typing import Any
     from typing import BinaryIO
     from typing import Callable
     from typing import Union
 
-    from pygls.io_ import AsyncReader
+    from .filters import MessageFilter
+    from .framing import FramePiece
+    from .netsim import LinkConditions
+    from .observer import ObserverThread
+    from .policies import RecordPolicies
+    from .stalls import PendingRequest
+    from .stalls import StallDetector
 
     MessageHandler = Callable[[bytes], Union[None, Coroutine[Any, Any, None]]]
+    LineHandler = Callable[[bytes], Union[None, Coroutine[Any, Any, None]]]
+    BurstHandler = Callable[[list[bytes]], Coroutine[Any, Any, None]]
+    PieceHandler = Callable[[FramePiece], Coroutine[Any, Any, None]]
 
-UTC = timezone.utc
 logger = logging.getLogger("lsp_devtools.agent")
 
+READ_CHUNK_SIZE = 64 * 1024
+"""The maximum number of bytes to request from a stream in a single read."""
+
+MAX_BURST_SIZE = 256 * 1024
+"""The maximum number of bytes of messages forwarded in a single write."""
+
+STREAM_THRESHOLD = 1024 * 1024
+"""Messages larger than this (in bytes) are forwarded in pieces as they arrive."""
+
+MAX_LINE_LENGTH = 64 * 1024
+"""Lines longer than this (in bytes) are split when passed to a line handler."""
+
+STDERR = "$/lsp-devtools/stderr"
+"""The method name of the notifications used to record the server's stderr."""
+
 
 @attrs.define
 class RPCMessage:
@@ -35,100 +75,326 @@ class RPCMessage:
 
     headers: dict[str, str]
 
-    body: dict[str, Any]
+    body: Mapping[str, Any]
 
     def __getitem__(self, key: str):
         return self.headers[key]
 
 
-def parse_rpc_message(data: bytes) -> RPCMessage:
-    """Parse a JSON-RPC message from the given set of bytes."""
+class LazyMessageBody(Mapping):
+    """The body of a JSON-RPC message, only decoded when necessary.
 
-    headers: dict[str, str] = {}
-    body: dict[str, Any] | None = None
-    headers_complete = False
+    The routing fields of the message (its top-level keys and the values of the
+    ``id`` and ``method`` fields) are found with a fast scan of the raw data, all other
+    fields require the full message to be decoded.
+    """
 
-    for line in data.split(b"\r\n"):
-        if line == b"":
-            if "Content-Length" not in headers:
-                raise ValueError("Missing 'Content-Length' header")
+    __slots__ = ("_body", "_data", "_fields", "_start")
 
-            headers_complete = True
-            continue
+    def __init__(self, data: bytes, start: int = 0):
+        self._data = data
+        self._start = start
+        self._fields: RoutingFields | None = None
+        self._body: dict[str, Any] | None = None
 
-        if headers_complete:
-            length = int(headers["Content-Length"])
-            if len(line) != length:
-                raise ValueError("Incorrect 'Content-Length'")
+    def __repr__(self) -> str:
+        state = "decoded" if self._body is not None else "pending"
+        return f"LazyMessageBody(id={self.id!r}, method={self.method!r}, {state})"
 
-            body = json.loads(line)
-            continue
+    @property
+    def fields(self) -> RoutingFields:
+        """The message's routing fields."""
+        if self._fields is None:
+            try:
+                self._fields = scan_routing_fields(self._data, self._start)
+            except ValueError:
+                # Fallback to decoding the entire message.
+                body = self.decode()
+                self._fields = RoutingFields(
+                    set(body.keys()), body.get("id"), body.get("method")
+                )
+
+        return self._fields
+
+    @property
+    def id(self) -> int | str | None:
+        return self.fields.id
+
+    @property
+    def method(self) -> str | None:
+        return self.fields.method
+
+    @property
+    def message_type(self) -> str:
+        return self.fields.message_type
+
+    def decode(self) -> dict[str, Any]:
+        """Return the fully decoded message."""
+        if self._body is None:
+            body = codec.loads(self._data[self._start :])
+            if not isinstance(body, dict):
+                raise ValueError(f"Expected a JSON object, got: {type(body)}")
+
+            self._body = body
+
+        return self._body
+
+    def __getitem__(self, key: str) -> Any:
+        if self._body is None and key in ROUTING_KEYS:
+            if key not in self.fields.keys:
+                raise KeyError(key)
 
-        if (idx := line.find(b":")) < 0:
+            return getattr(self.fields, key)
+
+        return self.decode()[key]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.fields.keys
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.decode())
+
+    def __len__(self) -> int:
+        return len(self.fields.keys)
+
+    def __bool__(self) -> bool:
+        # A valid JSON-RPC message is never empty, this also means that checking the
+        # truthiness of the body (as done by the logging framework) does not cause it
+        # to be decoded.
+        return True
+
+
+def parse_rpc_message(data: bytes, lazy: bool = False) -> RPCMessage:
+    """Parse a JSON-RPC message from the given set of bytes.
+
+    Parameters
+    ----------
+    data
+       The message to parse, including headers.
+
+    lazy
+       If ``True``, the body of the message is returned as a :class:`LazyMessageBody`
+       which is only decoded when required.
+    """
+    if (idx := data.find(b"\r\n\r\n")) < 0:
+        raise ValueError("Missing message body")
+
+    headers: dict[str, str] = {}
+    for line in data[:idx].split(b"\r\n"):
+        if (sep := line.find(b":")) < 0:
             raise ValueError(f"Invalid header: {line!r}")
 
-        name, value = line[:idx], line[idx + 1 :]
+        name, value = line[:sep], line[sep + 1 :]
         headers[name.decode("utf8").strip()] = value.decode("utf8").strip()
 
-    if body is None:
+    if "Content-Length" not in headers:
+        raise ValueError("Missing 'Content-Length' header")
+
+    start = idx + 4
+    length = int(headers["Content-Length"])
+    if length == 0:
         raise ValueError("Missing message body")
 
-    return RPCMessage(headers, body)
+    if len(data) - start != length:
+        raise ValueError("Incorrect 'Content-Length'")
+
+    body: Mapping[str, Any]
+    if lazy:
+        body = LazyMessageBody(data, start)
+    else:
+        body = codec.loads(data[start:])
 
+    return RPCMessage(headers, body)
 
-async def aio_readline(reader: AsyncReader, message_handler: MessageHandler):
-    CONTENT_LENGTH_PATTERN = re.compile(rb"^Content-Length: (\d+)\r\n$")
 
-    # Initialize message buffer
-    message = []
-    content_length = 0
+async def aio_readline(reader: asyncio.StreamReader, message_handler: MessageHandler):
+    """Read ``Content-Length`` framed messages from the given reader, passing each
+    complete message (headers and body) to the given handler."""
+    decoder = FrameDecoder()
 
     while True:
-        # Read a header line
-        header = await reader.readline()
-        if not header:
+        data = await reader.read(READ_CHUNK_SIZE)
+        if not data:
             break
-        message.append(header)
-
-        # Extract content length if possible
-        if not content_length:
-            match = CONTENT_LENGTH_PATTERN.fullmatch(header)
-            if match:
-                content_length = int(match.group(1))
-
-        # Check if all headers have been read (as indicated by an empty line \r\n)
-        if content_length and not header.strip():
-            # Read body
-            body = await reader.readexactly(content_length)
-            if not body:
+
+        decoder.feed(data)
+
+        while True:
+            try:
+                frame = decoder.next_frame()
+            except ValueError:
+                logger.warning("Skipping invalid message", exc_info=True)
+                continue
+
+            if frame is None:
                 break
-            message.append(body)
 
             # Pass message to protocol, optionally async
-            result = message_handler(b"".join(message))
+            result = message_handler(frame)
             if inspect.isawaitable(result):
                 await result
 
-            # Reset the buffer
-            message = []
-            content_length = 0
+
+async def aio_read_bursts(
+    reader: asyncio.StreamReader,
+    burst_handler: BurstHandler,
+    max_burst_size: int = MAX_BURST_SIZE,
+    piece_handler: PieceHandler | None = None,
+    stream_threshold: int = STREAM_THRESHOLD,
+):
+    """Read ``Content-Length`` framed messages from the given reader, passing them to
+    the given handler in bursts.
+
+    A burst is made up of the complete messages available after each read, up to
+    ``max_burst_size`` bytes. Since the handler is never made to wait for more data, a
+    message is never delayed by being part of a burst.
+
+    If ``piece_handler`` is given, messages larger than ``stream_threshold`` bytes are
+    passed to it in pieces as they arrive, rather than being held until complete.
+    """
+    decoder = FrameDecoder(stream_threshold if piece_handler is not None else 0)
+
+    while (data := await reader.read(READ_CHUNK_SIZE)) != b"":
+        decoder.feed(data)
+        burst: list[bytes] = []
+        size = 0
+
+        while True:
+            try:
+                frame = decoder.next_frame()
+            except ValueError:
+                logger.warning("Skipping invalid message", exc_info=True)
+                continue
+
+            if frame is None:
+                if piece_handler is None or (piece := decoder.next_piece()) is None:
+                    break
+
+                if len(burst) > 0:
+                    await burst_handler(burst)
+                    burst, size = [], 0
+
+                await piece_handler(piece)
+                continue
+
+            burst.append(frame)
+            size += len(frame)
+            if size >= max_burst_size:
+                await burst_handler(burst)
+                burst, size = [], 0
+
+        if len(burst) > 0:
+            await burst_handler(burst)
+
+
+async def aio_copy_lines(
+    reader: asyncio.StreamReader,
+    dest: BinaryIO,
+    line_handler: LineHandler | None = None,
+    max_length: int = MAX_LINE_LENGTH,
+):
+    """Copy everything from the given reader to ``dest`` as it arrives.
+
+    Writes to ``dest`` happen on a worker thread, so that a slow consumer only holds
+    up this copy rather than the entire event loop. ``dest`` is not switched to
+    non-blocking mode, since it is usually the agent's own stderr.
+
+    If given, each line is also passed to ``line_handler`` (without its line ending),
+    lines longer than ``max_length`` bytes are passed on in pieces.
+    """
+    loop = asyncio.get_running_loop()
+    pending = bytearray()
+
+    while (data := await reader.read(READ_CHUNK_SIZE)) != b"":
+        write = loop.run_in_executor(None, _write_and_flush, dest, data)
+
+        if line_handler is None:
+            await write
+            continue
+
+        pending += data
+        lines: list[bytes] = []
+
+        start = 0
+        while (end := pending.find(b"\n", start)) >= 0:
+            line = bytes(pending[start:end]).rstrip(b"\r")
+            lines.extend(
+                line[i : i + max_length] for i in range(0, len(line), max_length)
+            )
+            start = end + 1
+
+        del pending[:start]
+        while len(pending) >= max_length:
+            lines.append(bytes(pending[:max_length]))
+            del pending[:max_length]
+
+        for line in lines:
+            if inspect.isawaitable(result := line_handler(line)):
+                await result
+
+        # Don't read any more until the consumer has caught up.
+        await write
+
+    if line_handler is not None and len(pending) > 0:
+        if inspect.isawaitable(result := line_handler(bytes(pending))):
+            await result
+
+
+def _write_and_flush(dest: BinaryIO, data: bytes):
+    dest.write(data)
+    dest.flush()
 
 
 async def get_streams(
     stdin, stdout
-) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
-    """Convert blocking stdin/stdout streams into async streams."""
+) -> tuple[asyncio.StreamReader, asyncio.StreamWriter, asyncio.ReadTransport]:
+    """Convert blocking stdin/stdout streams into async streams.
+
+    The transport reading from stdin is also returned, so that it can be closed.
+    """
     loop = asyncio.get_running_loop()
 
     reader = asyncio.StreamReader()
     read_protocol = asyncio.StreamReaderProtocol(reader)
-    await loop.connect_read_pipe(lambda: read_protocol, stdin)
+    read_transport, _ = await loop.connect_read_pipe(lambda: read_protocol, stdin)
 
     write_transport, write_protocol = await loop.connect_write_pipe(
         asyncio.streams.FlowControlMixin, stdout
     )
     writer = asyncio.StreamWriter(write_transport, write_protocol, reader, loop)
-    return reader, writer
+    return reader, writer, read_transport
+
+
+def make_notification(method: str, params: Any) -> bytes:
+    """Return a (framed) notification with the given method and params."""
+    body = codec.dumps({"jsonrpc": "2.0", "method": method, "params": params})
+    data = body.encode("utf8")
+    return b"Content-Length: %d\r\n\r\n%s" % (len(data), data)
+
+
+class FanOut:
+    """A message handler that passes each record onto multiple handlers.
+
+    The record is only serialised once, each handler is responsible for applying its own
+    backpressure (e.g. an ``AgentClient`` buffers messages while its server catches up).
+    """
+
+    def __init__(self, handlers: list[MessageHandler]):
+        self.handlers = handlers
+
+    def __call__(self, record: bytes) -> Coroutine[Any, Any, None] | None:
+        pending = []
+        for handler in self.handlers:
+            if inspect.iscoroutine(res := handler(record)):
+                pending.append(res)
+
+        if len(pending) == 0:
+            return None
+
+        return self._gather(pending)
+
+    async def _gather(self, pending: Sequence[Awaitable[Any]]):
+        await asyncio.gather(*pending)
 
 
 class Agent:
@@ -141,20 +407,162 @@ class Agent:
         stdin: BinaryIO,
         stdout: BinaryIO,
         handler: MessageHandler,
+        queue: ObservationQueue | None = None,
+        message_filter: MessageFilter | None = None,
+        session_id: str | None = None,
+        network: Mapping[str, LinkConditions] | None = None,
+        max_burst_size: int = MAX_BURST_SIZE,
+        max_record_size: int | None = None,
+        stream_threshold: int = STREAM_THRESHOLD,
+        policies: RecordPolicies | None = None,
+        observer: ObserverThread | None = None,
+        stalls: StallDetector | None = None,
     ):
         self.stdin = stdin
         self.stdout = stdout
         self.server = server
         self.handler = handler
-        self.session_id = str(uuid4())
+        self.session_id = session_id or str(uuid4())
+
+        self.queue = queue
+        """If set, observed messages are prepared and passed to the handler via this
+        queue, by a separate task, rather than inline with the forwarding of
+        messages."""
+
+        self.observer = observer
+        """If set, messages are prepared and passed to the handler on this dedicated
+        thread, the agent's own loop only forwards them."""
+        if observer is not None:
+            observer.handler = self._observe_in_thread
+
+        self.message_filter = message_filter
+        """If set, only messages accepted by the filter are passed to the handler."""
+
+        self.max_burst_size = max_burst_size
+        """The maximum number of bytes of messages to forward in a single write, ``0``
+        to forward each message individually."""
+
+        self.max_record_size = max_record_size
+        """If set, messages with bodies larger than this (in bytes) are recorded as a
+        truncated preview, along with their length and hash."""
+
+        self.stream_threshold = stream_threshold
+        """Messages larger than this (in bytes) are forwarded in pieces as they arrive,
+        ``0`` to always wait for the complete message."""
+
+        self.policies = policies
+        """If set, applied to each message before it is recorded."""
+
+        self.stalls = stalls
+        """If set, used to report requests that go unanswered for too long."""
+
+        self._stall_timer: asyncio.TimerHandle | None = None
+        self._stall_deadline = 0
+        """When the stall timer is due, in nanoseconds since the epoch."""
+
+        self._streams: dict[str, MessageTee] = {}
+        """The message currently being forwarded in pieces, indexed by source."""
+
+        self.links = {
+            source: SimulatedLink(conditions)
+            for source, conditions in (network or {}).items()
+            if not conditions.is_empty
+        }
+        """Simulated network links, delaying the messages sent by each source."""
+
+        self._clock_anchor = (time.time_ns(), time.perf_counter_ns())
+        """The wall clock and monotonic time at the start of the session."""
+
+        self._pending: dict[tuple[str, int | str], int] = {}
+        """When each in-flight request was seen, indexed by source and id."""
+
+        self.metrics = Metrics()
+        """Metrics describing the agent's own behavior."""
+
+        self._messages = self.metrics.counter(
+            "messages_total", "Messages forwarded, by source", label="source"
+        )
+        self._bytes = self.metrics.counter(
+            "bytes_total", "Bytes forwarded, by source", label="source"
+        )
+        self._drain_time = self.metrics.histogram(
+            "drain_seconds",
+            "Time spent waiting for the destination to accept messages, by source",
+            label="source",
+        )
+        self._truncated = self.metrics.counter(
+            "truncated_total",
+            "Messages recorded truncated, due to their size, by source",
+            label="source",
+        )
+        self._policy_bytes = self.metrics.counter(
+            "policy_saved_bytes_total",
+            "Bytes removed from recorded messages by policies, by source",
+            label="source",
+        )
+        self._stalled = self.metrics.counter(
+            "stalled_requests_total",
+            "Requests that exceeded their stall threshold, by method",
+            label="method",
+        )
+        self._stderr_lines = self.metrics.counter(
+            "stderr_lines_total", "Lines of stderr recorded"
+        )
+        self.metrics.gauge(
+            "requests_in_flight",
+            "Requests waiting for a response",
+            lambda: len(self._pending),
+        )
+        self.metrics.gauge(
+            "tasks", "Handler tasks yet to complete", lambda: len(self._tasks)
+        )
+
+        for source, link in self.links.items():
+            self.metrics.gauge(
+                f"{source}_link_pending",
+                f"Messages from the {source} waiting on the simulated network link",
+                link.__len__,
+            )
+
+        if stalls is not None:
+            self.metrics.gauge(
+                "requests_stalled",
+                "Stalled requests still waiting for a response",
+                lambda: stalls.stalled,
+            )
+
+        if observer is not None:
+            self.metrics.gauge(
+                "observer_pending",
+                "Messages waiting to be observed by the observer thread",
+                observer.__len__,
+            )
+            self.metrics.gauge(
+                "observer_dropped",
+                "Messages dropped due to the observer thread falling behind",
+                lambda: observer.dropped,
+            )
+
+        if queue is not None:
+            self.metrics.gauge(
+                "queue_depth", "Messages waiting to be observed", lambda: len(queue)
+            )
+            self.metrics.gauge(
+                "queue_dropped",
+                "Messages dropped due to a full queue",
+                lambda: queue.dropped,
+            )
 
         self._tasks: set[asyncio.Task] = set()
         self.reader: asyncio.StreamReader | None = None
         self.writer: asyncio.StreamWriter | None = None
+        self._read_transport: asyncio.ReadTransport | None = None
 
     async def start(self):
         # Get async versions of stdin/stdout
-        self.reader, self.writer = await get_streams(self.stdin, self.stdout)
+        self.reader, self.writer, self._read_transport = await get_streams(
+            self.stdin, self.stdout
+        )
 
         # Keep mypy happy
         if self.server.stdin is None or self.server.stdout is None:
@@ -162,22 +570,32 @@ class Agent:
 
         # Connect stdin to the subprocess' stdin
         client_to_server = asyncio.create_task(
-            aio_readline(
+            aio_read_bursts(
                 self.reader,
-                partial(self.forward_message, "client", self.server.stdin),
+                partial(self.forward_messages, "client", self.server.stdin),
+                self.max_burst_size,
+                partial(self.forward_piece, "client", self.server.stdin),
+                self.stream_threshold,
             ),
         )
         self._tasks.add(client_to_server)
 
         # Connect the subprocess' stdout to stdout
         server_to_client = asyncio.create_task(
-            aio_readline(
+            aio_read_bursts(
                 self.server.stdout,
-                partial(self.forward_message, "server", self.writer),
+                partial(self.forward_messages, "server", self.writer),
+                self.max_burst_size,
+                partial(self.forward_piece, "server", self.writer),
+                self.stream_threshold,
             ),
         )
         self._tasks.add(server_to_client)
 
+        if self.queue is not None:
+            observer = asyncio.create_task(self._process_queue(self.queue))
+            self._tasks.add(observer)
+
         # Run both connections concurrently.
         await asyncio.gather(
             client_to_server,
@@ -189,26 +607,361 @@ class Agent:
         self, source: str, dest: asyncio.StreamWriter, message: bytes
     ):
         """Forward the given message to the destination channel"""
+        await self.forward_messages(source, dest, [message])
+
+    async def forward_messages(
+        self, source: str, dest: asyncio.StreamWriter, messages: list[bytes]
+    ):
+        """Forward the given messages to the destination channel, with a single write
+        and waiting for the destination to accept them once."""
+
+        # Forward the messages as-is to the client/server
+        if (link := self.links.get(source)) is not None:
+            for message in messages:
+                link.send(dest, message)
+        elif len(messages) == 1:
+            dest.write(messages[0])
+        else:
+            dest.writelines(messages)
+
+        items = []
+        for message in messages:
+            self._messages.inc(1, source)
+            self._bytes.inc(len(message), source)
+
+            item = Observation(source, self.now(), message)
+            if self.observer is not None or self.queue is not None:
+                items.append(item)
+            elif (prepared := self.prepare_observation(item)) is not None:
+                items.append(prepared)
+
+        await self._observe_and_drain(source, dest, items)
+
+    async def forward_piece(
+        self, source: str, dest: asyncio.StreamWriter, piece: FramePiece
+    ):
+        """Forward part of a large message to the destination channel.
+
+        Each piece is forwarded as soon as it arrives, only the parts of the message
+        needed to record it are kept until the final piece is seen.
+        """
+        if piece.is_first:
+            self._streams[source] = MessageTee(self.now(), self.max_record_size)
+
+        if (link := self.links.get(source)) is not None:
+            link.send(dest, piece.data)
+        else:
+            dest.write(piece.data)
+
+        tee = self._streams[source]
+        tee.add(piece)
+        self._bytes.inc(len(piece.data), source)
+
+        if not piece.is_last:
+            await self._drain(source, dest)
+            return
+
+        del self._streams[source]
+        self._messages.inc(1, source)
+        if tee.is_truncated:
+            self._truncated.inc(1, source)
+
+        items = []
+        item = Observation(
+            source, tee.timestamp, tee.message(), truncated=tee.is_truncated
+        )
+        if self.observer is not None or self.queue is not None:
+            items.append(item)
+        elif (prepared := self.prepare_observation(item)) is not None:
+            items.append(prepared)
+
+        await self._observe_and_drain(source, dest, items)
+
+    def prepare_observation(self, item: Observation) -> Observation | None:
+        """Prepare the given message to be recorded.
+
+        Measures the time taken to respond to requests, applies the agent's policies
+        and record size limit, returning ``None`` if the message should not be
+        observed at all.
+
+        Since policies never change a message's routing fields, the filter is applied
+        first so that messages that will not be recorded are never decoded.
+        """
+        source = item.source
+        item.latency = self.measure_latency(source, item.message, item.timestamp)
+
+        if not self.should_observe(source, item.message):
+            if self.policies is not None:
+                self.policies.track(source, item.message)
+
+            return None
+
+        record = self.apply_policies(source, item.message)
+
+        if not item.truncated:
+            record = self.limit_record_size(source, record)
+
+        item.message = record
+        return item
+
+    def apply_policies(self, source: str, message: bytes) -> bytes:
+        """Return the message to record for the given message, with any of the agent's
+        policies applied."""
+        if self.policies is None:
+            return message
+
+        record = self.policies.apply(source, message)
+        if record is not message:
+            self._policy_bytes.inc(len(message) - len(record), source)
+
+        return record
+
+    def limit_record_size(self, source: str, message: bytes) -> bytes:
+        """Return the message to record for the given message, truncating it if it is
+        larger than the record size limit."""
+        if self.max_record_size is None:
+            return message
+
+        record = truncate_message(message, self.max_record_size)
+        if record is not message:
+            self._truncated.inc(1, source)
+
+        return record
+
+    async def _observe_and_drain(
+        self, source: str, dest: asyncio.StreamWriter, items: list[Observation]
+    ):
+        """Observe the given items and wait for the destination to accept the messages
+        forwarded to it.
+
+        Items handed to an observer thread or queue are yet to be prepared, that is
+        left to the consumer so that it happens off the forwarding path.
+        """
+        if self.observer is not None:
+            if len(items) > 0:
+                self.observer.put(items)
+
+            await self._drain(source, dest)
+            return
+
+        if self.queue is None:
+            await self._drain(source, dest)
+            for item in items:
+                self.observe(item)
+            return
+
+        # Queue the messages for observation before waiting on the destination, so
+        # that both can make progress at the same time.
+        for item in items:
+            await self.queue.put(item)
+
+        await self._drain(source, dest)
+
+    async def observe_stderr(self, line: bytes):
+        """Record a line written by the server to its stderr.
+
+        The line is recorded as a ``$/lsp-devtools/stderr`` notification sent by the
+        server, so that it is timestamped and stored alongside the rest of the session.
+        Like any other message, it is subject to the agent's filter, policies and record
+        size limit.
+        """
+        timestamp = self.now()
+        message = make_notification(
+            STDERR, {"message": line.decode("utf8", errors="replace")}
+        )
+
+        self._stderr_lines.inc(1)
+        item = Observation("server", timestamp, message)
+        if self.observer is not None:
+            self.observer.put([item])
+            return
+
+        if self.queue is not None:
+            await self.queue.put(item)
+        else:
+            self._prepare_and_observe(item)
+
+    async def _drain(self, source: str, dest: asyncio.StreamWriter):
+        """Wait for the destination (and any simulated link to it) to accept the
+        forwarded message."""
+        start = time.perf_counter_ns()
+        if (link := self.links.get(source)) is not None:
+            await link.drain()
 
-        # Forward the message as-is to the client/server
-        dest.write(message)
         await dest.drain()
+        self._drain_time.observe((time.perf_counter_ns() - start) / 1e9, source)
+
+    def now(self) -> int:
+        """Return the current time, in nanoseconds since the epoch.
+
+        Measured with a monotonic clock, relative to the wall clock time the session
+        started, so that the durations between messages are accurate even if the
+        system clock changes.
+        """
+        wall, monotonic = self._clock_anchor
+        return wall + (time.perf_counter_ns() - monotonic)
+
+    def measure_latency(
+        self, source: str, message: bytes, timestamp: int
+    ) -> int | None:
+        """If the given message is a response, return the time (in nanoseconds) since
+        its request was seen."""
+        try:
+            fields = scan_routing_fields(message, body_offset(message))
+        except ValueError:
+            return None
+
+        if "id" not in fields.keys or fields.id is None:
+            return None
+
+        if fields.method is not None:
+            self._pending[(source, fields.id)] = timestamp
+            if self.stalls is not None:
+                self.stalls.request(source, fields.id, fields.method, timestamp)
+                self._schedule_stall_check()
+
+            return None
+
+        # Responses are sent by the opposite side to the one that sent the request
+        request_source = "server" if source == "client" else "client"
+        if self.stalls is not None:
+            if (stalled := self.stalls.response(request_source, fields.id)) is not None:
+                # Report it once the response has been forwarded, rather than delay it.
+                asyncio.get_running_loop().call_soon(
+                    self._report_stall, stalled, timestamp, True
+                )
+
+        if (start := self._pending.pop((request_source, fields.id), None)) is None:
+            return None
+
+        return timestamp - start
+
+    def _schedule_stall_check(self):
+        """Ensure the stalled requests are checked for once the next one is due."""
+        if (deadline := self.stalls.next_deadline()) is None:  # type: ignore[union-attr]
+            return
+
+        if self._stall_timer is not None:
+            if self._stall_deadline <= deadline:
+                return
+
+            self._stall_timer.cancel()
+
+        delay = max(0, deadline - self.now()) / 1e9
+        self._stall_deadline = deadline
+        self._stall_timer = asyncio.get_running_loop().call_later(
+            delay, self._check_stalls
+        )
+
+    def _check_stalls(self):
+        """Report the requests that have stalled."""
+        self._stall_timer = None
+        now = self.now()
+        for request in self.stalls.expired(now):  # type: ignore[union-attr]
+            self._report_stall(request, now)
+
+        self._schedule_stall_check()
 
-        # Include some additional metadata before passing it onto the devtool.
-        # TODO: How do we make sure we choose the same encoding as `message`?
-        now = datetime.now(tz=UTC).isoformat()
-        fields = [
-            f"Message-Source: {source}\r\n".encode(),
-            f"Message-Session: {self.session_id}\r\n".encode(),
-            f"Message-Timestamp: {now}\r\n".encode(),
-            message,
-        ]
-
-        if inspect.iscoroutine(res := self.handler(b"".join(fields))):
+    def _cancel_stall_check(self):
+        if self._stall_timer is not None:
+            self._stall_timer.cancel()
+            self._stall_timer = None
+
+    def _report_stall(
+        self, request: PendingRequest, timestamp: int, resolved: bool = False
+    ):
+        """Record that the given request has stalled, or been answered after stalling.
+
+        The event is recorded as a ``$/lsp-devtools/stall`` notification sent by the
+        side expected to respond, and a warning is written to stderr. Only ever called
+        by a loop callback, never while messages are being forwarded.
+        """
+        elapsed = (timestamp - request.timestamp) / 1e9
+        if resolved:
+            print(
+                f"Request {request.method!r} ({request.id}) from the {request.source} "
+                f"was answered after {elapsed:.2f}s",
+                file=sys.stderr,
+            )
+        else:
+            self._stalled.inc(1, request.method)
+            print(
+                f"Request {request.method!r} ({request.id}) from the {request.source} "
+                f"has not been answered after {elapsed:.2f}s",
+                file=sys.stderr,
+            )
+
+        message = make_notification(
+            STALL,
+            {
+                "state": "resolved" if resolved else "stalled",
+                "id": request.id,
+                "method": request.method,
+                "source": request.source,
+                "elapsed": elapsed,
+            },
+        )
+        responder = "server" if request.source == "client" else "client"
+        item = Observation(responder, timestamp, message)
+        if self.observer is not None:
+            self.observer.put([item])
+            return
+
+        if self.queue is not None:
+            # Go through the queue, so that the event is observed in order and subject
+            # to the queue's overflow policy.
+            task = asyncio.create_task(self.queue.put(item))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            self._prepare_and_observe(item)
+
+    def should_observe(self, source: str, message: bytes) -> bool:
+        """Determine if the given message should be passed onto the handler."""
+        if self.message_filter is None:
+            return True
+
+        try:
+            body = LazyMessageBody(message, body_offset(message))
+            return self.message_filter.matches(source, body)
+        except (KeyError, ValueError):
+            # Not a message we understand, let the handler decide what to do with it.
+            return True
+
+    def observe(self, item: Observation):
+        """Pass an observed message onto the handler.
+
+        The message is prefixed with its metadata, see
+        :mod:`lsp_devtools.agent.metadata`. The agent only observes a single session,
+        which always has the index ``0``.
+        """
+        if inspect.iscoroutine(res := self._handle(item)):
             task = asyncio.create_task(res)
             self._tasks.add(task)
             task.add_done_callback(self._tasks.discard)
 
+    def _handle(self, item: Observation) -> Coroutine[Any, Any, None] | None:
+        record = pack_record(item.source, 0, item.timestamp, item.message, item.latency)
+        return self.handler(record)
+
+    def _observe_in_thread(self, item: Observation) -> Coroutine[Any, Any, None] | None:
+        """Called by the observer thread with each message handed over to it."""
+        if (prepared := self.prepare_observation(item)) is None:
+            return None
+
+        return self._handle(prepared)
+
+    async def _process_queue(self, queue: ObservationQueue):
+        """Prepare the messages from the observation queue and pass them onto the
+        handler."""
+        while True:
+            self._prepare_and_observe(await queue.get())
+
+    def _prepare_and_observe(self, item: Observation):
+        """Prepare the given message to be recorded and, unless dropped, observe it."""
+        if (prepared := self.prepare_observation(item)) is not None:
+            self.observe(prepared)
+
     async def _watch_server_process(self):
         """Once the server process exits, ensure that the agent is also shutdown."""
         ret = await self.server.wait()
@@ -224,6 +977,35 @@ class Agent:
             except TimeoutError:
                 self.server.kill()
 
+        # Make sure any messages still in the queue are observed
+        if self.observer is not None:
+            await self.observer.flush()
+
+            if self.observer.dropped > 0:
+                print(
+                    f"Dropped {self.observer.dropped} message(s) due to a full queue",
+                    file=sys.stderr,
+                )
+
+        if self.queue is not None:
+            while (item := self.queue.get_nowait()) is not None:
+                self._prepare_and_observe(item)
+
+            if self.queue.dropped > 0:
+                print(
+                    f"Dropped {self.queue.dropped} message(s) due to a full queue",
+                    file=sys.stderr,
+                )
+
+        for link in self.links.values():
+            link.close()
+
+        if self.observer is not None:
+            if not self.observer.loop.is_closed():
+                self.observer.loop.call_soon_threadsafe(self._cancel_stall_check)
+        else:
+            self._cancel_stall_check()
+
         # Cancel the tasks connecting client to server
         for task in self._tasks:
             logger.debug("cancelling: %s", task)
@@ -231,3 +1013,6 @@ class Agent:
 
         if self.writer:
             self.writer.close()
+
+        if self._read_transport is not None:
+            self._read_transport.close()
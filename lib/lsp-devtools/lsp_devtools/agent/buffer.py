@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import collections
+import typing
+
+if typing.TYPE_CHECKING:
+    from collections.abc import Iterator
+
+
+class MessageBuffer:
+    """A bounded buffer of messages.
+
+    When adding a message would exceed either limit, the oldest messages are discarded
+    to make space for it.
+
+    Parameters
+    ----------
+    max_messages
+       The maximum number of messages to hold.
+
+    max_bytes
+       The maximum total size of the messages to hold.
+    """
+
+    def __init__(self, max_messages: int = 4096, max_bytes: int = 32 * 1024 * 1024):
+        if max_messages < 1 or max_bytes < 1:
+            raise ValueError("Buffer limits must be positive")
+
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+
+        self.nbytes = 0
+        """The total size of the messages currently held."""
+
+        self.dropped = 0
+        """The number of messages that have been discarded."""
+
+        self.dropped_bytes = 0
+        """The total size of the messages that have been discarded."""
+
+        self._messages: collections.deque[bytes] = collections.deque()
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def append(self, message: bytes):
+        """Add a message to the buffer, discarding the oldest messages if necessary."""
+        self._messages.append(message)
+        self.nbytes += len(message)
+
+        while len(self._messages) > self.max_messages or self.nbytes > self.max_bytes:
+            oldest = self._messages.popleft()
+            self.nbytes -= len(oldest)
+            self.dropped += 1
+            self.dropped_bytes += len(oldest)
+
+    def peek(self) -> bytes | None:
+        """Return the oldest message in the buffer, without removing it."""
+        return self._messages[0] if len(self._messages) > 0 else None
+
+    def popleft(self) -> bytes:
+        """Remove and return the oldest message in the buffer."""
+        message = self._messages.popleft()
+        self.nbytes -= len(message)
+        return message
+
+    def drain(self) -> Iterator[bytes]:
+        """Remove and return the messages in the buffer, oldest first."""
+        while len(self._messages) > 0:
+            yield self.popleft()
@@ -0,0 +1,169 @@
+"""Write observed messages directly to a local file.
+
+A capture file is made up of one or more sessions, each starting with a header
+identifying the session, followed by the records (see :mod:`lsp_devtools.agent.metadata`)
+observed during it::
+
+   +-----------+-----------+------------+-------------------------------+
+   |   magic   | id length | session id |            records            |
+   |  8 bytes  |  2 bytes  |            |                               |
+   +-----------+-----------+------------+-------------------------------+
+
+Since the first byte of a record is always a valid source index, it cannot be mistaken
+for the start of the next session.
+"""
+
+from __future__ import annotations
+
+import queue
+import struct
+import threading
+import typing
+
+from .metadata import NO_LATENCY
+from .metadata import RECORD_PREFIX
+from .metadata import SOURCES
+from .metadata import MessageMetadata
+
+if typing.TYPE_CHECKING:
+    import pathlib
+    from collections.abc import Iterator
+
+CAPTURE_MAGIC = b"LSPDCAPT"
+
+CAPTURE_HEADER = struct.Struct("!8sH")
+"""The header at the start of each session: the magic bytes and the length of the
+session id."""
+
+WRITE_BUFFER_SIZE = 1024 * 1024
+"""The size of the buffer used when writing to the capture file."""
+
+
+class CaptureWriter:
+    """Append records to a capture file from a background thread.
+
+    Records are handed to the writer thread through a queue, so the agent never waits on
+    the disk. The thread writes whatever has accumulated in the queue in a single call,
+    and flushes the file whenever it runs out of records to write.
+
+    Parameters
+    ----------
+    path
+       The file to write to, new sessions are appended to existing files.
+
+    session_id
+       The id of the session being captured.
+
+    buffer_size
+       The size of the buffer used when writing to the file.
+    """
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        session_id: str,
+        buffer_size: int = WRITE_BUFFER_SIZE,
+    ):
+        self.path = path
+        self.session_id = session_id
+
+        self.nbytes = 0
+        """The number of bytes of records written to the file."""
+
+        self._queue: queue.SimpleQueue[bytes | None] = queue.SimpleQueue()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self.path.open("ab", buffering=buffer_size)
+
+        session = session_id.encode("utf8")
+        self._file.write(CAPTURE_HEADER.pack(CAPTURE_MAGIC, len(session)) + session)
+
+        self._thread = threading.Thread(
+            target=self._run, name="lsp-devtools-capture", daemon=True
+        )
+        self._thread.start()
+
+    def qsize(self) -> int:
+        """The (approximate) number of records waiting to be written."""
+        return self._queue.qsize()
+
+    def write(self, record: bytes):
+        """Queue the given record to be written to the file."""
+        self._queue.put(record)
+
+    def close(self):
+        """Write any remaining records and close the file."""
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+
+    def _run(self):
+        closed = False
+        while not closed:
+            batch = [self._queue.get()]
+            try:
+                while True:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            if batch[-1] is None:
+                closed = True
+                batch.pop()
+
+            data = b"".join(batch)  # type: ignore[arg-type]
+            self._file.write(data)
+            self._file.flush()
+            self.nbytes += len(data)
+
+
+def read_capture(path: pathlib.Path) -> Iterator[tuple[bytes, MessageMetadata]]:
+    """Iterate over the messages stored in the given capture file.
+
+    Yields
+    ------
+    tuple[bytes, MessageMetadata]
+       Each message, along with its metadata.
+
+    Raises
+    ------
+    ValueError
+       If the file is not a valid capture file.
+    """
+    session = None
+
+    with path.open("rb") as f:
+        while (first := f.read(1)) != b"":
+            if first == CAPTURE_MAGIC[:1]:
+                header = first + f.read(CAPTURE_HEADER.size - 1)
+                if len(header) < CAPTURE_HEADER.size:
+                    raise ValueError("Incomplete session header")
+
+                magic, length = CAPTURE_HEADER.unpack(header)
+                if magic != CAPTURE_MAGIC:
+                    raise ValueError(f"{path} is not a capture file")
+
+                session = f.read(length).decode("utf8")
+                continue
+
+            if session is None:
+                raise ValueError(f"{path} is not a capture file")
+
+            prefix = first + f.read(RECORD_PREFIX.size - 1)
+            if len(prefix) < RECORD_PREFIX.size:
+                raise ValueError("Incomplete record prefix")
+
+            source, _, timestamp_ns, latency_ns, length = RECORD_PREFIX.unpack(prefix)
+            if len(message := f.read(length)) < length:
+                raise ValueError("Incomplete record")
+
+            if source >= len(SOURCES):
+                raise ValueError(f"Invalid record: ({source=})")
+
+            metadata = MessageMetadata(
+                SOURCES[source],
+                session,
+                timestamp_ns,
+                None if latency_ns == NO_LATENCY else latency_ns,
+            )
+            yield message, metadata
@@ -2,40 +2,267 @@ from __future__ import annotations
 
 import asyncio
 import inspect
+import logging
 import typing
+from functools import partial
+from uuid import uuid4
 
 import stamina
 from pygls.client import JsonRPCClient
+from pygls.io_ import run_async
 from pygls.protocol import default_converter
 
+from lsp_devtools.agent.buffer import MessageBuffer
+from lsp_devtools.agent.envelope import BATCH_CONTENT_TYPE
+from lsp_devtools.agent.envelope import COMPRESSORS
+from lsp_devtools.agent.envelope import DROPPED
+from lsp_devtools.agent.envelope import HELLO
+from lsp_devtools.agent.envelope import RECORDS_CONTENT_TYPE
+from lsp_devtools.agent.envelope import encode_batch
+from lsp_devtools.agent.envelope import encode_envelope
+from lsp_devtools.agent.metadata import record_to_frame
+from lsp_devtools.agent.metadata import split_records
 from lsp_devtools.agent.protocol import AgentProtocol
+from lsp_devtools.agent.ring import RING
+from lsp_devtools.agent.ring import RingBuffer
 
 if typing.TYPE_CHECKING:
+    from collections.abc import Awaitable
     from typing import Any
+    from typing import Callable
+
+    from lsp_devtools.agent.journal import SpillJournal
+
+logger = logging.getLogger(__name__)
+
+REPLAY_BATCH_SIZE = 1024 * 1024
+"""The minimum size (in bytes) of the batches used to replay the journal."""
+
+RING_RETRY_DELAY = 0.005
+"""How long (in seconds) to wait before trying to write to a full ring again."""
+
+HELLO_TIMEOUT = 5.0
+"""How long (in seconds) to wait for the server to reply to the hello, before replaying
+the journal with the default encoding."""
 
 
 class AgentClient(JsonRPCClient):
-    """Client for connecting to an AgentServer instance."""
+    """Client for connecting to an AgentServer instance.
+
+    Messages are passed to the client as records (see :mod:`lsp_devtools.agent.metadata`)
+    and are sent to the server in that form if it supports it. Otherwise they are
+    converted to messages with the equivalent ``Message-*`` headers.
+
+    Parameters
+    ----------
+    session_id
+       The id of the session being observed, generated if not given.
+
+    batch_size
+       If non-zero, ask the server if it accepts batches of messages. Messages will
+       then be collected until the batch exceeds this many bytes before being sent.
+
+    batch_delay
+       The maximum time (in seconds) a message will wait in a partial batch before it
+       is sent.
+
+    compression
+       The compression algorithms the client is willing to use for batches, in order
+       of preference.
+
+    buffer
+       Holds messages until the client is connected, if the buffer fills up the oldest
+       messages are discarded. The number of discarded messages is reported to the
+       server once connected.
+
+    journal
+       If set, messages are written to this journal (rather than the buffer) until the
+       client is connected and the server has replied to the hello, at which point the
+       journal is replayed to the server.
+
+    hello_timeout
+       If the server has not replied to the hello within this many seconds, replay the
+       journal anyway, as messages with text headers that every server understands.
+
+    shared_memory
+       When connected over a Unix socket, ask the server for a shared-memory ring to
+       send records through instead of the socket. Messages are still sent over the
+       socket if the server does not support it.
+
+    write_buffer_limit
+       If non-zero, once more than this many bytes are waiting to be sent to the
+       server, further messages are held in the buffer until the server catches up.
+       This gives each client its own backpressure, when the buffer fills up the oldest
+       messages are discarded and reported to the server as usual.
+    """
 
     protocol: AgentProtocol
 
-    def __init__(self):
+    def __init__(
+        self,
+        session_id: str | None = None,
+        batch_size: int = 0,
+        batch_delay: float = 0.05,
+        compression: list[str] | None = None,
+        buffer: MessageBuffer | None = None,
+        journal: SpillJournal | None = None,
+        shared_memory: bool = False,
+        write_buffer_limit: int = 0,
+        hello_timeout: float = HELLO_TIMEOUT,
+    ):
         super().__init__(
             protocol_cls=AgentProtocol, converter_factory=default_converter
         )
         self.connected = False
-        self._buffer: list[bytes] = []
+        self.session_id = session_id or str(uuid4())
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.compression_options = [
+            name for name in (compression or []) if name in COMPRESSORS
+        ]
+
+        self.batching = False
+        """Set once the server has agreed to accept batches."""
+
+        self.binary = False
+        """Set once the server has agreed to accept records."""
+
+        self.compression: str | None = None
+        """The compression algorithm agreed with the server."""
+
+        self._buffer = buffer if buffer is not None else MessageBuffer()
+        self._reported_drops = (0, 0)
+        self._journal = journal
+        self.hello_timeout = hello_timeout
+        self._hello_timer: asyncio.TimerHandle | None = None
+        self._replay_task: asyncio.Task[None] | None = None
+        self.shared_memory = shared_memory
+        self._offer_ring = False
+        self._ring: RingBuffer | None = None
+        self._ring_retry: asyncio.TimerHandle | None = None
+        self.write_buffer_limit = write_buffer_limit
+        self._drain_task: asyncio.Task[None] | None = None
+        self._batch: list[bytes] = []
+        self._batch_bytes = 0
+        self._flush_handle: asyncio.TimerHandle | None = None
         self._tasks: set[asyncio.Task[Any]] = set()
 
+        # Bound methods cannot be registered as features directly.
+        @self.feature(HELLO)
+        def on_hello(params):
+            self._on_hello(params)
+
     def _report_server_error(self, error, source):
         # Bail on error
         # TODO: Report the actual error somehow
         self._stop_event.set()
 
+    def _on_hello(self, params: Any):
+        """Called when the server responds to our hello."""
+        compression = getattr(params, "compression", None)
+        self.compression = compression if compression in COMPRESSORS else None
+        self.batching = getattr(params, "batch", False)
+        self.binary = getattr(params, "metadata", None) == "binary"
+
+        if self.binary and (ring := getattr(params, "ring", None)) is not None:
+            try:
+                self._ring = RingBuffer.attach(ring)
+            except OSError:
+                logger.warning("Unable to attach to ring %r", ring, exc_info=True)
+
+        self._start_replay()
+
+    def _start_replay(self):
+        """Start replaying the journal, if there is one and it is not already being
+        replayed."""
+        if self._hello_timer is not None:
+            self._hello_timer.cancel()
+            self._hello_timer = None
+
+        if self._journal is None or self._replay_task is not None:
+            return
+
+        self._replay_task = asyncio.ensure_future(self._replay(self._journal))
+
+    @property
+    def buffered(self) -> int:
+        """The number of messages held in the buffer, waiting to be sent."""
+        return len(self._buffer)
+
+    @property
+    def dropped(self) -> int:
+        """The number of messages discarded from the buffer."""
+        return self._buffer.dropped
+
+    @property
+    def pending_tasks(self) -> int:
+        """The number of writes to the server yet to complete."""
+        return len(self._tasks)
+
+    @property
+    def journal_bytes(self) -> int:
+        """The size of the journal waiting to be replayed, ``0`` if there is none."""
+        return self._journal.length if self._journal is not None else 0
+
+    async def stop(self):
+        if self._hello_timer is not None:
+            self._hello_timer.cancel()
+            self._hello_timer = None
+
+        if self._replay_task is not None and not self._replay_task.done():
+            self._replay_task.cancel()
+            try:
+                await self._replay_task
+            except asyncio.CancelledError:
+                pass
+
+        # Only set if we never managed to replay it.
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+        if self._ring_retry is not None:
+            self._ring_retry.cancel()
+            self._ring_retry = None
+
+        if self._ring is not None:
+            self._ring.close()
+            self._ring = None
+
+        if self._drain_task is not None:
+            self._drain_task.cancel()
+            self._drain_task = None
+
+        await super().stop()
+
     def feature(self, feature_name: str, options: Any | None = None):
         return self.protocol.fm.feature(feature_name, options)
 
     async def start_tcp(self, host: str, port: int):
+        await self._connect(partial(super().start_tcp, host, port))
+
+    async def start_unix(self, path: str):
+        """Start communicating with a server over a Unix domain socket."""
+        self._offer_ring = self.shared_memory
+        await self._connect(partial(self._start_unix, path))
+
+    async def _start_unix(self, path: str):
+        reader, writer = await asyncio.open_unix_connection(path)
+
+        self.protocol.set_writer(writer)
+        connection = asyncio.create_task(
+            run_async(
+                stop_event=self._stop_event,
+                reader=reader,
+                protocol=self.protocol,
+                logger=logger,
+                error_handler=self.report_server_error,
+            )
+        )
+        self._async_tasks.append(connection)
+
+    async def _connect(self, start: Callable[[], Awaitable[None]]):
+        """Connect to the server, using the given function to open the connection."""
         # The user might not have started the server app immediately and since the
         # agent will live as long as the wrapper language server we may as well
         # try indefinitely.
@@ -48,25 +275,223 @@ class AgentClient(JsonRPCClient):
         )
         async for attempt in retries:
             with attempt:
-                await super().start_tcp(host, port)
+                await start()
                 self.connected = True
 
+        if self.write_buffer_limit > 0 and (transport := self._transport()) is not None:
+            # Pause writing at the limit, so that we can wait on the writer to drain.
+            transport.set_write_buffer_limits(high=self.write_buffer_limit)
+
+        # Until the server replies, messages are sent individually with text headers
+        # so that we still work with servers that do not understand the hello.
+        self.protocol.notify(
+            HELLO,
+            {
+                "batch": self.batch_size > 0,
+                "compression": self.compression_options,
+                "metadata": "binary",
+                "sessions": [self.session_id],
+                "ring": self._offer_ring,
+            },
+        )
+        if self._journal is not None:
+            loop = asyncio.get_running_loop()
+            self._hello_timer = loop.call_later(self.hello_timeout, self._start_replay)
+
+        self._send_buffered()
+
     def forward_message(self, message: bytes):
-        """Forward the given message to the server instance."""
+        """Forward the given record to the server instance."""
+
+        if self._journal is not None:
+            self._journal.append(message)
+            return
 
         if not self.connected or self.protocol.writer is None:
             self._buffer.append(message)
             return
 
-        # Send any buffered messages
+        if self._ring is not None:
+            self._send_ring(message)
+            return
+
+        if len(self._buffer) > 0 or self._is_congested():
+            self._buffer.append(message)
+            self._send_buffered()
+            return
+
+        self._send(message)
+
+    def flush(self):
+        """Send any messages waiting in the current batch."""
+        if self._ring is not None:
+            self._flush_ring()
+
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        if len(self._batch) == 0:
+            return
+
+        batch, self._batch, self._batch_bytes = self._batch, [], 0
+        content_type = RECORDS_CONTENT_TYPE if self.binary else BATCH_CONTENT_TYPE
+        self._write(encode_batch(batch, self.compression, content_type))
+
+    def _send_buffered(self):
+        """Send any buffered messages, reporting any that had to be discarded."""
+        if self._is_congested():
+            self._wait_for_drain()
+            return
+
+        self._report_dropped()
         while len(self._buffer) > 0:
-            res = self.protocol.writer.write(self._buffer.pop(0))
-            if inspect.isawaitable(res):
-                task = asyncio.ensure_future(res)
-                task.add_done_callback(self._tasks.discard)
-                self._tasks.add(task)
+            if self._is_congested():
+                self._wait_for_drain()
+                return
+
+            self._send(self._buffer.popleft())
+
+    def _transport(self) -> asyncio.WriteTransport | None:
+        """Return the transport underlying the connection to the server, if any."""
+        return getattr(self.protocol.writer, "transport", None)
+
+    def _is_congested(self) -> bool:
+        """Return ``True`` if too much data is waiting to be sent to the server."""
+        if self.write_buffer_limit <= 0 or (transport := self._transport()) is None:
+            return False
+
+        return transport.get_write_buffer_size() > self.write_buffer_limit
+
+    def _wait_for_drain(self):
+        """Send the buffered messages once the server has caught up."""
+        if self._drain_task is None:
+            self._drain_task = asyncio.ensure_future(self._drain())
+
+    async def _drain(self):
+        try:
+            await self.protocol.writer.drain()  # type: ignore[union-attr]
+        except ConnectionError:
+            return
+        finally:
+            self._drain_task = None
+
+        self._send_buffered()
+
+    def _report_dropped(self):
+        """Tell the server about any messages that had to be discarded."""
+        messages, nbytes = self._reported_drops
+        if (dropped := self._buffer.dropped - messages) > 0:
+            self.protocol.notify(
+                DROPPED,
+                {"messages": dropped, "bytes": self._buffer.dropped_bytes - nbytes},
+            )
+            self._reported_drops = (self._buffer.dropped, self._buffer.dropped_bytes)
+
+    def _send_ring(self, record: bytes):
+        """Write the given record to the ring, holding onto it if the ring is full."""
+        if len(self._buffer) == 0 and self._ring.write(record):  # type: ignore[union-attr]
+            self._ring_doorbell()
+            return
+
+        self._buffer.append(record)
+        self._flush_ring()
+
+    def _flush_ring(self):
+        """Move as many buffered records into the ring as will fit."""
+        self._ring_retry = None
+        ring = self._ring
+        if ring is None:
+            return
+
+        self._report_dropped()
+        while (record := self._buffer.peek()) is not None:
+            if len(record) > ring.capacity:
+                # This will never fit, so it has to go over the socket instead. Wait
+                # for the server to receive everything in the ring first, otherwise
+                # it would be recorded ahead of the records sent before it.
+                if len(ring) > 0:
+                    break
+
+                self._write(
+                    encode_batch([record], self.compression, RECORDS_CONTENT_TYPE)
+                )
+            elif not ring.write(record):
+                break
+
+            self._buffer.popleft()
+
+        self._ring_doorbell()
+        if len(self._buffer) > 0 and self._ring_retry is None:
+            loop = asyncio.get_running_loop()
+            self._ring_retry = loop.call_later(RING_RETRY_DELAY, self._flush_ring)
+
+    def _ring_doorbell(self):
+        """Wake the server, if it is waiting for records to be written to the ring."""
+        if self._ring is not None and self._ring.waiting:
+            self._ring.waiting = False
+            self.protocol.notify(RING, None)
+
+    async def _replay(self, journal: SpillJournal):
+        """Send the contents of the journal to the server."""
+        batch_size = max(self.batch_size, REPLAY_BATCH_SIZE)
+        if self._ring is not None:
+            batch_size = min(batch_size, self._ring.capacity)
+
+        for count, data in journal.read_batches(batch_size):
+            if (ring := self._ring) is not None and len(data) <= ring.capacity:
+                while not ring.write(data):
+                    self._ring_doorbell()
+                    await asyncio.sleep(RING_RETRY_DELAY)
+
+                self._ring_doorbell()
+            elif self.binary:
+                self._write(
+                    encode_envelope(data, count, self.compression, RECORDS_CONTENT_TYPE)
+                )
+            else:
+                for record in split_records(data):
+                    self._write(record_to_frame(record, [self.session_id]))
+
+            # Don't read the next batch until the server has caught up.
+            if (drain := getattr(self.protocol.writer, "drain", None)) is not None:
+                await drain()
+
+        # Any messages appended while replaying have been sent, so it's safe to switch
+        # over to sending messages directly.
+        self._journal = None
+        journal.close()
+
+        if journal.dropped > 0:
+            self.protocol.notify(
+                DROPPED, {"messages": journal.dropped, "bytes": journal.dropped_bytes}
+            )
+
+    def _send(self, record: bytes):
+        message = record if self.binary else record_to_frame(record, [self.session_id])
+
+        if not self.batching:
+            if self.binary:
+                message = encode_batch([message], None, RECORDS_CONTENT_TYPE)
+
+            self._write(message)
+            return
+
+        self._batch.append(message)
+        self._batch_bytes += len(message)
+
+        if self._batch_bytes >= self.batch_size:
+            self.flush()
+
+        elif self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.batch_delay, self.flush)
+
+    def _write(self, data: bytes):
+        if self.protocol.writer is None:
+            return
 
-        res = self.protocol.writer.write(message)
+        res = self.protocol.writer.write(data)
         if inspect.isawaitable(res):
             task = asyncio.ensure_future(res)
             task.add_done_callback(self._tasks.discard)
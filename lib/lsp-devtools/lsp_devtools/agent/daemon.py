@@ -0,0 +1,199 @@
+"""Host many agent sessions in a single, long-lived process.
+
+Rather than starting a full agent for each language server, a small launcher
+(:mod:`lsp_devtools.launch`) connects to the daemon over a Unix socket and hands over
+its stdin, stdout and stderr, along with the command used to start the server::
+
+   launcher                                   daemon
+      |  fds 0, 1, 2 + {"command", "cwd", "env"}\\n  |
+      | -----------------------------------------> |  starts server, proxies its
+      |                                            |  messages using the given fds
+      |                        <exit code>\\n       |
+      | <----------------------------------------- |
+
+If the launcher goes away before the server exits, the server is stopped.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import pathlib
+import socket
+import typing
+
+import attrs
+
+if typing.TYPE_CHECKING:
+    from collections.abc import Coroutine
+    from typing import Any
+    from typing import BinaryIO
+    from typing import Callable
+
+    SessionHandler = Callable[["LaunchRequest"], Coroutine[Any, Any, int]]
+
+logger = logging.getLogger(__name__)
+
+LAUNCH_TIMEOUT = 5
+"""How long (in seconds) to wait for a launcher to send its request."""
+
+MAX_REQUEST_SIZE = 1024 * 1024
+"""The maximum size (in bytes) of a launch request."""
+
+
+@attrs.define
+class LaunchRequest:
+    """A request to start a language server, sent by the launcher."""
+
+    command: list[str]
+    """The command used to start the server."""
+
+    cwd: str | None
+    """The directory to start the server in."""
+
+    env: dict[str, str] | None
+    """The environment to start the server with."""
+
+    stdin: BinaryIO
+    """The launcher's stdin, connected to the client."""
+
+    stdout: BinaryIO
+    """The launcher's stdout, connected to the client."""
+
+    stderr: BinaryIO
+    """The launcher's stderr."""
+
+    def close(self):
+        """Close the launcher's streams, if they have not been closed already."""
+        for stream in (self.stdin, self.stdout, self.stderr):
+            if not stream.closed:
+                stream.close()
+
+
+def receive_request(conn: socket.socket) -> LaunchRequest:
+    """Receive a launch request from the given connection.
+
+    Raises
+    ------
+    ValueError
+       If the request is invalid.
+    """
+    data, fds, _, _ = socket.recv_fds(conn, MAX_REQUEST_SIZE, 3)
+    try:
+        request = _read_request(conn, data, fds)
+    except Exception:
+        for fd in fds:
+            os.close(fd)
+        raise
+
+    return LaunchRequest(
+        command=[str(arg) for arg in request["command"]],
+        cwd=request.get("cwd"),
+        env=request.get("env"),
+        stdin=os.fdopen(fds[0], "rb", buffering=0),
+        stdout=os.fdopen(fds[1], "wb", buffering=0),
+        stderr=os.fdopen(fds[2], "wb", buffering=0),
+    )
+
+
+def _read_request(conn: socket.socket, data: bytes, fds: list[int]) -> dict[str, Any]:
+    if len(fds) != 3:
+        raise ValueError(f"Expected 3 file descriptors, got {len(fds)}")
+
+    while not data.endswith(b"\n"):
+        if len(data) > MAX_REQUEST_SIZE or not (chunk := conn.recv(65536)):
+            raise ValueError("Incomplete launch request")
+
+        data += chunk
+
+    request = json.loads(data)
+    command = request.get("command") if isinstance(request, dict) else None
+    if not isinstance(command, list) or len(command) == 0:
+        raise ValueError("Missing server command")
+
+    return request
+
+
+class AgentDaemon:
+    """Accepts launch requests on a Unix socket, running a session for each one.
+
+    Parameters
+    ----------
+    handler
+       Called with each launch request, it should run the session until the server
+       exits, returning the server's exit code.
+    """
+
+    def __init__(self, handler: SessionHandler):
+        self.handler = handler
+        self.sessions: set[asyncio.Task[int]] = set()
+        """The sessions currently running."""
+
+    async def serve(self, path: str):
+        """Accept launch requests on the Unix socket at ``path``, until cancelled."""
+        # Remove any socket left behind by a previous daemon.
+        if (socket_path := pathlib.Path(path)).is_socket():
+            socket_path.unlink()
+
+        loop = asyncio.get_running_loop()
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            listener.bind(path)
+            listener.listen()
+            listener.setblocking(False)
+
+            tasks: set[asyncio.Task[None]] = set()
+            while True:
+                conn, _ = await loop.sock_accept(listener)
+                task = asyncio.create_task(self._handle_launcher(conn))
+                task.add_done_callback(tasks.discard)
+                tasks.add(task)
+        finally:
+            listener.close()
+            socket_path.unlink(missing_ok=True)
+
+    async def _handle_launcher(self, conn: socket.socket):
+        loop = asyncio.get_running_loop()
+        conn.settimeout(LAUNCH_TIMEOUT)
+        try:
+            request = await loop.run_in_executor(None, receive_request, conn)
+        except (OSError, ValueError):
+            logger.warning("Invalid launch request", exc_info=True)
+            conn.close()
+            return
+
+        conn.setblocking(False)
+        reader, writer = await asyncio.open_unix_connection(sock=conn)
+
+        session: asyncio.Task[int] = asyncio.create_task(self.handler(request))
+        self.sessions.add(session)
+        hangup = asyncio.create_task(reader.read())
+
+        try:
+            # The launcher never sends anything else, so this only returns if it exits.
+            await asyncio.wait([session, hangup], return_when=asyncio.FIRST_COMPLETED)
+            if not session.done():
+                logger.info("Launcher for %r exited, stopping server", request.command)
+                session.cancel()
+                await asyncio.wait([session])
+                return
+
+            returncode = 1
+            if session.cancelled():
+                logger.warning("Session for %r was cancelled", request.command)
+            elif (exc := session.exception()) is not None:
+                logger.error("Error in session for %r", request.command, exc_info=exc)
+            else:
+                returncode = session.result()
+
+            writer.write(f"{returncode}\n".encode())
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions.discard(session)
+            hangup.cancel()
+            writer.close()
+            request.close()
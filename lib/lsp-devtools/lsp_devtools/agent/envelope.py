@@ -0,0 +1,185 @@
+"""The envelope format used to send batches of messages from an ``AgentClient`` to an
+``AgentServer``.
+
+An envelope is itself a ``Content-Length`` framed message, identified by its
+``Content-Type`` header. Its body is the concatenation of the framed messages (or
+records, see :mod:`lsp_devtools.agent.metadata`) in the batch, optionally compressed
+with the algorithm named by the ``Content-Encoding`` header::
+
+   Content-Length: 1234\r\n
+   Content-Type: application/vnd.lsp-devtools.batch\r\n
+   Content-Encoding: zlib\r\n
+   Batch-Count: 42\r\n
+   \r\n
+   <compressed messages>
+
+The compression algorithm and metadata format are negotiated when the client connects,
+the client sends a ``$/lsp-devtools/hello`` notification listing what it supports and
+the server replies with what it has chosen.
+"""
+
+from __future__ import annotations
+
+import typing
+import zlib
+
+from .framing import FrameDecoder
+from .framing import get_header
+
+if typing.TYPE_CHECKING:
+    from collections.abc import Iterator
+    from typing import Callable
+
+    Codec = tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]
+
+BATCH_CONTENT_TYPE = "application/vnd.lsp-devtools.batch"
+"""The content type used to identify envelopes containing framed messages."""
+
+RECORDS_CONTENT_TYPE = "application/vnd.lsp-devtools.records"
+"""The content type used to identify envelopes containing records."""
+
+HELLO = "$/lsp-devtools/hello"
+"""The method name used to negotiate the connection between client and server."""
+
+DROPPED = "$/lsp-devtools/dropped"
+"""The method name used by the client to report messages it was unable to send."""
+
+MIN_COMPRESS_SIZE = 1024
+"""Batches smaller than this (in bytes) are not worth compressing."""
+
+
+def _load_zstd() -> Codec:
+    try:
+        from compression import zstd  # type: ignore[import-not-found]
+
+        return zstd.compress, zstd.decompress
+    except ImportError:
+        pass
+
+    import zstandard  # type: ignore[import-not-found]
+
+    return zstandard.ZstdCompressor().compress, zstandard.ZstdDecompressor().decompress
+
+
+def _load_zlib() -> Codec:
+    return (lambda data: zlib.compress(data, 1)), zlib.decompress
+
+
+def available_compressors() -> dict[str, Codec]:
+    """Return the available compression algorithms, in order of preference."""
+    compressors = {}
+    for name, loader in [("zstd", _load_zstd), ("zlib", _load_zlib)]:
+        try:
+            compressors[name] = loader()
+        except ImportError:
+            pass
+
+    return compressors
+
+
+COMPRESSORS = available_compressors()
+
+
+def negotiate_compression(offered: list[str]) -> str | None:
+    """Pick the first of the offered compression algorithms that we also support."""
+    for name in offered:
+        if name in COMPRESSORS:
+            return name
+
+    return None
+
+
+def encode_batch(
+    items: list[bytes],
+    compression: str | None = None,
+    content_type: str = BATCH_CONTENT_TYPE,
+) -> bytes:
+    """Pack the given items into a single envelope.
+
+    Parameters
+    ----------
+    items
+       The items to include in the batch, either framed messages or records (see
+       :mod:`lsp_devtools.agent.metadata`).
+
+    compression
+       The compression algorithm to use, if any.
+
+    content_type
+       Either :data:`BATCH_CONTENT_TYPE` or :data:`RECORDS_CONTENT_TYPE`, depending on
+       the kind of items in the batch.
+    """
+    return encode_envelope(b"".join(items), len(items), compression, content_type)
+
+
+def encode_envelope(
+    body: bytes,
+    count: int,
+    compression: str | None = None,
+    content_type: str = BATCH_CONTENT_TYPE,
+) -> bytes:
+    """Wrap the given body, containing ``count`` items, in an envelope."""
+    headers = f"Content-Type: {content_type}\r\nBatch-Count: {count}\r\n"
+
+    if compression is not None and len(body) >= MIN_COMPRESS_SIZE:
+        compress, _ = COMPRESSORS[compression]
+        body = compress(body)
+        headers += f"Content-Encoding: {compression}\r\n"
+
+    header = f"Content-Length: {len(body)}\r\n{headers}\r\n"
+    return header.encode() + body
+
+
+def get_batch_type(frame: bytes) -> str | None:
+    """Return the content type of the given envelope, or ``None`` if the frame is not
+    an envelope."""
+    content_type = get_header(frame, "Content-Type")
+    if content_type in {BATCH_CONTENT_TYPE, RECORDS_CONTENT_TYPE}:
+        return content_type
+
+    return None
+
+
+def is_batch(frame: bytes) -> bool:
+    """Return ``True`` if the given frame is an envelope."""
+    return get_batch_type(frame) is not None
+
+
+def decode_body(frame: bytes) -> bytes:
+    """Return the (decompressed) body of the given envelope.
+
+    Raises
+    ------
+    ValueError
+       If the envelope uses an unsupported compression algorithm.
+    """
+    body = frame[frame.index(b"\r\n\r\n") + 4 :]
+
+    if (encoding := get_header(frame, "Content-Encoding")) is not None:
+        if (compressor := COMPRESSORS.get(encoding)) is None:
+            raise ValueError(f"Unsupported Content-Encoding: {encoding!r}")
+
+        _, decompress = compressor
+        try:
+            body = decompress(body)
+        except Exception as exc:
+            raise ValueError(f"Unable to decompress batch: {exc}") from exc
+
+    return body
+
+
+def decode_batch(frame: bytes) -> Iterator[bytes]:
+    """Unpack the frames contained in the given envelope.
+
+    Raises
+    ------
+    ValueError
+       If the envelope uses an unsupported compression algorithm or contains
+       invalid frames.
+    """
+    decoder = FrameDecoder()
+    decoder.feed(decode_body(frame))
+    yield from decoder
+
+    if len(decoder) > 0:
+        raise ValueError(f"Incomplete message in batch: {len(decoder)} bytes remain")
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import argparse
+import typing
+
+import attrs
+
+if typing.TYPE_CHECKING:
+    from collections.abc import Mapping
+    from typing import Literal
+
+    MessageSource = Literal["client", "server", "both"]
+    MessageType = Literal["request", "response", "result", "error", "notification"]
+
+MESSAGE_SOURCES = ["client", "server", "both"]
+MESSAGE_TYPES = ["request", "response", "result", "error", "notification"]
+
+
+@attrs.define
+class MessageFilter:
+    """Decides which LSP messages should be kept."""
+
+    message_source: MessageSource = attrs.field(default="both")
+    """Only include messages from the given source."""
+
+    include_message_types: set[MessageType] = attrs.field(factory=set, converter=set)
+    """Only include the given message types."""
+
+    exclude_message_types: set[MessageType] = attrs.field(factory=set, converter=set)
+    """Exclude the given message types."""
+
+    include_methods: set[str] = attrs.field(factory=set, converter=set)
+    """Only include messages associated with the given method."""
+
+    exclude_methods: set[str] = attrs.field(factory=set, converter=set)
+    """Exclude messages associated with the given method."""
+
+    _response_method_map: dict[tuple[str, int | str], str] = attrs.field(factory=dict)
+    """Used to determine the method for response messages"""
+
+    @classmethod
+    def from_args(cls, args: argparse.Namespace, **kwargs):
+        """Create a filter from the options added by :func:`setup_filter_args`."""
+        return cls(
+            message_source=args.message_source,
+            include_message_types=args.include_message_types,
+            exclude_message_types=args.exclude_message_types,
+            include_methods=args.include_methods,
+            exclude_methods=args.exclude_methods,
+            **kwargs,
+        )
+
+    @property
+    def is_empty(self) -> bool:
+        """Return ``True`` if the filter allows every message through."""
+        return self.message_source == "both" and not any(
+            [
+                self.include_message_types,
+                self.exclude_message_types,
+                self.include_methods,
+                self.exclude_methods,
+            ]
+        )
+
+    def matches(self, source: str, message: Mapping) -> bool:
+        """Return ``True`` if the given message should be kept."""
+        message_type = get_message_type(message)
+        message_method = self._get_message_method(source, message_type, message)
+
+        if self.message_source not in {"both", source}:
+            return False
+
+        if self.include_message_types and not message_matches_type(
+            message_type, self.include_message_types
+        ):
+            return False
+
+        if self.exclude_message_types and message_matches_type(
+            message_type, self.exclude_message_types
+        ):
+            return False
+
+        if self.include_methods and message_method not in self.include_methods:
+            return False
+
+        return not (self.exclude_methods and message_method in self.exclude_methods)
+
+    def _get_message_method(
+        self, source: str, message_type: str, message: Mapping
+    ) -> str | None:
+        if message_type == "request":
+            method = message["method"]
+            self._response_method_map[(source, message["id"])] = method
+
+            return method
+
+        if message_type == "notification":
+            return message["method"]
+
+        # Responses are sent by the opposite side to the one that sent the request
+        request_source = "server" if source == "client" else "client"
+        return self._response_method_map.pop((request_source, message["id"]), None)
+
+
+def message_matches_type(message_type: str, types: set[MessageType]) -> bool:
+    """Determine if the type of message is included in the given set of types"""
+
+    if message_type == "result":
+        return len({"result", "response"} & types) > 0
+
+    if message_type == "error":
+        return len({"error", "response"} & types) > 0
+
+    return message_type in types
+
+
+def get_message_type(message: Mapping) -> str:
+    if "id" in message:
+        if "error" in message:
+            return "error"
+        elif "method" in message:
+            return "request"
+        else:
+            return "result"
+    else:
+        return "notification"
+
+
+def setup_filter_args(cmd: argparse.ArgumentParser, description: str):
+    """Add arguments that can be used to filter messages."""
+
+    filter_ = cmd.add_argument_group(title="filter options", description=description)
+    filter_.add_argument(
+        "--message-source",
+        default="both",
+        choices=MESSAGE_SOURCES,
+        help="only include messages from the given source",
+    )
+    filter_.add_argument(
+        "--include-message-type",
+        action="append",
+        default=[],
+        dest="include_message_types",
+        choices=MESSAGE_TYPES,
+        help="only include the given message type(s)",
+    )
+    filter_.add_argument(
+        "--exclude-message-type",
+        action="append",
+        dest="exclude_message_types",
+        default=[],
+        choices=MESSAGE_TYPES,
+        help="omit the given message type(s)",
+    )
+    filter_.add_argument(
+        "--include-method",
+        action="append",
+        dest="include_methods",
+        default=[],
+        metavar="METHOD",
+        help="only include the given messages for the given method(s)",
+    )
+    filter_.add_argument(
+        "--exclude-method",
+        action="append",
+        dest="exclude_methods",
+        default=[],
+        metavar="METHOD",
+        help="omit messages for the given method(s)",
+    )
@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import re
+import typing
+from functools import cache
+from typing import NamedTuple
+
+if typing.TYPE_CHECKING:
+    from collections.abc import Iterator
+
+HEADER_TERMINATOR = b"\r\n\r\n"
+CONTENT_LENGTH_PATTERN = re.compile(rb"content-length[ \t]*:[ \t]*(\d+)", re.IGNORECASE)
+
+
+class FramePiece(NamedTuple):
+    """Part of a frame, returned before the rest of the frame has been received."""
+
+    data: bytes
+    """The bytes of the frame contained in this piece."""
+
+    offset: int
+    """The index of the first byte of this piece, within the frame."""
+
+    length: int
+    """The length of the full frame."""
+
+    @property
+    def is_first(self) -> bool:
+        """``True`` if this piece contains the start of the frame, including all of its
+        headers."""
+        return self.offset == 0
+
+    @property
+    def is_last(self) -> bool:
+        """``True`` if this piece contains the end of the frame."""
+        return self.offset + len(self.data) == self.length
+
+
+class FrameDecoder:
+    """Incrementally split a byte stream into ``Content-Length`` framed messages.
+
+    Data is accumulated in a single ``bytearray`` and headers are parsed in place, so
+    the only copy made is when a complete frame is sliced out of the buffer. Headers
+    may appear in any order, and any additional headers (e.g. ``Content-Type``) are
+    preserved as-is in the resulting frame.
+
+    Example
+    -------
+    ::
+
+       decoder = FrameDecoder()
+       decoder.feed(data)
+
+       for frame in decoder:
+           ...
+
+    Frames larger than ``stream_threshold`` bytes need not be held in memory in full,
+    once :meth:`next_frame` returns ``None`` the part of the frame received so far can
+    be taken with :meth:`next_piece`.
+    """
+
+    def __init__(self, stream_threshold: int = 0) -> None:
+        self.stream_threshold = stream_threshold
+        """Frames larger than this (in bytes) may be returned in pieces, ``0`` to
+        always return complete frames."""
+
+        self._buffer = bytearray()
+
+        self._start = 0
+        """Index of the first byte in the buffer belonging to the current frame."""
+
+        self._end: int | None = None
+        """Index of the byte just after the current frame, once known."""
+
+        self._offset = 0
+        """The number of bytes of the current frame already returned as pieces."""
+
+    def __len__(self) -> int:
+        """The number of buffered bytes that have not yet been returned as a frame."""
+        return len(self._buffer) - self._start
+
+    def __iter__(self) -> Iterator[bytes]:
+        return self
+
+    def __next__(self) -> bytes:
+        if (frame := self.next_frame()) is None:
+            raise StopIteration
+
+        return frame
+
+    def feed(self, data: bytes) -> None:
+        """Append the given data to the buffer."""
+
+        # Compact the buffer before growing it, dropping a prefix of a bytearray
+        # does not copy the data that remains.
+        if self._start > 0:
+            del self._buffer[: self._start]
+
+            if self._end is not None:
+                self._end -= self._start
+
+            self._start = 0
+
+        self._buffer += data
+
+    def next_frame(self) -> bytes | None:
+        """Return the next complete frame in the buffer, if available.
+
+        Raises
+        ------
+        ValueError
+           If a header block is found without a valid ``Content-Length`` header.
+           The offending header block is discarded so decoding can continue.
+        """
+        buffer = self._buffer
+
+        if self._end is None:
+            if (idx := buffer.find(HEADER_TERMINATOR, self._start)) < 0:
+                return None
+
+            body_start = idx + len(HEADER_TERMINATOR)
+            length = find_content_length(buffer, self._start, idx)
+
+            if length is None:
+                headers = bytes(buffer[self._start : idx])
+                self._start = body_start
+                raise ValueError(f"Missing 'Content-Length' header: {headers!r}")
+
+            self._end = body_start + length
+
+        if self._offset > 0 or len(buffer) < self._end:
+            return None
+
+        frame = bytes(buffer[self._start : self._end])
+        self._start, self._end = self._end, None
+
+        return frame
+
+    def next_piece(self) -> FramePiece | None:
+        """Return the part of the current frame received so far, if it is larger than
+        the stream threshold and is not yet complete.
+
+        Should only be called once :meth:`next_frame` returns ``None``. Once the first
+        piece of a frame has been returned, the rest of the frame is only available
+        through this method.
+        """
+        if self._end is None or self.stream_threshold <= 0:
+            return None
+
+        length = self._offset + self._end - self._start
+        if length <= self.stream_threshold:
+            return None
+
+        end = min(len(self._buffer), self._end)
+        if end == self._start or (self._offset == 0 and end == self._end):
+            # Nothing new, or a complete frame that can be returned as-is.
+            return None
+
+        piece = FramePiece(bytes(self._buffer[self._start : end]), self._offset, length)
+        self._offset += end - self._start
+        self._start = end
+
+        if piece.is_last:
+            self._end, self._offset = None, 0
+
+        return piece
+
+
+def find_content_length(buffer: bytearray | bytes, start: int, end: int) -> int | None:
+    """Find the value of the ``Content-Length`` header in the given region of the
+    buffer."""
+
+    for match in CONTENT_LENGTH_PATTERN.finditer(buffer, start, end):
+        # Ensure we matched the beginning of a header, not something like
+        # 'X-Content-Length'
+        idx = match.start()
+        if idx == start or buffer[idx - 1 : idx] == b"\n":
+            return int(match.group(1))
+
+    return None
+
+
+def get_header(frame: bytes, name: str) -> str | None:
+    """Return the value of the given header in the frame, if present.
+
+    Header names are matched case-insensitively.
+    """
+    if (end := frame.find(HEADER_TERMINATOR)) < 0:
+        return None
+
+    if (match := _header_pattern(name).search(frame, 0, end)) is None:
+        return None
+
+    value_end = frame.find(b"\r\n", match.end(), end)
+    if value_end < 0:
+        value_end = end
+
+    return frame[match.end() : value_end].decode("utf8").strip()
+
+
+@cache
+def _header_pattern(name: str) -> re.Pattern[bytes]:
+    return re.compile(rb"(?:^|\r\n)" + re.escape(name.encode()) + rb"[ \t]*:", re.I)
@@ -0,0 +1,189 @@
+"""An append-only, disk-backed journal of records.
+
+Used by the ``AgentClient`` to hold messages while it is unable to reach an agent
+server, without holding them in memory. The journal file starts with a fixed size
+header, followed by the records (see :mod:`lsp_devtools.agent.metadata`)::
+
+   +-----------+--------------+-------------------------------+
+   |   magic   | data length  |            records            |
+   |  8 bytes  |   8 bytes    |      data length bytes        |
+   +-----------+--------------+-------------------------------+
+
+Records are written through a fixed size memory-mapped window which slides along the
+file as it grows, so the agent's memory usage does not depend on the size of the
+journal.
+"""
+
+from __future__ import annotations
+
+import mmap
+import pathlib
+import struct
+import typing
+
+import platformdirs
+
+from .metadata import RECORD_PREFIX
+
+if typing.TYPE_CHECKING:
+    from collections.abc import Iterator
+
+JOURNAL_MAGIC = b"LSPDJRNL"
+
+JOURNAL_HEADER = struct.Struct("!8sQ")
+"""The journal's header: the magic bytes and the length of the data."""
+
+WINDOW_SIZE = 1024 * 1024
+"""The size of the memory-mapped region used to write to the journal."""
+
+
+def default_journal_dir() -> pathlib.Path:
+    """Return the default directory to store journals in."""
+    cache_dir = platformdirs.user_cache_dir(appname="lsp-devtools", appauthor="swyddfa")
+    return pathlib.Path(cache_dir, "journals")
+
+
+class SpillJournal:
+    """An append-only journal of records, stored on disk.
+
+    Parameters
+    ----------
+    path
+       The file to write the journal to, it will be overwritten if it already exists.
+
+    max_bytes
+       The maximum size of the journal, records that do not fit are discarded.
+
+    window_size
+       The size of the memory-mapped region used to write to the file, must be a
+       multiple of :data:`mmap.ALLOCATIONGRANULARITY`.
+    """
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        max_bytes: int = 1024 * 1024 * 1024,
+        window_size: int = WINDOW_SIZE,
+    ):
+        if window_size <= 0 or window_size % mmap.ALLOCATIONGRANULARITY != 0:
+            raise ValueError(
+                f"Window size must be a multiple of {mmap.ALLOCATIONGRANULARITY}"
+            )
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.window_size = window_size
+
+        self.length = 0
+        """The number of bytes of records in the journal."""
+
+        self.count = 0
+        """The number of records in the journal."""
+
+        self.dropped = 0
+        """The number of records that have been discarded."""
+
+        self.dropped_bytes = 0
+        """The total size of the records that have been discarded."""
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Unbuffered, so that reads always see the data written through the window.
+        self._file = self.path.open("w+b", buffering=0)
+        self._file.write(JOURNAL_HEADER.pack(JOURNAL_MAGIC, 0))
+
+        self._window: mmap.mmap | None = None
+        self._window_start = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, record: bytes):
+        """Add a record to the end of the journal."""
+        if self.length + len(record) > self.max_bytes:
+            self.dropped += 1
+            self.dropped_bytes += len(record)
+            return
+
+        position = JOURNAL_HEADER.size + self.length
+        data = memoryview(record)
+
+        while len(data) > 0:
+            window = self._get_window(position)
+            offset = position - self._window_start
+            size = min(len(data), self.window_size - offset)
+
+            window[offset : offset + size] = data[:size]
+            data = data[size:]
+            position += size
+
+        self.length += len(record)
+        self.count += 1
+
+    def read_batches(self, max_bytes: int) -> Iterator[tuple[int, bytes]]:
+        """Read the records in the journal, in batches of up to ``max_bytes`` bytes.
+
+        Records larger than ``max_bytes`` are returned in a batch of their own. Records
+        appended while reading are included.
+
+        Yields
+        ------
+        tuple[int, bytes]
+           The number of records in the batch and the records themselves.
+        """
+        offset = 0
+        while offset < self.length:
+            chunk = self._read(offset, min(max_bytes, self.length - offset))
+
+            count, end = 0, 0
+            while end + RECORD_PREFIX.size <= len(chunk):
+                *_, length = RECORD_PREFIX.unpack_from(chunk, end)
+                if end + RECORD_PREFIX.size + length > len(chunk):
+                    break
+
+                end += RECORD_PREFIX.size + length
+                count += 1
+
+            if count == 0:
+                # The next record is larger than max_bytes.
+                *_, length = RECORD_PREFIX.unpack_from(
+                    self._read(offset, RECORD_PREFIX.size)
+                )
+                chunk = self._read(offset, RECORD_PREFIX.size + length)
+                count, end = 1, len(chunk)
+
+            yield count, chunk[:end]
+            offset += end
+
+    def close(self, delete: bool = True):
+        """Close the journal, deleting the file unless told otherwise."""
+        if self._window is not None:
+            self._window.close()
+            self._window = None
+
+        self._file.truncate(JOURNAL_HEADER.size + self.length)
+        self._file.seek(0)
+        self._file.write(JOURNAL_HEADER.pack(JOURNAL_MAGIC, self.length))
+        self._file.close()
+
+        if delete:
+            self.path.unlink(missing_ok=True)
+
+    def _get_window(self, position: int) -> mmap.mmap:
+        """Return the window containing the given position in the file."""
+        start = position - (position % self.window_size)
+        if self._window is not None and start == self._window_start:
+            return self._window
+
+        if self._window is not None:
+            self._window.close()
+
+        # The file must be large enough to contain the entire window.
+        self._file.truncate(max(start + self.window_size, JOURNAL_HEADER.size))
+        self._window = mmap.mmap(self._file.fileno(), self.window_size, offset=start)
+        self._window_start = start
+
+        return self._window
+
+    def _read(self, offset: int, size: int) -> bytes:
+        self._file.seek(JOURNAL_HEADER.size + offset)
+        return self._file.read(size)
@@ -0,0 +1,200 @@
+"""The metadata the agent attaches to each message it observes.
+
+Each observed message is prefixed with a fixed size binary header, recording where it
+came from and when it was seen, forming a *record*::
+
+   +--------+---------+-----------+---------+---------+--------------+
+   | source | session | timestamp | latency | length  |   message    |
+   | 1 byte | 2 bytes |  8 bytes  | 8 bytes | 4 bytes | length bytes |
+   +--------+---------+-----------+---------+---------+--------------+
+
+The session is an index into the list of session ids the client sends to the server
+when it connects. For responses, the latency is the time (in nanoseconds) between the
+agent seeing the request and seeing the response, otherwise it is ``-1``. All integers
+are big endian.
+
+For compatibility, the metadata can also be expressed as ``Message-*`` headers added to
+the message itself.
+"""
+
+from __future__ import annotations
+
+import struct
+import typing
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+
+import attrs
+
+from .framing import get_header
+
+if typing.TYPE_CHECKING:
+    from collections.abc import Iterator
+    from collections.abc import Sequence
+    from typing import Any
+
+UTC = timezone.utc
+EPOCH = datetime(1970, 1, 1, tzinfo=UTC)
+
+SOURCES = ("client", "server")
+"""The possible sources of a message, indexed by the source byte of a record."""
+
+SOURCE_INDEX = {source: idx for idx, source in enumerate(SOURCES)}
+
+RECORD_PREFIX = struct.Struct("!BHqqI")
+"""The binary prefix of a record: source, session index, timestamp, latency and
+length."""
+
+NO_LATENCY = -1
+"""The latency of messages that are not responses."""
+
+
+@attrs.frozen
+class MessageMetadata:
+    """Information about an observed message."""
+
+    source: str
+    """Where the message came from, either ``client`` or ``server``."""
+
+    session: str
+    """The id of the session the message is a part of."""
+
+    timestamp_ns: int
+    """When the message was seen by the agent, in nanoseconds since the epoch."""
+
+    latency_ns: int | None = None
+    """For responses, the time between the agent seeing the request and seeing the
+    response, in nanoseconds."""
+
+    @property
+    def timestamp(self) -> datetime:
+        """When the message was seen by the agent."""
+        return EPOCH + timedelta(microseconds=self.timestamp_ns // 1000)
+
+    @property
+    def latency(self) -> float | None:
+        """The latency of the response, in milliseconds."""
+        if self.latency_ns is None:
+            return None
+
+        return self.latency_ns / 1_000_000
+
+    @property
+    def headers(self) -> dict[str, Any]:
+        """The metadata, using the same names as the ``Message-*`` headers."""
+        return {
+            "Message-Source": self.source,
+            "Message-Session": self.session,
+            "Message-Timestamp": self.timestamp,
+            "Message-Latency": self.latency,
+        }
+
+    @classmethod
+    def from_headers(cls, frame: bytes) -> MessageMetadata | None:
+        """Read the metadata from the ``Message-*`` headers of the given frame.
+
+        Returns ``None`` if the frame does not have a ``Message-Source`` header.
+
+        Raises
+        ------
+        ValueError
+           If the frame's ``Message-*`` headers are invalid.
+        """
+        if (source := get_header(frame, "Message-Source")) is None:
+            return None
+
+        timestamp_ns = 0
+        if (timestamp := get_header(frame, "Message-Timestamp")) is not None:
+            if (value := datetime.fromisoformat(timestamp)).tzinfo is None:
+                raise ValueError(f"Expected a timestamp with a UTC offset: {timestamp}")
+
+            delta = value - EPOCH
+            timestamp_ns = (delta // timedelta(microseconds=1)) * 1000
+
+        latency_ns = None
+        if (latency := get_header(frame, "Message-Latency")) is not None:
+            latency_ns = int(latency)
+
+        return cls(
+            source=source,
+            session=get_header(frame, "Message-Session") or "",
+            timestamp_ns=timestamp_ns,
+            latency_ns=latency_ns,
+        )
+
+
+def pack_record(
+    source: str,
+    session: int,
+    timestamp_ns: int,
+    message: bytes,
+    latency_ns: int | None = None,
+) -> bytes:
+    """Prefix the given message with its metadata."""
+    prefix = RECORD_PREFIX.pack(
+        SOURCE_INDEX[source],
+        session,
+        timestamp_ns,
+        NO_LATENCY if latency_ns is None else latency_ns,
+        len(message),
+    )
+    return prefix + message
+
+
+def unpack_records(data: bytes) -> Iterator[tuple[int, int, int, int | None, bytes]]:
+    """Iterate over the records in the given data.
+
+    Yields
+    ------
+    tuple[int, int, int, int | None, bytes]
+       The source index, session index, timestamp, latency and message of each record.
+
+    Raises
+    ------
+    ValueError
+       If the data ends with an incomplete record.
+    """
+    offset, end = 0, len(data)
+    while offset < end:
+        if offset + RECORD_PREFIX.size > end:
+            raise ValueError("Incomplete record prefix")
+
+        source, session, timestamp_ns, latency_ns, length = RECORD_PREFIX.unpack_from(
+            data, offset
+        )
+        offset += RECORD_PREFIX.size
+
+        if offset + length > end:
+            raise ValueError("Incomplete record")
+
+        if latency_ns == NO_LATENCY:
+            latency_ns = None
+
+        yield source, session, timestamp_ns, latency_ns, data[offset : offset + length]
+        offset += length
+
+
+def split_records(data: bytes) -> Iterator[bytes]:
+    """Iterate over the records in the given data, without unpacking them."""
+    offset, end = 0, len(data)
+    while offset < end:
+        *_, length = RECORD_PREFIX.unpack_from(data, offset)
+        size = RECORD_PREFIX.size + length
+        yield data[offset : offset + size]
+        offset += size
+
+
+def record_to_frame(record: bytes, sessions: Sequence[str]) -> bytes:
+    """Convert a record into a message with the equivalent ``Message-*`` headers."""
+    source, session, timestamp_ns, latency_ns, _ = RECORD_PREFIX.unpack_from(record)
+    metadata = MessageMetadata(SOURCES[source], sessions[session], timestamp_ns)
+
+    headers = [
+        f"Message-Source: {metadata.source}\r\n",
+        f"Message-Session: {metadata.session}\r\n",
+        f"Message-Timestamp: {metadata.timestamp.isoformat()}\r\n",
+    ]
+    if latency_ns != NO_LATENCY:
+        headers.append(f"Message-Latency: {latency_ns}\r\n")
+    return "".join(headers).encode() + record[RECORD_PREFIX.size :]
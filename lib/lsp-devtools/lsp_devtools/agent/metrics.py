@@ -0,0 +1,255 @@
+"""Metrics describing the agent's own behavior.
+
+Metrics are rendered in the `Prometheus text format
+<https://prometheus.io/docs/instrumenting/exposition_formats/>`__ and can be served
+over HTTP, on either a Unix socket or a TCP port, or written to stderr by sending the
+agent a ``SIGUSR1`` signal.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import logging
+import signal
+import sys
+import threading
+import time
+import typing
+
+if typing.TYPE_CHECKING:
+    from collections.abc import Mapping
+    from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+"""The default histogram buckets, in seconds."""
+
+
+class Counter:
+    """A value that only ever increases, optionally split by a single label.
+
+    Safe to increment from multiple threads, e.g. the agent's own and its observer
+    thread.
+    """
+
+    def __init__(self, name: str, help_: str, label: str | None = None):
+        self.name = name
+        self.help = help_
+        self.label = label
+        self.values: dict[str | None, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, label_value: str | None = None):
+        with self._lock:
+            self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = list(self.values.items())
+
+        for label_value, value in sorted(values, key=_sort_key):
+            lines.append(f"{self.name}{_labels(self.label, label_value)} {value:g}")
+
+        return lines
+
+
+class Gauge:
+    """A value that is read from the given function when rendered.
+
+    If the gauge has a label, the function returns the value for each label value.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help_: str,
+        get_value: Callable[[], float] | Callable[[], Mapping[str, float]],
+        label: str | None = None,
+    ):
+        self.name = name
+        self.help = help_
+        self.label = label
+        self.get_value = get_value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        if self.label is None:
+            lines.append(f"{self.name} {self.get_value():g}")
+            return lines
+
+        values: Mapping[str, float] = self.get_value()  # type: ignore[assignment]
+        for label_value, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.label, label_value)} {value:g}")
+
+        return lines
+
+
+class Histogram:
+    """Counts observations falling into each of the given buckets."""
+
+    def __init__(
+        self,
+        name: str,
+        help_: str,
+        label: str | None = None,
+        buckets: tuple[float, ...] = DURATION_BUCKETS,
+    ):
+        self.name = name
+        self.help = help_
+        self.label = label
+        self.buckets = buckets
+        self.counts: dict[str | None, list[int]] = {}
+        self.sums: dict[str | None, float] = {}
+
+    def observe(self, value: float, label_value: str | None = None):
+        if (counts := self.counts.get(label_value)) is None:
+            counts = self.counts[label_value] = [0] * (len(self.buckets) + 1)
+
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[label_value] = self.sums.get(label_value, 0) + value
+
+    def render(self) -> list[str]:
+        name = self.name
+        lines = [f"# HELP {name} {self.help}", f"# TYPE {name} histogram"]
+
+        for label_value, counts in sorted(self.counts.items(), key=_sort_key):
+            total = 0
+            for bound, count in zip([*self.buckets, "+Inf"], counts):
+                total += count
+                le = f'le="{bound}"'
+                lines.append(
+                    f"{name}_bucket{_labels(self.label, label_value, le)} {total}"
+                )
+
+            labels = _labels(self.label, label_value)
+            lines.append(f"{name}_sum{labels} {self.sums[label_value]:g}")
+            lines.append(f"{name}_count{labels} {total}")
+
+        return lines
+
+
+class Metrics:
+    """A collection of metrics, all sharing a common prefix."""
+
+    def __init__(self, prefix: str = "lsp_devtools_agent"):
+        self.prefix = prefix
+        self.metrics: dict[str, Counter | Gauge | Histogram] = {}
+
+        start = time.monotonic()
+        self.gauge(
+            "uptime_seconds",
+            "Time since the agent started",
+            lambda: time.monotonic() - start,
+        )
+
+    def counter(self, name: str, help_: str, label: str | None = None) -> Counter:
+        """Create a new counter."""
+        return self._add(Counter(f"{self.prefix}_{name}", help_, label))
+
+    def gauge(
+        self,
+        name: str,
+        help_: str,
+        get_value: Callable[[], float] | Callable[[], Mapping[str, float]],
+        label: str | None = None,
+    ) -> Gauge:
+        """Create a new gauge, reading its value(s) from the given function."""
+        return self._add(Gauge(f"{self.prefix}_{name}", help_, get_value, label))
+
+    def histogram(self, name: str, help_: str, label: str | None = None) -> Histogram:
+        """Create a new histogram."""
+        return self._add(Histogram(f"{self.prefix}_{name}", help_, label))
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text format."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+
+        return "\n".join(lines) + "\n"
+
+    def _add(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Duplicate metric: {metric.name!r}")
+
+        self.metrics[metric.name] = metric
+        return metric
+
+
+def _labels(label: str | None, value: str | None, *extra: str) -> str:
+    pairs = [*([f'{label}="{value}"'] if label and value is not None else []), *extra]
+    if len(pairs) == 0:
+        return ""
+
+    return "{" + ",".join(pairs) + "}"
+
+
+def _sort_key(item):
+    return item[0] or ""
+
+
+async def start_metrics_server(
+    metrics: Metrics, address: str
+) -> asyncio.AbstractServer:
+    """Serve the given metrics over HTTP at the given address.
+
+    Parameters
+    ----------
+    metrics
+       The metrics to serve
+
+    address
+       Either ``host:port`` to listen on a TCP port, or the path of a Unix socket.
+    """
+
+    async def handle_request(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        try:
+            # We serve the same response for every request, but wait for the
+            # request headers so that clients do not see the connection reset.
+            await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+
+        body = metrics.render().encode("utf8")
+        writer.write(
+            b"HTTP/1.0 200 OK\r\n"
+            b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            + f"Content-Length: {len(body)}\r\n\r\n".encode()
+            + body
+        )
+
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return await asyncio.start_server(
+            handle_request, host or "localhost", int(port)
+        )
+
+    return await asyncio.start_unix_server(handle_request, address)
+
+
+def dump_on_signal(metrics: Metrics):
+    """Write the given metrics to stderr whenever the process receives ``SIGUSR1``.
+
+    Does nothing on platforms without ``SIGUSR1``.
+    """
+    if (sigusr1 := getattr(signal, "SIGUSR1", None)) is None:
+        return
+
+    def dump():
+        sys.stderr.write(metrics.render())
+        sys.stderr.flush()
+
+    try:
+        asyncio.get_running_loop().add_signal_handler(sigusr1, dump)
+    except (NotImplementedError, RuntimeError):
+        logger.debug("Unable to install SIGUSR1 handler", exc_info=True)
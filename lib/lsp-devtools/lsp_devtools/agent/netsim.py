@@ -0,0 +1,172 @@
+"""Simulate a slow network link between the client and server.
+
+Each direction has its own :class:`SimulatedLink`, which delays messages according to
+the given :class:`LinkConditions`. A link is modelled as a pipe with a limited bandwidth
+followed by a fixed latency (plus random jitter). Messages are always delivered in the
+order they were sent, as they would be over a TCP connection.
+
+As with a real connection, only so much can be in flight at once, once a link is full
+the sender is made to wait for messages to be delivered.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import random
+import typing
+
+import attrs
+
+from .scan import is_notification
+
+if typing.TYPE_CHECKING:
+    from typing import Protocol
+
+    class Writer(Protocol):
+        def write(self, data: bytes) -> None: ...
+
+        def is_closing(self) -> bool: ...
+
+
+MAX_PENDING = 1024
+"""The maximum number of messages waiting to be delivered by a link, before the sender
+has to wait."""
+
+
+@attrs.define
+class LinkConditions:
+    """The conditions of a simulated network link."""
+
+    latency: float = attrs.field(default=0.0)
+    """The time (in seconds) added to the delivery of every message."""
+
+    jitter: float = attrs.field(default=0.0)
+    """The maximum random time (in seconds) added on top of the latency."""
+
+    bandwidth: float = attrs.field(default=0.0)
+    """The maximum number of bytes per second that can be sent, ``0`` for no limit."""
+
+    notifications_only: bool = attrs.field(default=False)
+    """If set, only notifications are delayed. Other messages are still never delivered
+    ahead of the notifications sent before them."""
+
+    @property
+    def is_empty(self) -> bool:
+        """``True`` if these conditions do not delay any messages."""
+        return self.latency <= 0 and self.jitter <= 0 and self.bandwidth <= 0
+
+
+class SimulatedLink:
+    """Delays the messages sent in a single direction.
+
+    Parameters
+    ----------
+    conditions
+       The conditions to simulate.
+
+    seed
+       If given, used to seed the random number generator used for jitter.
+
+    max_pending
+       The maximum number of messages waiting to be delivered, beyond this
+       :meth:`drain` waits for space to become available.
+    """
+
+    def __init__(
+        self,
+        conditions: LinkConditions,
+        seed: int | None = None,
+        max_pending: int = MAX_PENDING,
+    ):
+        self.conditions = conditions
+        self.max_pending = max_pending
+        self._random = random.Random(seed)  # noqa: S311
+        self._busy_until = 0.0
+        self._last_delivery = 0.0
+        self._pending: collections.deque[tuple[float, Writer, bytes]] = (
+            collections.deque()
+        )
+        self._timer: asyncio.TimerHandle | None = None
+        self._space: asyncio.Future[None] | None = None
+        """Resolved once there is space for more messages."""
+
+    def __len__(self) -> int:
+        """The number of messages waiting to be delivered."""
+        return len(self._pending)
+
+    def delivery_time(self, message: bytes, now: float) -> float:
+        """Return the time the given message, sent at ``now``, should be delivered."""
+        conditions = self.conditions
+        when = now
+
+        if not conditions.notifications_only or is_notification(message):
+            if conditions.bandwidth > 0:
+                self._busy_until = max(now, self._busy_until)
+                self._busy_until += len(message) / conditions.bandwidth
+                when = self._busy_until
+
+            when += conditions.latency + self._random.uniform(0, conditions.jitter)
+
+        # Never overtake an earlier message.
+        when = max(when, self._last_delivery)
+        self._last_delivery = when
+        return when
+
+    def send(self, dest: Writer, message: bytes):
+        """Write the given message to ``dest``, once the simulated delay has passed.
+
+        Like writing to a stream, this never waits. Call :meth:`drain` afterwards to
+        wait for the link to have space for more messages.
+        """
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        when = self.delivery_time(message, now)
+
+        if when <= now and len(self._pending) == 0:
+            dest.write(message)
+            return
+
+        self._pending.append((when, dest, message))
+        if self._timer is None:
+            self._timer = loop.call_at(self._pending[0][0], self._deliver)
+
+    async def drain(self):
+        """Wait until the link has space for more messages."""
+        while len(self._pending) >= self.max_pending:
+            if self._space is None:
+                self._space = asyncio.get_running_loop().create_future()
+
+            await asyncio.shield(self._space)
+
+    def close(self):
+        """Discard any messages yet to be delivered."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        self._pending.clear()
+        self._wake_senders()
+
+    def _wake_senders(self):
+        """Wake anything waiting for space, if there is any."""
+        if self._space is not None and len(self._pending) < self.max_pending:
+            if not self._space.done():
+                self._space.set_result(None)
+
+            self._space = None
+
+    def _deliver(self):
+        """Deliver every message that is due, in order."""
+        self._timer = None
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+
+        while len(self._pending) > 0 and self._pending[0][0] <= now:
+            _, dest, message = self._pending.popleft()
+            if not dest.is_closing():
+                dest.write(message)
+
+        self._wake_senders()
+        if len(self._pending) > 0:
+            self._timer = loop.call_at(self._pending[0][0], self._deliver)
@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import asyncio
+import collections
+import inspect
+import threading
+import typing
+
+import attrs
+
+from .scan import is_notification
+
+if typing.TYPE_CHECKING:
+    import concurrent.futures
+    from collections.abc import Coroutine
+    from typing import Any
+    from typing import Callable
+    from typing import Literal
+    from typing import TypeVar
+    from typing import Union
+
+    T = TypeVar("T")
+    OverflowPolicy = Literal["block", "drop-oldest", "drop-notifications"]
+    ObservationHandler = Callable[
+        ["Observation"], Union[None, Coroutine[Any, Any, None]]
+    ]
+
+OVERFLOW_POLICIES = ["block", "drop-oldest", "drop-notifications"]
+
+MAX_PENDING = 65536
+"""The maximum number of messages waiting to be observed by an observer thread."""
+
+
+@attrs.define
+class Observation:
+    """A message seen by the agent, waiting to be passed onto the message handler."""
+
+    source: str
+    """Where the message came from, either ``client`` or ``server``."""
+
+    timestamp: int
+    """When the agent saw the message, in nanoseconds since the epoch."""
+
+    message: bytes
+    """The message itself."""
+
+    latency: int | None = None
+    """If the message is a response, the time since the agent saw the request, in
+    nanoseconds."""
+
+    truncated: bool = False
+    """Set if the message has already been truncated to the agent's record size
+    limit."""
+
+
+class ObservationQueue:
+    """A bounded queue of observed messages.
+
+    Decouples the agent's forwarding of messages from the (potentially slow) handling
+    of them. Should the queue be full, the consumer is given the chance to catch up
+    before the overflow policy is applied
+
+    ``block``
+       Wait for space to become available, no messages are lost.
+
+    ``drop-oldest``
+       Discard the oldest message in the queue to make space for the new one.
+
+    ``drop-notifications``
+       Discard the new message if it is a notification, otherwise wait for space to
+       become available.
+    """
+
+    def __init__(self, maxsize: int = 1024, overflow: OverflowPolicy = "block"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow!r}")
+
+        self.overflow = overflow
+        self.dropped = 0
+        """The number of messages that have been discarded."""
+
+        self._queue: asyncio.Queue[Observation] = asyncio.Queue(maxsize)
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+    async def put(self, item: Observation):
+        """Add an item to the queue, applying the overflow policy if necessary."""
+        if self.overflow == "block":
+            await self._queue.put(item)
+            return
+
+        if self._try_put(item):
+            return
+
+        # A full queue may only mean the consumer has not had the chance to run yet, so
+        # let it catch up before resorting to the overflow policy.
+        await asyncio.sleep(0)
+        if self._try_put(item):
+            return
+
+        if self.overflow == "drop-oldest":
+            self._queue.get_nowait()
+            self._queue.put_nowait(item)
+            self.dropped += 1
+
+        elif is_notification(item.message):
+            self.dropped += 1
+
+        else:
+            await self._queue.put(item)
+
+    def _try_put(self, item: Observation) -> bool:
+        """Add an item to the queue if there is space, returning ``True`` if added."""
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def get(self) -> Observation:
+        """Remove and return the next item in the queue."""
+        return await self._queue.get()
+
+    def get_nowait(self) -> Observation | None:
+        """Remove and return the next item in the queue, if available."""
+        try:
+            return self._queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return None
+
+
+class ObserverThread:
+    """Observes messages on a dedicated thread, running its own event loop.
+
+    The thread forwarding messages only hands them over in batches, it never waits for
+    them to be observed. Anything the handler needs, such as connections to agent
+    servers, should be started on the observer's loop with :meth:`submit`.
+
+    Parameters
+    ----------
+    maxsize
+       The maximum number of messages waiting to be observed, beyond this the oldest
+       messages are discarded.
+    """
+
+    def __init__(self, maxsize: int = MAX_PENDING):
+        self.maxsize = maxsize
+        self.dropped = 0
+        """The number of messages that have been discarded."""
+
+        self.handler: ObservationHandler | None = None
+        """Called with each message on the observer's thread, if it returns a coroutine
+        it is run as a task on the observer's loop."""
+
+        self.loop = asyncio.new_event_loop()
+        self._pending: collections.deque[Observation] = collections.deque()
+        self._lock = threading.Lock()
+        self._scheduled = False
+        self._tasks: set[asyncio.Task] = set()
+        self._thread = threading.Thread(
+            target=self._run, name="lsp-devtools-observer", daemon=True
+        )
+
+    def __len__(self) -> int:
+        """The number of messages waiting to be observed."""
+        return len(self._pending)
+
+    def start(self):
+        """Start the observer's thread."""
+        self._thread.start()
+
+    def submit(self, coro: Coroutine[Any, Any, T]) -> concurrent.futures.Future[T]:
+        """Run the given coroutine on the observer's loop."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def run(self, coro: Coroutine[Any, Any, T]) -> T:
+        """Run the given coroutine on the observer's loop, waiting for the result."""
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def put(self, items: list[Observation]):
+        """Hand the given messages over to be observed, may be called from any thread.
+
+        The observer is only woken once for all the messages handed over before it gets
+        the chance to run.
+        """
+        with self._lock:
+            self._pending.extend(items)
+            while len(self._pending) > self.maxsize:
+                self._pending.popleft()
+                self.dropped += 1
+
+            if self._scheduled:
+                return
+
+            self._scheduled = True
+
+        self.loop.call_soon_threadsafe(self._process)
+
+    async def flush(self):
+        """Wait for every message handed over so far to be observed."""
+        await self.run(self._flush())
+
+    async def stop(self):
+        """Observe any remaining messages, then stop the observer's thread."""
+        if not self._thread.is_alive():
+            return
+
+        await self.flush()
+        await self.run(self._cancel_tasks())
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        await asyncio.get_running_loop().run_in_executor(None, self._thread.join)
+        self.loop.close()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def _process(self):
+        with self._lock:
+            items = list(self._pending)
+            self._pending.clear()
+            self._scheduled = False
+
+        if self.handler is None:
+            return
+
+        for item in items:
+            if inspect.iscoroutine(res := self.handler(item)):
+                task = self.loop.create_task(res)
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self):
+        self._process()
+
+    async def _cancel_tasks(self):
+        for task in self._tasks:
+            task.cancel()
@@ -0,0 +1,243 @@
+"""Reduce the size of recorded messages, by removing the parts we rarely look at.
+
+A policy is written as ``METHOD:PATH=ACTION`` and applies to every message associated
+with ``METHOD`` (``*`` for every method), responses are associated with the method of
+their request. ``PATH`` is a dotted path into the message, starting from its
+``params``, ``result`` or ``error`` member, where ``*`` matches every item of an
+array or every member of an object. ``ACTION`` is one of
+
+``drop``
+   Remove the value entirely.
+
+``hash``
+   Replace the value with ``"sha256:<hex digest>"``, so that it can still be compared
+   with other values.
+
+``truncate:N``
+   Truncate the value to (at most) ``N`` bytes. Non-string values longer than ``N``
+   bytes once encoded are replaced with their truncated JSON encoding.
+
+For example::
+
+   textDocument/didOpen:params.textDocument.text=hash
+   textDocument/completion:result.items.*.documentation=drop
+
+Messages are only ever decoded if there is a policy for their method.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import typing
+
+import attrs
+
+from lsp_devtools import codec
+
+from .scan import body_offset
+from .scan import scan_routing_fields
+
+if typing.TYPE_CHECKING:
+    from typing import Any
+
+    from .scan import RoutingFields
+
+ACTIONS = ["drop", "hash", "truncate:N"]
+
+ROOTS = frozenset({"params", "result", "error"})
+"""The members of a message a policy's path can start from."""
+
+ANY = "*"
+"""Matches any method, or any item in a path."""
+
+
+@attrs.define
+class Policy:
+    """How to reduce a single value in the messages associated with a method."""
+
+    method: str
+    """The method the policy applies to, ``*`` for every method."""
+
+    path: tuple[str, ...]
+    """The path to the value, starting from the message's ``params``, ``result`` or
+    ``error`` member."""
+
+    action: str
+    """What to do to the value, one of ``drop``, ``hash`` or ``truncate``."""
+
+    size: int = attrs.field(default=0)
+    """The number of bytes to truncate the value to."""
+
+    @classmethod
+    def parse(cls, spec: str) -> Policy:
+        """Parse a policy from a string of the form ``METHOD:PATH=ACTION``.
+
+        Raises
+        ------
+        ValueError
+           If the policy is invalid.
+        """
+        target, _, action = spec.rpartition("=")
+        method, _, path = target.rpartition(":")
+        if not method or not path or not action:
+            raise ValueError(f"Expected METHOD:PATH=ACTION, got {spec!r}")
+
+        keys = tuple(path.split("."))
+        if keys[0] not in ROOTS or "" in keys:
+            raise ValueError(
+                f"Path must start with one of {', '.join(sorted(ROOTS))}, got {path!r}"
+            )
+
+        name, _, size = action.partition(":")
+        if name in {"drop", "hash"} and not size:
+            return cls(method, keys, name)
+
+        if name == "truncate" and size.isdigit():
+            return cls(method, keys, name, int(size))
+
+        raise ValueError(
+            f"Expected one of {', '.join(ACTIONS)} as the action, got {action!r}"
+        )
+
+    @property
+    def applies_to_responses(self) -> bool:
+        """``True`` if the policy applies to response messages."""
+        return self.path[0] != "params"
+
+    def apply(self, body: dict[str, Any]) -> bool:
+        """Apply the policy to the given message body, returning ``True`` if it was
+        modified."""
+        return self._apply(body, 0)
+
+    def _apply(self, node: Any, depth: int) -> bool:
+        key = self.path[depth]
+        keys: list[Any]
+
+        if isinstance(node, dict):
+            keys = list(node) if key == ANY else [key] if key in node else []
+        elif isinstance(node, list):
+            if key == ANY:
+                keys = list(range(len(node)))
+            else:
+                keys = [int(key)] if key.isdigit() and int(key) < len(node) else []
+        else:
+            return False
+
+        modified = False
+        if depth < len(self.path) - 1:
+            for k in keys:
+                modified |= self._apply(node[k], depth + 1)
+
+            return modified
+
+        # Delete from the end, so that the indices of the remaining items are unchanged.
+        for k in reversed(keys):
+            if self.action == "drop":
+                del node[k]
+                modified = True
+            elif (value := self._reduce(node[k])) is not node[k]:
+                node[k] = value
+                modified = True
+
+        return modified
+
+    def _reduce(self, value: Any) -> Any:
+        """Return the reduced version of the given value, or the value itself if it
+        does not need reducing."""
+        data = (
+            value.encode("utf8")
+            if isinstance(value, str)
+            else codec.dumps(value).encode("utf8")
+        )
+
+        if self.action == "hash":
+            return f"sha256:{hashlib.sha256(data).hexdigest()}"
+
+        if len(data) <= self.size:
+            return value
+
+        return data[: self.size].decode("utf8", errors="ignore")
+
+
+class RecordPolicies:
+    """Applies policies to the messages passed through the agent, before they are
+    recorded.
+
+    Parameters
+    ----------
+    policies
+       The policies to apply.
+    """
+
+    def __init__(self, policies: list[Policy]):
+        self.policies: dict[str, list[Policy]] = {}
+        for policy in policies:
+            self.policies.setdefault(policy.method, []).append(policy)
+
+        self._response_methods = {
+            policy.method for policy in policies if policy.applies_to_responses
+        }
+        """The methods with policies that apply to their responses."""
+
+        self._response_method_map: dict[tuple[str, int | str], str] = {}
+        """Used to determine the method for response messages"""
+
+    def apply(self, source: str, message: bytes) -> bytes:
+        """Return the message to record for the given message, with any policies for
+        its method applied."""
+        try:
+            start = body_offset(message)
+            fields = scan_routing_fields(message, start)
+        except ValueError:
+            return message
+
+        if (method := self._get_message_method(source, fields)) is None:
+            return message
+
+        policies = self.policies.get(method, []) + self.policies.get(ANY, [])
+        if len(policies) == 0:
+            return message
+
+        try:
+            body = codec.loads(message[start:])
+        except ValueError:
+            return message
+
+        modified = False
+        for policy in policies:
+            modified |= policy.apply(body)
+
+        if not modified:
+            return message
+
+        data = codec.dumps(body).encode("utf8")
+        return b"Content-Length: %d\r\n\r\n%s" % (len(data), data)
+
+    def track(self, source: str, message: bytes):
+        """Note the method of the given message without applying any policies.
+
+        Used for messages that will not be recorded, so that the responses to any
+        requests among them are still associated with the right method.
+        """
+        try:
+            fields = scan_routing_fields(message, body_offset(message))
+        except ValueError:
+            return
+
+        self._get_message_method(source, fields)
+
+    def _get_message_method(self, source: str, fields: RoutingFields) -> str | None:
+        if fields.method is not None:
+            if fields.id is not None and (
+                ANY in self._response_methods or fields.method in self._response_methods
+            ):
+                self._response_method_map[(source, fields.id)] = fields.method
+
+            return fields.method
+
+        if fields.id is None:
+            return None
+
+        # Responses are sent by the opposite side to the one that sent the request
+        request_source = "server" if source == "client" else "client"
+        return self._response_method_map.pop((request_source, fields.id), None)
@@ -1,7 +1,87 @@
 from __future__ import annotations
 
+import asyncio
+import typing
+
 from pygls.protocol import JsonRPCProtocol
 
+from lsp_devtools.agent.envelope import DROPPED
+from lsp_devtools.agent.envelope import HELLO
+from lsp_devtools.agent.envelope import negotiate_compression
+from lsp_devtools.agent.ring import RING
+from lsp_devtools.agent.ring import RingBuffer
+
+if typing.TYPE_CHECKING:
+    from typing import Any
+
+    from cattrs import Converter
+
+    from lsp_devtools.agent.server import AgentServer
+
 
 class AgentProtocol(JsonRPCProtocol):
     """The RPC protocol exposed by the agent."""
+
+
+class AgentServerProtocol(AgentProtocol):
+    """The server side of the agent's protocol.
+
+    The ``AgentServer`` creates an instance of this protocol for each connected agent,
+    holding the state of that connection.
+    """
+
+    _server: AgentServer
+
+    def __init__(self, server: AgentServer, converter: Converter):
+        super().__init__(server, converter)
+
+        self.sessions: list[str] = []
+        """The session ids used by the connected agent, indexed by records."""
+
+        self.ring: RingBuffer | None = None
+        """The shared-memory ring the agent sends records through, if any."""
+
+        self.doorbell = asyncio.Event()
+        """Set when the ring is created, and whenever the agent has written to it."""
+
+        self.fm.add_builtin_feature(HELLO, self.on_hello)
+        self.fm.add_builtin_feature(DROPPED, self.on_dropped)
+        self.fm.add_builtin_feature(RING, self.on_ring)
+
+    def on_hello(self, params: Any):
+        """Agree on how messages should be sent by the agent."""
+        compression = negotiate_compression(getattr(params, "compression", []))
+        metadata = getattr(params, "metadata", None)
+        if metadata == "binary":
+            self.sessions = list(getattr(params, "sessions", []))
+
+        # Records in the ring are always binary.
+        ring_size = self._server.ring_size
+        if metadata == "binary" and getattr(params, "ring", False) and ring_size > 0:
+            try:
+                self.ring = RingBuffer.create(ring_size)
+                self.doorbell.set()
+            except OSError:
+                self._server.logger.warning("Unable to create ring", exc_info=True)
+
+        self.notify(
+            HELLO,
+            {
+                "batch": getattr(params, "batch", False),
+                "compression": compression,
+                "metadata": "binary" if metadata == "binary" else None,
+                "ring": self.ring.name if self.ring is not None else None,
+            },
+        )
+
+    def on_dropped(self, params: Any):
+        """Report the messages the agent was unable to send."""
+        self._server.logger.warning(
+            "Agent discarded %d message(s) (%d bytes) while waiting to connect",
+            getattr(params, "messages", 0),
+            getattr(params, "bytes", 0),
+        )
+
+    def on_ring(self, params: Any):
+        """Called when the agent has written to the ring."""
+        self.doorbell.set()
@@ -0,0 +1,208 @@
+"""A shared-memory ring buffer, used to pass records from an agent to an agent server
+running on the same host without going through a socket.
+
+The ring is created by the server and has a single producer (the agent) and a single
+consumer (the server). It starts with a small header, followed by the data region::
+
+   +---------+---------+---------+---------+-----------------------------+
+   |  head   |  tail   | waiting | padding |            data             |
+   | 8 bytes | 8 bytes | 4 bytes |         |       capacity bytes        |
+   +---------+---------+---------+---------+-----------------------------+
+
+``head`` is the total number of bytes ever written by the producer and ``tail`` the
+total number of bytes ever consumed by the consumer, each only ever written by one side.
+Records (see :mod:`lsp_devtools.agent.metadata`, each starts with its own length) are
+copied into the data region as-is, wrapping around at the end. Each side only publishes
+its counter once it is done with the bytes it covers: ``head`` is advanced after a
+record has been written in full, ``tail`` after the consumer has handled the records it
+read, so an empty ring tells the producer that everything it wrote has been received.
+
+This relies on each side's writes to the shared memory becoming visible to the other in
+the order they were made. Python offers no memory barriers, so that is only guaranteed
+on strongly ordered CPUs such as x86-64. Elsewhere (e.g. ARM) a record could be seen
+before it is complete, the consumer then fails to decode it and the records read along
+with it are skipped, so no guarantee is made that records are never lost.
+
+Before the consumer goes to sleep it sets ``waiting``, the producer clears it again
+after writing and rings a doorbell (a ``$/lsp-devtools/ring`` notification, sent over
+the agent's existing connection), so that the socket is only used when the consumer
+actually needs waking up.
+"""
+
+from __future__ import annotations
+
+import struct
+import typing
+
+try:
+    from multiprocessing import resource_tracker
+    from multiprocessing import shared_memory
+except ImportError:  # pragma: no cover
+    shared_memory = None  # type: ignore[assignment]
+
+if typing.TYPE_CHECKING:
+    from multiprocessing.shared_memory import SharedMemory
+
+RING = "$/lsp-devtools/ring"
+"""The method name used by the agent to wake the server once it has written to the
+ring."""
+
+RING_SIZE = 16 * 1024 * 1024
+"""The default capacity of the ring, in bytes."""
+
+HEADER_SIZE = 64
+"""The size of the ring's header, keeping the data region cache line aligned."""
+
+_U64 = struct.Struct("=Q")
+_U32 = struct.Struct("=I")
+
+_HEAD = 0
+_TAIL = 8
+_WAITING = 16
+
+
+def is_available() -> bool:
+    """Return ``True`` if shared memory is supported on this platform."""
+    return shared_memory is not None
+
+
+class RingBuffer:
+    """A single producer, single consumer ring buffer in shared memory.
+
+    Use :meth:`create` or :meth:`attach` rather than constructing this directly.
+    """
+
+    def __init__(self, shm: SharedMemory, owner: bool):
+        self.shm = shm
+        self.owner = owner
+
+        self.capacity = shm.size - HEADER_SIZE
+        """The size of the data region, records larger than this cannot be sent."""
+
+        self._buf = shm.buf
+
+    @classmethod
+    def create(cls, capacity: int = RING_SIZE) -> RingBuffer:
+        """Create a new ring, with room for ``capacity`` bytes of records.
+
+        Raises
+        ------
+        OSError
+           If the shared memory could not be created.
+        """
+        if shared_memory is None:
+            raise OSError("Shared memory is not supported on this platform")
+
+        shm = shared_memory.SharedMemory(create=True, size=HEADER_SIZE + capacity)
+        shm.buf[:HEADER_SIZE] = bytes(HEADER_SIZE)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> RingBuffer:
+        """Attach to the ring with the given name, created by another process.
+
+        Raises
+        ------
+        OSError
+           If the shared memory could not be opened.
+        """
+        if shared_memory is None:
+            raise OSError("Shared memory is not supported on this platform")
+
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)  # type: ignore[call-arg]
+        except TypeError:
+            # Before Python 3.13, attaching registers the memory with the resource
+            # tracker, which would destroy it when this process exits.
+            register = resource_tracker.register
+
+            def register_untracked(name: str, rtype: str):
+                if rtype != "shared_memory":
+                    register(name, rtype)
+
+            setattr(resource_tracker, "register", register_untracked)  # noqa: B010
+            try:
+                shm = shared_memory.SharedMemory(name=name)
+            finally:
+                setattr(resource_tracker, "register", register)  # noqa: B010
+
+        return cls(shm, owner=False)
+
+    @property
+    def name(self) -> str:
+        """The name other processes can use to attach to this ring."""
+        return self.shm.name
+
+    @property
+    def waiting(self) -> bool:
+        """``True`` if the consumer is waiting to be woken up."""
+        return _U32.unpack_from(self._buf, _WAITING)[0] != 0
+
+    @waiting.setter
+    def waiting(self, value: bool):
+        _U32.pack_into(self._buf, _WAITING, int(value))
+
+    def __len__(self) -> int:
+        """The number of bytes waiting to be read."""
+        return self._get(_HEAD) - self._get(_TAIL)
+
+    def write(self, data: bytes) -> bool:
+        """Write the given data to the ring.
+
+        Returns ``False`` without writing anything, if there is not enough space.
+        """
+        head, tail = self._get(_HEAD), self._get(_TAIL)
+        size = len(data)
+        if size > self.capacity - (head - tail):
+            return False
+
+        start = HEADER_SIZE + head % self.capacity
+        first = min(size, self.capacity - (start - HEADER_SIZE))
+        self._buf[start : start + first] = data[:first]
+        if first < size:
+            self._buf[HEADER_SIZE : HEADER_SIZE + size - first] = data[first:]
+
+        # Only publish the record once it has been written in full.
+        self._set(_HEAD, head + size)
+        return True
+
+    def read(self) -> bytes:
+        """Read everything that is currently in the ring."""
+        data = self.peek()
+        self.consume(len(data))
+        return data
+
+    def peek(self) -> bytes:
+        """Return everything that is currently in the ring, without consuming it."""
+        head, tail = self._get(_HEAD), self._get(_TAIL)
+        if (size := head - tail) == 0:
+            return b""
+
+        start = HEADER_SIZE + tail % self.capacity
+        first = min(size, self.capacity - (start - HEADER_SIZE))
+        data = bytes(self._buf[start : start + first])
+        if first < size:
+            data += bytes(self._buf[HEADER_SIZE : HEADER_SIZE + size - first])
+
+        return data
+
+    def consume(self, size: int):
+        """Free the given number of bytes, from the start of the ring.
+
+        Only call this once done with the bytes, the producer is free to overwrite them
+        as soon as they are consumed.
+        """
+        self._set(_TAIL, self._get(_TAIL) + size)
+
+    def close(self):
+        """Detach from the ring, destroying it if we created it."""
+        self.shm.close()
+
+        if self.owner:
+            self.shm.unlink()
+
+    def _get(self, offset: int) -> int:
+        return _U64.unpack_from(self._buf, offset)[0]
+
+    def _set(self, offset: int, value: int):
+        _U64.pack_into(self._buf, offset, value)
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import json
+import re
+import typing
+
+import attrs
+
+if typing.TYPE_CHECKING:
+    from typing import Union
+
+    Buffer = Union[bytes, bytearray]
+
+STRING = rb'"[^"\\]*(?:\\.[^"\\]*)*"'
+
+MEMBER_PATTERN = re.compile(rb"\s*[{,]\s*(" + STRING + rb")\s*:\s*")
+"""Matches the start of an object member, up to the start of its value."""
+
+SCALAR_PATTERN = re.compile(
+    rb"(" + STRING + rb"|-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|null|true|false)\s*"
+)
+"""Matches a scalar JSON value."""
+
+WHITESPACE = b" \t\r\n"
+
+ROUTING_KEYS = frozenset({"id", "method"})
+"""The top-level fields whose values are extracted while scanning."""
+
+
+@attrs.define
+class RoutingFields:
+    """The fields of a JSON-RPC message required to route it, found without decoding
+    the full message."""
+
+    keys: set[str] = attrs.field(factory=set)
+    """The top-level keys present in the message."""
+
+    id: int | str | None = attrs.field(default=None)
+    """The message's ``id``, if present."""
+
+    method: str | None = attrs.field(default=None)
+    """The message's ``method``, if present."""
+
+    @property
+    def message_type(self) -> str:
+        """The type of the message, one of ``request``, ``result``, ``error`` or
+        ``notification``."""
+        if "id" in self.keys:
+            if "error" in self.keys:
+                return "error"
+            elif "method" in self.keys:
+                return "request"
+            else:
+                return "result"
+        else:
+            return "notification"
+
+
+def scan_routing_fields(data: Buffer, start: int = 0) -> RoutingFields:
+    """Scan the JSON-RPC message starting at ``start`` for its routing fields.
+
+    Only the top-level keys, along with the values of the ``id`` and ``method`` fields
+    are extracted. Since at most one top-level member of a JSON-RPC message
+    (``params``, ``result`` or ``error``) can be an object or array, that value is
+    never inspected. Instead, the scalar members that precede it are scanned
+    forwards from the start of the message, while those that follow it are scanned
+    backwards from the end, making the cost independent of the size of the payload.
+
+    Raises
+    ------
+    ValueError
+       If the data does not contain a JSON object.
+    """
+    fields = RoutingFields()
+    if (pos := _scan_forwards(fields, data, start)) >= 0:
+        _scan_backwards(fields, data, pos)
+
+    return fields
+
+
+def scan_truncated_fields(head: Buffer, tail: Buffer, start: int = 0) -> RoutingFields:
+    """Scan for the routing fields of a JSON-RPC message, given only its first and
+    last few bytes.
+
+    The members found scanning forwards from ``start`` in ``head`` and backwards from
+    the end of ``tail`` are returned, up to wherever the data could no longer be
+    scanned. Unlike :func:`scan_routing_fields` this never raises an error.
+    """
+    fields = RoutingFields()
+    try:
+        if _scan_forwards(fields, head, start) < 0:
+            return fields
+    except ValueError:
+        pass
+
+    try:
+        _scan_backwards(fields, tail, 0)
+    except ValueError:
+        pass
+
+    return fields
+
+
+def _scan_forwards(fields: RoutingFields, data: Buffer, pos: int) -> int:
+    """Scan forwards from ``pos`` until we find a member with a non-scalar value,
+    returning the index of its value or ``-1`` if we reach the end of the object."""
+    while (member := MEMBER_PATTERN.match(data, pos)) is not None:
+        key = _add_key(fields, data[member.start(1) : member.end(1)])
+        pos = member.end()
+
+        if pos < len(data) and data[pos] in {0x7B, 0x5B}:  # '{' or '['
+            return pos
+
+        # A scalar is always followed by something, if not the data is incomplete and
+        # the value may be a prefix of the real one.
+        value = SCALAR_PATTERN.match(data, pos)
+        if value is None or value.end() >= len(data):
+            raise ValueError(f"Invalid value for {key!r} at index {pos}")
+
+        _set_value(fields, key, data[value.start(1) : value.end(1)])
+        pos = value.end()
+
+    if data[pos : pos + 1] == b"}" or data[pos : pos + 2] == b"{}":
+        return -1
+
+    raise ValueError(f"Unable to find a JSON object at index {pos}")
+
+
+def _scan_backwards(fields: RoutingFields, data: Buffer, pos: int):
+    """Scan backwards from the end of the message, until we reach the end of the
+    non-scalar value starting at ``pos``."""
+    end = _skip_whitespace(data, len(data) - 1)
+    if end <= pos or data[end] != 0x7D:  # '}'
+        raise ValueError("Unable to find the end of the JSON object")
+
+    while (end := _skip_whitespace(data, end - 1)) > pos:
+        if data[end] in {0x7D, 0x5D}:  # '}' or ']'
+            return
+
+        value_start = _find_value_start(data, pos, end)
+        colon = _skip_whitespace(data, value_start - 1)
+        key_end = _skip_whitespace(data, colon - 1)
+
+        if data[colon] != 0x3A or data[key_end] != 0x22:  # ':' or '"'
+            raise ValueError(f"Invalid object member at index {value_start}")
+
+        key_start = _find_string_start(data, pos, key_end)
+        key = _add_key(fields, data[key_start : key_end + 1])
+        _set_value(fields, key, data[value_start : end + 1])
+
+        end = _skip_whitespace(data, key_start - 1)
+        if data[end] != 0x2C:  # ','
+            raise ValueError(f"Expected ',' at index {end}")
+
+    raise ValueError("Unable to find the end of the JSON object")
+
+
+def _add_key(fields: RoutingFields, data: Buffer) -> str:
+    key = json.loads(data)
+    fields.keys.add(key)
+    return key
+
+
+def _set_value(fields: RoutingFields, key: str, data: Buffer):
+    if key in ROUTING_KEYS:
+        setattr(fields, key, json.loads(data))
+
+
+def _skip_whitespace(data: Buffer, idx: int) -> int:
+    """Return the index of the first non-whitespace character at or before ``idx``"""
+    while idx > 0 and data[idx] in WHITESPACE:
+        idx -= 1
+
+    return idx
+
+
+def _find_string_start(data: Buffer, start: int, end: int) -> int:
+    """Return the index of the opening quote of the string ending at ``end``."""
+    idx = end
+    while (idx := data.rfind(b'"', start, idx)) >= 0:
+        # Only escaped quotes are permitted within a string, so the opening quote is
+        # the first one not preceded by an odd number of backslashes.
+        backslash = idx - 1
+        while data[backslash] == 0x5C:  # '\'
+            backslash -= 1
+
+        if (idx - backslash) % 2 == 1:
+            return idx
+
+    raise ValueError(f"Unable to find the start of the string ending at {end}")
+
+
+def _find_value_start(data: Buffer, start: int, end: int) -> int:
+    """Return the index of the first character of the scalar ending at ``end``."""
+    if data[end] == 0x22:  # '"'
+        return _find_string_start(data, start, end)
+
+    idx = end
+    while idx > start and data[idx - 1] not in b" \t\r\n:":
+        idx -= 1
+
+    return idx
+
+
+def body_offset(frame: Buffer) -> int:
+    """Return the index of the first byte of the body in the given frame."""
+    if (idx := frame.find(b"\r\n\r\n")) < 0:
+        raise ValueError("Missing message body")
+
+    return idx + 4
+
+
+def is_notification(frame: Buffer) -> bool:
+    """Return ``True`` if the given frame contains a JSON-RPC notification."""
+    try:
+        return "id" not in scan_routing_fields(frame, body_offset(frame)).keys
+    except ValueError:
+        return False
@@ -1,57 +1,261 @@
 from __future__ import annotations
 
 import asyncio
-import json
+import inspect
 import logging
+import pathlib
 import traceback
 import typing
+from functools import partial
 
 from pygls.protocol import default_converter
 from pygls.server import JsonRPCServer
 
+from lsp_devtools import codec
 from lsp_devtools.agent.agent import aio_readline
-from lsp_devtools.agent.protocol import AgentProtocol
-from lsp_devtools.database import Database
+from lsp_devtools.agent.envelope import BATCH_CONTENT_TYPE
+from lsp_devtools.agent.envelope import RECORDS_CONTENT_TYPE
+from lsp_devtools.agent.envelope import decode_batch
+from lsp_devtools.agent.envelope import decode_body
+from lsp_devtools.agent.envelope import get_batch_type
+from lsp_devtools.agent.metadata import SOURCES
+from lsp_devtools.agent.metadata import MessageMetadata
+from lsp_devtools.agent.metadata import unpack_records
+from lsp_devtools.agent.protocol import AgentServerProtocol
+from lsp_devtools.agent.ring import RING_SIZE
+from lsp_devtools.agent.scan import body_offset
 
 if typing.TYPE_CHECKING:
+    from collections.abc import Coroutine
     from typing import Any
+    from typing import Callable
+    from typing import Union
 
-    from lsp_devtools.agent.agent import MessageHandler
+    from lsp_devtools.database import Database
+
+    RecordHandler = Callable[
+        [bytes, MessageMetadata], Union[None, Coroutine[Any, Any, None]]
+    ]
+    BatchHandler = Callable[
+        [list[tuple[bytes, MessageMetadata]]], Union[None, Coroutine[Any, Any, None]]
+    ]
+
+CONNECTION_QUEUE_SIZE = 1024
+"""The maximum number of messages from a single connection waiting to be handled."""
+
+FAIR_SHARE = 64
+"""The maximum number of messages handled from a connection before moving onto the
+next one."""
+
+RING_POLL_INTERVAL = 0.05
+"""How often (in seconds) to check the ring for new records, in case a wakeup from the
+agent is missed."""
+
+
+class AgentConnection:
+    """The state of a single agent's connection to the server."""
+
+    def __init__(
+        self, protocol: AgentServerProtocol, maxsize: int = CONNECTION_QUEUE_SIZE
+    ):
+        self.protocol = protocol
+        """The protocol instance used to talk to the agent."""
+
+        self.queue: asyncio.Queue[tuple[bytes, MessageMetadata]] = asyncio.Queue(
+            maxsize
+        )
+        """Messages received from the agent, waiting to be handled."""
+
+        self.disconnected = False
+        """Set once the agent has disconnected."""
+
+        self.closed = False
+        """Set once all the messages sent by the agent have been queued."""
 
 
 class AgentServer(JsonRPCServer):
     """A pygls server that accepts connections from agents allowing them to send their
-    collected messages."""
+    collected messages.
+
+    Each message is passed to the handler, along with its metadata. Many agents can be
+    connected at once, messages from each connection are queued and handled in turn so
+    that a busy agent cannot starve the others.
 
-    lsp: AgentProtocol
+    Alternatively, a ``batch_handler`` is passed the messages taken from a connection
+    in each turn as a single list, so that a sink such as a database can store them all
+    at once.
+    """
+
+    protocol: AgentServerProtocol
 
     def __init__(
         self,
         *args,
         logger: logging.Logger | None = None,
-        handler: MessageHandler | None = None,
+        handler: RecordHandler | None = None,
+        batch_handler: BatchHandler | None = None,
+        connection_queue_size: int = CONNECTION_QUEUE_SIZE,
+        fair_share: int = FAIR_SHARE,
+        ring_size: int = RING_SIZE,
         **kwargs,
     ):
         if "protocol_cls" not in kwargs:
-            kwargs["protocol_cls"] = AgentProtocol
+            kwargs["protocol_cls"] = AgentServerProtocol
 
         if "converter_factory" not in kwargs:
             kwargs["converter_factory"] = default_converter
 
         super().__init__(*args, **kwargs)
 
+        self._converter_factory = kwargs["converter_factory"]
+        """Used to create the converter of each connection's protocol."""
+
         self.logger = logger or logging.getLogger(__name__)
         self.handler = handler or self._default_handler
+        self.batch_handler = batch_handler
         self.db: Database | None = None
 
         self._client_buffer: list[str] = []
         self._server_buffer: list[str] = []
         self._tcp_server: asyncio.Task | None = None
 
-    def _default_handler(self, data: bytes):
-        message = self.protocol.structure_message(json.loads(data))
+        self.connection_queue_size = connection_queue_size
+        self.fair_share = fair_share
+
+        self.ring_size = ring_size
+        """The size of the shared-memory ring to offer agents, disabled if ``0``."""
+
+        self._connections: list[AgentConnection] = []
+        self._ready = asyncio.Event()
+        """Set whenever there are messages waiting to be handled."""
+
+    def _default_handler(self, data: bytes, metadata: MessageMetadata | None = None):
+        body = data[body_offset(data) :]
+        message = self.protocol.structure_message(codec.loads(body))
         self.protocol.handle_message(message)
 
+    async def _dispatch(self, connection: AgentConnection, data: bytes):
+        """Queue the given frame to be handled, unpacking any batches."""
+        try:
+            batch_type = get_batch_type(data)
+            if batch_type == RECORDS_CONTENT_TYPE:
+                await self._queue_records(connection, decode_body(data))
+
+            elif batch_type == BATCH_CONTENT_TYPE:
+                for frame in decode_batch(data):
+                    await self._queue_frame(connection, frame)
+
+            else:
+                await self._queue_frame(connection, data)
+
+        except ValueError:
+            self.logger.warning("Skipping invalid message", exc_info=True)
+
+    async def _queue_records(self, connection: AgentConnection, data: bytes):
+        sessions = connection.protocol.sessions
+        for source, session, timestamp_ns, latency_ns, frame in unpack_records(data):
+            try:
+                metadata = MessageMetadata(
+                    SOURCES[source], sessions[session], timestamp_ns, latency_ns
+                )
+            except IndexError:
+                raise ValueError(f"Invalid record: ({source=}, {session=})") from None
+
+            await self._queue(connection, frame, metadata)
+
+    async def _queue_frame(self, connection: AgentConnection, data: bytes):
+        # Messages without a source come from the agent itself, rather than the
+        # session it is observing.
+        if (metadata := MessageMetadata.from_headers(data)) is None:
+            body = data[body_offset(data) :]
+            protocol = connection.protocol
+            protocol.handle_message(protocol.structure_message(codec.loads(body)))
+            return
+
+        await self._queue(connection, data, metadata)
+
+    async def _queue(
+        self, connection: AgentConnection, data: bytes, metadata: MessageMetadata
+    ):
+        # Waiting for space here stops reading from the connection, pushing back on
+        # the agent until we catch up.
+        await connection.queue.put((data, metadata))
+        self._ready.set()
+
+    async def _read_ring(self, connection: AgentConnection):
+        """Queue the records the agent writes to its shared-memory ring, if it has
+        one."""
+        protocol = connection.protocol
+        await protocol.doorbell.wait()
+        if (ring := protocol.ring) is None:
+            return
+
+        while True:
+            protocol.doorbell.clear()
+
+            # Check for anything written before the agent disconnected, one last time.
+            disconnected = connection.disconnected
+            if len(data := ring.peek()) > 0:
+                try:
+                    await self._queue_records(connection, data)
+                except ValueError:
+                    self.logger.warning("Skipping invalid records", exc_info=True)
+
+                # Only free the space once queued, so that the agent can tell when
+                # everything it wrote to the ring has been received.
+                ring.consume(len(data))
+                continue
+
+            if disconnected:
+                return
+
+            ring.waiting = True
+            if len(ring) == 0:
+                try:
+                    await asyncio.wait_for(protocol.doorbell.wait(), RING_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+            ring.waiting = False
+
+    async def _drain_connections(self):
+        """Pass queued messages to the handler, taking turns between connections."""
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+
+            for connection in list(self._connections):
+                queue = connection.queue
+                batch = [
+                    queue.get_nowait()
+                    for _ in range(min(self.fair_share, queue.qsize()))
+                ]
+                if len(batch) > 0:
+                    await self._handle_batch(batch)
+
+                if queue.qsize() > 0:
+                    self._ready.set()
+
+                elif connection.closed:
+                    self._connections.remove(connection)
+
+    async def _handle_batch(self, batch: list[tuple[bytes, MessageMetadata]]):
+        if self.batch_handler is not None:
+            try:
+                if inspect.isawaitable(result := self.batch_handler(batch)):
+                    await result
+            except Exception:
+                self.logger.exception("Unable to handle messages")
+
+            return
+
+        for data, metadata in batch:
+            try:
+                if inspect.isawaitable(result := self.handler(data, metadata)):
+                    await result
+            except Exception:
+                self.logger.exception("Unable to handle message")
+
     def _report_server_error(self, error: Exception, source):
         """Report internal server errors."""
         tb = "".join(
@@ -61,31 +265,67 @@ class AgentServer(JsonRPCServer):
         self.logger.debug("%s", tb)
 
     def feature(self, feature_name: str, options: Any | None = None):
-        return self.lsp.fm.feature(feature_name, options)
+        return self.protocol.fm.feature(feature_name, options)
 
     async def start_tcp(self, host: str, port: int) -> None:  # type: ignore[override]
-        async def handle_client(
-            reader: asyncio.StreamReader, writer: asyncio.StreamWriter
-        ):
-            self.protocol.set_writer(writer)
+        await self._serve(await asyncio.start_server(self._handle_client, host, port))
 
-            try:
-                await aio_readline(reader, self.handler)
-            except asyncio.CancelledError:
-                pass
-            finally:
-                writer.close()
-                await writer.wait_closed()
-
-            # Uncomment if we ever need to introduce a mode where the server stops
-            # automatically once a session ends.
-            #
-            # self.stop()
-
-        server = await asyncio.start_server(handle_client, host, port)
-        async with server:
-            self._tcp_server = asyncio.create_task(server.serve_forever())
-            await self._tcp_server
+    async def start_unix(self, path: str) -> None:
+        """Accept connections from agents on the Unix domain socket at ``path``."""
+        # Remove any socket left behind by a previous server.
+        if (socket_path := pathlib.Path(path)).is_socket():
+            socket_path.unlink()
+
+        try:
+            await self._serve(
+                await asyncio.start_unix_server(self._handle_client, path)
+            )
+        finally:
+            socket_path.unlink(missing_ok=True)
+
+    async def _serve(self, server: asyncio.AbstractServer):
+        # Python 3.9 binds events to the current event loop when they are created.
+        self._ready = asyncio.Event()
+        drain_task = asyncio.create_task(self._drain_connections())
+        try:
+            async with server:
+                self._tcp_server = asyncio.create_task(server.serve_forever())
+                await self._tcp_server
+        finally:
+            drain_task.cancel()
+
+    async def _handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        protocol = type(self.protocol)(self, self._converter_factory())
+        protocol.fm.features.update(self.protocol.fm.features)
+        protocol.set_writer(writer)
+
+        connection = AgentConnection(protocol, self.connection_queue_size)
+        self._connections.append(connection)
+        ring_task = asyncio.create_task(self._read_ring(connection))
+
+        try:
+            await aio_readline(reader, partial(self._dispatch, connection))
+        except asyncio.CancelledError:
+            pass
+        finally:
+            connection.disconnected = True
+            protocol.doorbell.set()
+            await asyncio.wait([ring_task])
+            if protocol.ring is not None:
+                protocol.ring.close()
+
+            connection.closed = True
+            self._ready.set()
+
+            writer.close()
+            await writer.wait_closed()
+
+        # Uncomment if we ever need to introduce a mode where the server stops
+        # automatically once a session ends.
+        #
+        # self.stop()
 
     def stop(self):
         if self._tcp_server is not None:
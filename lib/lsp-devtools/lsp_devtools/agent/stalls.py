@@ -0,0 +1,177 @@
+"""Detect requests that have gone unanswered for too long.
+
+Each request with a threshold for its method is tracked until it is answered. Should a
+request's threshold pass without a response, it is reported as a
+``$/lsp-devtools/stall`` notification, sent by the side expected to respond::
+
+   {
+       "jsonrpc": "2.0",
+       "method": "$/lsp-devtools/stall",
+       "params": {
+           "state": "stalled",
+           "id": 12,
+           "method": "textDocument/completion",
+           "source": "client",
+           "elapsed": 5.0,
+       },
+   }
+
+Once the stalled request is finally answered, a second notification with the
+``"resolved"`` state reports the total time (in seconds) it took.
+
+Thresholds are given as ``METHOD=SECONDS``, ``METHOD`` may be ``*`` to give the
+threshold for every method without its own.
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import typing
+
+import attrs
+
+if typing.TYPE_CHECKING:
+    from collections.abc import Mapping
+
+STALL = "$/lsp-devtools/stall"
+"""The method name of the notifications used to record stalled requests."""
+
+ANY = "*"
+"""Gives the threshold for any method without its own."""
+
+
+@attrs.define
+class PendingRequest:
+    """A request waiting for a response."""
+
+    source: str
+    """Who sent the request, either ``client`` or ``server``."""
+
+    id: int | str
+    """The request's id."""
+
+    method: str
+    """The request's method."""
+
+    timestamp: int
+    """When the request was seen, in nanoseconds since the epoch."""
+
+    deadline: int
+    """When the request is considered stalled, in nanoseconds since the epoch."""
+
+    stalled: bool = attrs.field(default=False)
+    """Set once the request has been reported as stalled."""
+
+
+def parse_threshold(spec: str) -> tuple[str, float]:
+    """Parse a threshold from a string of the form ``METHOD=SECONDS``, or just
+    ``SECONDS`` for every method.
+
+    Raises
+    ------
+    ValueError
+       If the threshold is invalid.
+    """
+    method, _, seconds = spec.rpartition("=")
+    try:
+        threshold = float(seconds)
+    except ValueError:
+        raise ValueError(f"Expected METHOD=SECONDS, got {spec!r}") from None
+
+    if threshold <= 0:
+        raise ValueError(f"Expected a positive number of seconds, got {spec!r}")
+
+    return method or ANY, threshold
+
+
+class StallDetector:
+    """Tracks in-flight requests in a heap ordered by deadline, so that finding the
+    stalled requests only ever looks at those that are due.
+
+    Answered requests are left in the heap until they reach the top, or the heap is
+    compacted.
+
+    Parameters
+    ----------
+    thresholds
+       The time (in seconds) a request may wait for a response, indexed by method.
+       Requests for methods without a threshold are not tracked.
+    """
+
+    def __init__(self, thresholds: Mapping[str, float]):
+        self.thresholds = dict(thresholds)
+
+        self._requests: dict[tuple[str, int | str], PendingRequest] = {}
+        """The requests waiting for a response, indexed by source and id."""
+
+        self._heap: list[tuple[int, int, PendingRequest]] = []
+        self._counter = itertools.count()
+
+    def __len__(self) -> int:
+        """The number of requests waiting for a response."""
+        return len(self._requests)
+
+    @property
+    def stalled(self) -> int:
+        """The number of stalled requests still waiting for a response."""
+        return sum(request.stalled for request in self._requests.values())
+
+    def threshold(self, method: str) -> float | None:
+        """Return the threshold (in seconds) for the given method, if any."""
+        return self.thresholds.get(method, self.thresholds.get(ANY))
+
+    def request(self, source: str, id_: int | str, method: str, timestamp: int):
+        """Start tracking the given request."""
+        if (threshold := self.threshold(method)) is None:
+            return
+
+        deadline = timestamp + int(threshold * 1e9)
+        request = PendingRequest(source, id_, method, timestamp, deadline)
+        self._requests[(source, id_)] = request
+        heapq.heappush(self._heap, (deadline, next(self._counter), request))
+
+        if len(self._heap) > 2 * len(self._requests) + 64:
+            self._compact()
+
+    def response(self, source: str, id_: int | str) -> PendingRequest | None:
+        """Stop tracking the request with the given id, sent by ``source``.
+
+        Returns the request if it had been reported as stalled.
+        """
+        request = self._requests.pop((source, id_), None)
+        if request is None or not request.stalled:
+            return None
+
+        return request
+
+    def next_deadline(self) -> int | None:
+        """Return the earliest deadline of the requests yet to stall, if any."""
+        while len(self._heap) > 0 and not self._is_waiting(self._heap[0][2]):
+            heapq.heappop(self._heap)
+
+        return self._heap[0][0] if len(self._heap) > 0 else None
+
+    def expired(self, now: int) -> list[PendingRequest]:
+        """Return the requests that have stalled by ``now``, marking them as stalled.
+
+        Each request is only ever returned once.
+        """
+        stalled = []
+        while len(self._heap) > 0 and self._heap[0][0] <= now:
+            _, _, request = heapq.heappop(self._heap)
+            if self._is_waiting(request):
+                request.stalled = True
+                stalled.append(request)
+
+        return stalled
+
+    def _is_waiting(self, request: PendingRequest) -> bool:
+        """``True`` if the given request is yet to be answered or reported."""
+        key = (request.source, request.id)
+        return not request.stalled and self._requests.get(key) is request
+
+    def _compact(self):
+        """Remove the requests no longer waiting from the heap."""
+        self._heap = [entry for entry in self._heap if self._is_waiting(entry[2])]
+        heapq.heapify(self._heap)
@@ -0,0 +1,187 @@
+"""Record messages too large to be recorded in full.
+
+A message whose body is larger than the agent's record size limit is still forwarded
+as-is, but is recorded as a message with the same routing fields (``id`` and
+``method``) where the ``params``, ``result`` or ``error`` member is replaced by a
+preview of the start of the body, along with its length and hash::
+
+   {
+     "jsonrpc": "2.0",
+     "method": "textDocument/didOpen",
+     "params": {
+       "$/lsp-devtools/truncated": {
+         "length": 20971520,
+         "sha256": "5e8c...",
+         "preview": "{\\"jsonrpc\\":\\"2.0\\",\\"method\\":\\"textDocument/didOpen\\",..."
+       }
+     }
+   }
+"""
+
+from __future__ import annotations
+
+import hashlib
+import typing
+
+from lsp_devtools import codec
+
+from .scan import body_offset
+from .scan import scan_truncated_fields
+
+if typing.TYPE_CHECKING:
+    from typing import Any
+    from typing import Union
+
+    from .framing import FramePiece
+
+    Buffer = Union[bytes, bytearray]
+
+TRUNCATED = "$/lsp-devtools/truncated"
+"""The key holding the details of a truncated message."""
+
+PREVIEW_SIZE = 1024
+"""The number of bytes from the start of the body kept, to find the routing fields that
+precede the (large) ``params`` or ``result`` member and include in the preview."""
+
+TAIL_SIZE = 1024
+"""The number of bytes from the end of the body kept, to find any routing fields that
+follow the (large) ``params`` or ``result`` member."""
+
+
+def truncated_message(
+    head: Buffer, tail: Buffer, length: int, digest: str, preview_size: int
+) -> bytes:
+    """Return the message to record in place of one too large to record in full.
+
+    Parameters
+    ----------
+    head
+       The headers and the start of the original message's body, used to find its
+       routing fields and for the preview.
+
+    tail
+       The end of the original message's body.
+
+    length
+       The length of the original message's body.
+
+    digest
+       The SHA-256 hash of the original message's body.
+
+    preview_size
+       The number of bytes from the start of the body to include in the preview.
+    """
+    start = body_offset(head)
+    fields = scan_truncated_fields(head, tail, start)
+
+    body: dict[str, Any] = {"jsonrpc": "2.0"}
+    if fields.id is not None:
+        body["id"] = fields.id
+
+    if fields.method is not None:
+        body["method"] = fields.method
+
+    member = "params" if fields.method is not None else "result"
+    if "error" in fields.keys:
+        member = "error"
+
+    preview = bytes(head[start : start + preview_size])
+    body[member] = {
+        TRUNCATED: {
+            "length": length,
+            "sha256": digest,
+            "preview": preview.decode("utf8", errors="replace"),
+        }
+    }
+
+    data = codec.dumps(body).encode("utf8")
+    return b"Content-Length: %d\r\n\r\n%s" % (len(data), data)
+
+
+def truncate_message(message: bytes, max_size: int) -> bytes:
+    """Return the message to record for the given message, truncated if its body is
+    larger than ``max_size`` bytes."""
+    start = body_offset(message)
+    length = len(message) - start
+    if length <= max_size:
+        return message
+
+    preview_size = min(max_size, PREVIEW_SIZE)
+    return truncated_message(
+        message[: start + PREVIEW_SIZE],
+        message[max(start, len(message) - TAIL_SIZE) :],
+        length,
+        hashlib.sha256(memoryview(message)[start:]).hexdigest(),
+        preview_size,
+    )
+
+
+class MessageTee:
+    """Keeps the parts of a message forwarded in pieces needed to record it.
+
+    Parameters
+    ----------
+    timestamp
+       When the first piece of the message was seen.
+
+    max_size
+       If set, messages with bodies larger than this are recorded truncated, only
+       keeping the bytes needed for the preview.
+    """
+
+    def __init__(self, timestamp: int, max_size: int | None = None):
+        self.timestamp = timestamp
+        self.max_size = max_size
+
+        self.head = bytearray()
+        """The start of the message, or the entire message if it is not truncated."""
+
+        self.tail = bytearray()
+        """The end of the message, only kept if it is truncated."""
+
+        self.body_start = 0
+        self.length = 0
+        self.preview_size = 0
+        self._hash: hashlib._Hash | None = None
+
+    @property
+    def is_truncated(self) -> bool:
+        """``True`` if the message is too large to be recorded in full."""
+        return self._hash is not None
+
+    def add(self, piece: FramePiece):
+        """Add the next piece of the message."""
+        data = memoryview(piece.data)
+        if piece.is_first:
+            self.body_start = body_offset(piece.data)
+            self.length = piece.length - self.body_start
+
+            if self.max_size is not None and self.length > self.max_size:
+                self._hash = hashlib.sha256()
+                self.preview_size = min(self.max_size, PREVIEW_SIZE)
+
+        if self._hash is None:
+            self.head += data
+            return
+
+        body = data[self.body_start :] if piece.is_first else data
+        self._hash.update(body)
+
+        if (missing := self.body_start + PREVIEW_SIZE - len(self.head)) > 0:
+            self.head += data[:missing]
+
+        self.tail += body[-TAIL_SIZE:]
+        del self.tail[:-TAIL_SIZE]
+
+    def message(self) -> bytes:
+        """Return the message to record, once all of its pieces have been added."""
+        if self._hash is None:
+            return bytes(self.head)
+
+        return truncated_message(
+            self.head,
+            self.tail,
+            self.length,
+            self._hash.hexdigest(),
+            self.preview_size,
+        )
@@ -1,3 +1,5 @@
+from __future__ import annotations
+
 import argparse
 import importlib
 import logging
@@ -5,16 +7,25 @@ import sys
 import traceback
 
 from lsp_devtools import __version__
+from lsp_devtools import codec
 
 logger = logging.getLogger(__name__)
 
 
-BUILTIN_COMMANDS = [
-    "lsp_devtools.agent",
-    "lsp_devtools.client",
-    "lsp_devtools.inspector",
-    "lsp_devtools.record",
-]
+BUILTIN_COMMANDS = {
+    "agent": ("lsp_devtools.agent", "instrument an LSP session"),
+    "client": ("lsp_devtools.client", "launch an LSP client with built in inspector"),
+    "inspect": (
+        "lsp_devtools.inspector",
+        "launch an interactive LSP session inspector",
+    ),
+    "record": ("lsp_devtools.record", "record a JSON-RPC session."),
+}
+"""The builtin commands, mapping each command's name to the module implementing it and
+a short description.
+
+Only the module implementing the command being run is imported, the other commands are
+listed using their description."""
 
 
 def load_command(commands: argparse._SubParsersAction, name: str):
@@ -35,24 +46,66 @@ def load_command(commands: argparse._SubParsersAction, name: str):
         return
 
 
+def find_command(options: argparse.ArgumentParser, args: list[str]) -> str | None:
+    """Return the name of the builtin command selected by the given arguments, if any.
+
+    The command is the first positional argument, so that the values given to any of
+    the top-level ``options`` are never mistaken for it.
+    """
+    selector = argparse.ArgumentParser(
+        add_help=False, parents=[options], exit_on_error=False
+    )
+    selector.add_argument("command", nargs="?")
+    try:
+        known, _ = selector.parse_known_args(args)
+    except argparse.ArgumentError:
+        # Leave it to the full parser to report the error.
+        return None
+
+    return known.command if known.command in BUILTIN_COMMANDS else None
+
+
 def main():
+    options = argparse.ArgumentParser(prog="lsp-devtools", add_help=False)
+    options.add_argument(
+        "--json-backend",
+        choices=codec.BACKEND_CHOICES,
+        default=None,
+        help=(
+            "the JSON library to use, by default the fastest one available. "
+            f"Can also be set with the {codec.ENV_VAR} environment variable"
+        ),
+    )
+
     cli = argparse.ArgumentParser(
-        prog="lsp-devtools", description="Developer tooling for language servers"
+        prog="lsp-devtools",
+        description="Developer tooling for language servers",
+        parents=[options],
     )
     cli.add_argument("--version", action="version", version=f"%(prog)s v{__version__}")
     commands = cli.add_subparsers(title="commands")
 
-    for mod in BUILTIN_COMMANDS:
-        load_command(commands, mod)
-
     try:
         idx = sys.argv.index("--")
         args, extra = sys.argv[1:idx], sys.argv[idx + 1 :]
     except ValueError:
         args, extra = sys.argv[1:], None
 
+    selected = find_command(options, args)
+    for name, (mod, help_) in BUILTIN_COMMANDS.items():
+        if name == selected:
+            load_command(commands, mod)
+        else:
+            commands.add_parser(name, help=help_)
+
     parsed_args = cli.parse_args(args)
 
+    if parsed_args.json_backend is not None:
+        try:
+            codec.set_backend(parsed_args.json_backend)
+        except ValueError as exc:
+            cli.error(str(exc))
+
     if hasattr(parsed_args, "run"):
         return parsed_args.run(parsed_args, extra)
 
@@ -1,5 +1,4 @@
 import importlib.metadata
-import json
 from datetime import datetime
 from datetime import timezone
 from typing import Optional
@@ -9,6 +8,7 @@ from lsprotocol import types
 from pygls.lsp.client import BaseLanguageClient
 from pygls.protocol import LanguageServerProtocol
 
+from lsp_devtools import codec
 from lsp_devtools.agent import logger
 
 UTC = timezone.utc
@@ -25,7 +25,7 @@ class RecordingLSProtocol(LanguageServerProtocol):
     def _procedure_handler(self, message):
         logger.info(
             "%s",
-            json.dumps(message, default=self._serialize_message),
+            codec.dumps(message, default=self._serialize_message),
             extra={
                 "Message-Source": "server",
                 "Message-Session": self.session_id,
@@ -37,7 +37,7 @@ class RecordingLSProtocol(LanguageServerProtocol):
     def _send_data(self, data):
         logger.info(
             "%s",
-            json.dumps(data, default=self._serialize_message),
+            codec.dumps(data, default=self._serialize_message),
             extra={
                 "Message-Source": "client",
                 "Message-Session": self.session_id,
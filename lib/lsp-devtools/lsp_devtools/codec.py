@@ -0,0 +1,184 @@
+"""JSON encoding and decoding.
+
+All of ``lsp-devtools`` encodes and decodes JSON through this module, which uses the
+fastest available backend
+
+- `orjson <https://github.com/ijl/orjson>`__
+- `msgspec <https://jcristharif.com/msgspec/>`__
+- The standard library's :mod:`json` module
+
+A specific backend can be requested by setting the ``LSP_DEVTOOLS_JSON`` environment
+variable, or by passing the ``--json-backend`` option on the command line.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import typing
+
+import attrs
+
+if typing.TYPE_CHECKING:
+    from typing import Any
+    from typing import Callable
+    from typing import Optional
+    from typing import Union
+
+    Loads = Callable[[Union[bytes, str]], Any]
+    Dumps = Callable[[Any, Optional[int], Optional[Callable[[Any], Any]]], str]
+
+logger = logging.getLogger(__name__)
+
+ENV_VAR = "LSP_DEVTOOLS_JSON"
+"""The environment variable used to select the JSON backend."""
+
+AUTO = "auto"
+"""Use the fastest backend available."""
+
+
+@attrs.define
+class JsonBackend:
+    """A JSON implementation."""
+
+    name: str
+    """The name of the backend."""
+
+    loads: Loads
+    """Decode the given data."""
+
+    dumps: Dumps
+    """Encode the given object, with the given indent and ``default`` hook."""
+
+
+def _stdlib_dumps(obj: Any, indent: int | None, default: Callable | None) -> str:
+    return json.dumps(obj, indent=indent, default=default)
+
+
+def load_stdlib() -> JsonBackend:
+    return JsonBackend(name="stdlib", loads=json.loads, dumps=_stdlib_dumps)
+
+
+def load_orjson() -> JsonBackend:
+    import orjson
+
+    def dumps(obj: Any, indent: int | None, default: Callable | None) -> str:
+        if indent not in {None, 2}:
+            return _stdlib_dumps(obj, indent, default)
+
+        option = orjson.OPT_NON_STR_KEYS
+        if indent == 2:
+            option |= orjson.OPT_INDENT_2
+
+        try:
+            return orjson.dumps(obj, default=default, option=option).decode("utf8")
+        except TypeError:
+            # e.g. integers larger than 64 bits
+            return _stdlib_dumps(obj, indent, default)
+
+    return JsonBackend(name="orjson", loads=orjson.loads, dumps=dumps)
+
+
+def load_msgspec() -> JsonBackend:
+    import msgspec
+
+    encoders: dict[Callable | None, msgspec.json.Encoder] = {}
+    decoder = msgspec.json.Decoder()
+
+    def loads(data: bytes | str) -> Any:
+        try:
+            return decoder.decode(data)
+        except msgspec.DecodeError as exc:
+            raise ValueError(str(exc)) from exc
+
+    def dumps(obj: Any, indent: int | None, default: Callable | None) -> str:
+        if (encoder := encoders.get(default)) is None:
+            encoder = encoders.setdefault(
+                default, msgspec.json.Encoder(enc_hook=default)
+            )
+
+        data = encoder.encode(obj)
+        if indent is not None:
+            data = msgspec.json.format(data, indent=indent)
+
+        return data.decode("utf8")
+
+    return JsonBackend(name="msgspec", loads=loads, dumps=dumps)
+
+
+BACKENDS: dict[str, Callable[[], JsonBackend]] = {
+    "orjson": load_orjson,
+    "msgspec": load_msgspec,
+    "stdlib": load_stdlib,
+}
+"""The available backends, in order of preference."""
+
+BACKEND_CHOICES = [AUTO, *BACKENDS.keys()]
+
+
+def set_backend(name: str = AUTO) -> JsonBackend:
+    """Set the JSON backend to use.
+
+    Parameters
+    ----------
+    name
+       The name of the backend to use, if ``auto`` use the fastest one available.
+
+    Raises
+    ------
+    ValueError
+       If the requested backend is unknown or not installed.
+    """
+    global _backend  # noqa: PLW0603
+
+    if name == AUTO:
+        for loader in BACKENDS.values():
+            try:
+                _backend = loader()
+                break
+            except ImportError:
+                continue
+
+        return _backend
+
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown JSON backend: {name!r}")
+
+    try:
+        _backend = BACKENDS[name]()
+    except ImportError as exc:
+        raise ValueError(f"JSON backend {name!r} is not installed") from exc
+
+    return _backend
+
+
+def get_backend() -> JsonBackend:
+    """Return the JSON backend currently in use."""
+    return _backend
+
+
+def loads(data: bytes | str) -> Any:
+    """Decode the given JSON data.
+
+    Raises
+    ------
+    ValueError
+       If the data is not valid JSON.
+    """
+    return _backend.loads(data)
+
+
+def dumps(
+    obj: Any, *, indent: int | None = None, default: Callable[[Any], Any] | None = None
+) -> str:
+    """Encode the given object as JSON."""
+    return _backend.dumps(obj, indent, default)
+
+
+_backend = load_stdlib()
+
+try:
+    set_backend(os.environ.get(ENV_VAR, AUTO))
+except ValueError:
+    logger.warning("Unable to use JSON backend, falling back to stdlib", exc_info=True)
@@ -1,9 +1,8 @@
 import asyncio
-import json
 import logging
 import pathlib
+from collections.abc import Mapping
 from contextlib import asynccontextmanager
-from importlib import resources
 from typing import Any
 from typing import Optional
 
@@ -11,7 +10,12 @@ import aiosqlite
 from textual.app import App
 from textual.message import Message
 
+from lsp_devtools import codec
 from lsp_devtools.handlers import LspMessage
+from lsp_devtools.handlers.sql import INSERT_MESSAGE
+from lsp_devtools.handlers.sql import load_script
+from lsp_devtools.handlers.sql import message_row
+from lsp_devtools.handlers.sql import needs_upgrade
 
 
 class Database:
@@ -41,11 +45,18 @@ class Database:
             ):
                 self.dbpath.parent.mkdir(parents=True)
 
-            resource = resources.files("lsp_devtools.handlers").joinpath("dbinit.sql")
-            schema = resource.read_text(encoding="utf8")
+            schema = load_script("dbinit.sql")
 
             self.db = await aiosqlite.connect(self.dbpath)
             await self.db.executescript(schema)
+
+            async with self.db.execute("PRAGMA table_info(protocol)") as info:
+                columns = {row[1] for row in await info.fetchall()}
+
+            if needs_upgrade(columns):
+                await self.db.executescript(load_script("dbupgrade.sql"))
+                await self.db.executescript(schema)
+
             await self.db.commit()
 
         cursor = await self.db.cursor()
@@ -53,29 +64,42 @@ class Database:
 
         await self.db.commit()
 
-    async def add_message(self, session: str, timestamp: str, source: str, rpc: dict):
+    async def add_message(
+        self,
+        session: str,
+        timestamp: str,
+        source: str,
+        rpc: Mapping[str, Any],
+        latency: Optional[float] = None,
+    ):
         """Add a new rpc message to the database."""
+        await self.add_messages([(session, timestamp, source, rpc, latency)])
 
-        msg_id = rpc.get("id")
-        method = rpc.get("method")
-        params = rpc.get("params")
-        result = rpc.get("result")
-        error = rpc.get("error")
+    async def add_messages(
+        self,
+        messages: list[tuple[str, str, str, Mapping[str, Any], Optional[float]]],
+    ):
+        """Add many rpc messages to the database, in a single transaction.
 
-        async with self.cursor() as cursor:
-            await cursor.execute(
-                "INSERT INTO protocol VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                (
-                    session,
-                    timestamp,
-                    source,
-                    msg_id,
-                    method,
-                    json.dumps(params) if params else None,
-                    json.dumps(result) if result else None,
-                    json.dumps(error) if error else None,
-                ),
+        Each message is given as a tuple of the arguments to :meth:`add_message`.
+        """
+        rows = [
+            message_row(
+                session,
+                timestamp,
+                source,
+                rpc.get("id"),
+                rpc.get("method"),
+                rpc.get("params"),
+                rpc.get("result"),
+                rpc.get("error"),
+                latency,
             )
+            for session, timestamp, source, rpc, latency in messages
+        ]
+
+        async with self.cursor() as cursor:
+            await cursor.executemany(INSERT_MESSAGE, rows)
 
         if self.app is not None:
             self.app.post_message(Database.Update())
@@ -130,6 +154,7 @@ class Database:
                     params=row[6],
                     result=row[7],
                     error=row[8],
+                    latency=row[9],
                 )
 
                 results.append((row[0], message))
@@ -146,7 +171,7 @@ class DatabaseLogHandler(logging.Handler):
         self._tasks: set[asyncio.Task] = set()
 
     def emit(self, record: logging.LogRecord):
-        body = json.loads(record.args[0])  # type: ignore
+        body = codec.loads(record.args[0])  # type: ignore
         task = asyncio.create_task(
             self.db.add_message(
                 record.__dict__["Message-Session"],
@@ -1,14 +1,15 @@
 from __future__ import annotations
 
-import json
 import logging
 import typing
+from collections.abc import Mapping
 from datetime import datetime
 
 import attrs
 
+from lsp_devtools import codec
+
 if typing.TYPE_CHECKING:
-    from collections.abc import Mapping
     from typing import Any
     from typing import Literal
 
@@ -17,7 +18,7 @@ if typing.TYPE_CHECKING:
 
 def maybe_json(value):
     try:
-        return json.loads(value)
+        return codec.loads(value)
     except Exception:
         return value
 
@@ -51,20 +52,33 @@ class LspMessage:
     error: Any | None = attrs.field(converter=maybe_json)
     """The ``error`` field, if it exists."""
 
+    latency: float | None = attrs.field(default=None)
+    """For responses, the time (in milliseconds) taken to respond to the request, as
+    measured by the agent."""
+
     @classmethod
     def from_rpc(
-        cls, session: str, timestamp: str, source: str, message: Mapping[str, Any]
+        cls,
+        session: str,
+        timestamp: str | datetime,
+        source: str,
+        message: Mapping[str, Any],
+        latency: float | None = None,
     ):
         """Create an instance from a JSON-RPC message."""
+        if isinstance(timestamp, str):
+            timestamp = datetime.fromisoformat(timestamp)
+
         return cls(
             session=session,
-            timestamp=datetime.fromisoformat(timestamp),
+            timestamp=timestamp,
             source=source,  # type: ignore
             id=message.get("id", None),
             method=message.get("method", None),
             params=message.get("params", None),
             result=message.get("result", None),
             error=message.get("error", None),
+            latency=latency,
         )
 
     @property
@@ -91,7 +105,7 @@ class LspHandler(logging.Handler):
         """Called each time a message is processed."""
 
     def emit(self, record: logging.LogRecord):
-        if not isinstance(record.args, dict):
+        if not isinstance(record.args, Mapping):
             return
 
         message = record.args
@@ -103,5 +117,6 @@ class LspHandler(logging.Handler):
                 timestamp=record.__dict__["Message-Timestamp"],
                 source=source,
                 message=message,
+                latency=record.__dict__.get("Message-Latency"),
             )
         )
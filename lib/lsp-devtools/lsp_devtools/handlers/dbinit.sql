@@ -12,7 +12,10 @@ CREATE TABLE IF NOT EXISTS protocol (
     method TEXT NULL,
     params TEXT NULL,
     result TEXT NULL,
-    error TEXT NULL
+    error TEXT NULL,
+
+    -- For responses, the time in milliseconds the request took, as measured by the agent.
+    latency REAL NULL
 );
 
 -- Views
@@ -22,7 +25,10 @@ CREATE VIEW IF NOT EXISTS requests AS
 SELECT
     client.session,
     client.timestamp,
-    (server.timestamp - client.timestamp) * 1000 as duration,
+    COALESCE(
+        server.latency,
+        (julianday(server.timestamp) - julianday(client.timestamp)) * 86400000
+    ) as duration,
     client.id,
     client.method,
     client.params,
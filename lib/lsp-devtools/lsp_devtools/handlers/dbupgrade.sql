@@ -0,0 +1,6 @@
+-- Upgrades databases created before the 'latency' column was added to the 'protocol'
+-- table. Once applied, 'dbinit.sql' must be run again to recreate the views.
+ALTER TABLE protocol ADD COLUMN latency REAL NULL;
+
+DROP VIEW IF EXISTS sessions;
+DROP VIEW IF EXISTS requests;
@@ -1,12 +1,52 @@
-import json
 import pathlib
 import sqlite3
 from contextlib import closing
 from importlib import resources
 
+from lsp_devtools import codec
 from lsp_devtools.handlers import LspHandler
 from lsp_devtools.handlers import LspMessage
 
+INSERT_MESSAGE = "INSERT INTO protocol VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+"""Inserts a single row into the ``protocol`` table, see :func:`message_row`."""
+
+
+def load_script(name: str) -> str:
+    """Load the given SQL script."""
+    resource = resources.files("lsp_devtools.handlers").joinpath(name)
+    return resource.read_text(encoding="utf8")
+
+
+def message_row(
+    session: str,
+    timestamp,
+    source: str,
+    id_,
+    method,
+    params,
+    result,
+    error,
+    latency,
+) -> tuple:
+    """Return the row inserted by :data:`INSERT_MESSAGE` for the given message."""
+    return (
+        session,
+        timestamp,
+        source,
+        id_,
+        method,
+        codec.dumps(params) if params else None,
+        codec.dumps(result) if result else None,
+        codec.dumps(error) if error else None,
+        latency,
+    )
+
+
+def needs_upgrade(columns: set[str]) -> bool:
+    """Determine if a database, whose ``protocol`` table has the given columns, needs
+    ``dbupgrade.sql`` applying."""
+    return "latency" not in columns
+
 
 class SqlHandler(LspHandler):
     """A logging handler that sends log records to a SQL database"""
@@ -16,26 +56,31 @@ class SqlHandler(LspHandler):
 
         self.dbpath = dbpath
 
-        resource = resources.files("lsp_devtools.handlers").joinpath("dbinit.sql")
-        sql_script = resource.read_text(encoding="utf8")
+        sql_script = load_script("dbinit.sql")
 
         with closing(sqlite3.connect(self.dbpath)) as conn:
             conn.executescript(sql_script)
 
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(protocol)")}
+            if needs_upgrade(columns):
+                conn.executescript(load_script("dbupgrade.sql"))
+                conn.executescript(sql_script)
+
     def handle_message(self, message: LspMessage):
         with closing(sqlite3.connect(self.dbpath)) as conn:
             cursor = conn.cursor()
             cursor.execute(
-                "INSERT INTO protocol VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                (
+                INSERT_MESSAGE,
+                message_row(
                     message.session,
                     message.timestamp,
                     message.source,
                     message.id,
                     message.method,
-                    json.dumps(message.params) if message.params else None,
-                    json.dumps(message.result) if message.result else None,
-                    json.dumps(message.error) if message.error else None,
+                    message.params,
+                    message.result,
+                    message.error,
+                    message.latency,
                 ),
             )
 
@@ -28,7 +28,11 @@ from lsp_devtools.database import Database
 from lsp_devtools.handlers import LspMessage
 
 if typing.TYPE_CHECKING:
+    from collections.abc import Coroutine
     from typing import Any
+    from typing import Callable
+
+    from lsp_devtools.agent.metadata import MessageMetadata
 
 
 logger = logging.getLogger(__name__)
@@ -149,7 +153,14 @@ class LSPInspector(App):
         ("ctrl+c", "quit", "Quit"),
     ]
 
-    def __init__(self, db: Database, server: AgentServer, *args, **kwargs):
+    def __init__(
+        self,
+        db: Database,
+        server: AgentServer,
+        *args,
+        serve: Callable[[], Coroutine[Any, Any, None]] | None = None,
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
 
         self.db = db
@@ -158,6 +169,9 @@ class LSPInspector(App):
         self.server = server
         """Server used to manage connections to lsp servers."""
 
+        self.serve = serve or partial(server.start_tcp, "localhost", 8765)
+        """Called to start accepting connections from agents."""
+
         self._async_tasks: list[asyncio.Task] = []
 
     def compose(self) -> ComposeResult:
@@ -180,9 +194,7 @@ class LSPInspector(App):
             sidebar.add_class("-hidden")
 
     async def on_ready(self, event: Ready):
-        self._async_tasks.append(
-            asyncio.create_task(self.server.start_tcp("localhost", 8765))
-        )
+        self._async_tasks.append(asyncio.create_task(self.serve()))
         table = self.query_one(MessagesTable)
         await table.update()
 
@@ -197,27 +209,40 @@ class LSPInspector(App):
         await super().action_quit()
 
 
-async def handle_message(db: Database, data: bytes):
-    """Handle messages received from the connected lsp server."""
-
-    try:
-        rpc = parse_rpc_message(data)
-    except ValueError:
-        # TODO: error reporting
-        return
-
-    session = rpc["Message-Session"]
-    timestamp = rpc["Message-Timestamp"]
-    source = rpc["Message-Source"]
+async def handle_messages(db: Database, batch: list[tuple[bytes, MessageMetadata]]):
+    """Handle a batch of messages received from the connected lsp server."""
+    messages = []
+    for data, metadata in batch:
+        try:
+            rpc = parse_rpc_message(data)
+        except ValueError:
+            # TODO: error reporting
+            continue
+
+        messages.append(
+            (
+                metadata.session,
+                metadata.timestamp.isoformat(),
+                metadata.source,
+                rpc.body,
+                metadata.latency,
+            )
+        )
 
-    await db.add_message(session, timestamp, source, rpc.body)
+    if len(messages) > 0:
+        await db.add_messages(messages)
 
 
 def inspector(args, extra: list[str]):
     db = Database(args.dbpath)
-    server = AgentServer(handler=partial(handle_message, db))
+    server = AgentServer(batch_handler=partial(handle_messages, db))
+
+    if args.socket is not None:
+        serve = partial(server.start_unix, str(args.socket))
+    else:
+        serve = partial(server.start_tcp, args.host, args.port)
 
-    app = LSPInspector(db, server)
+    app = LSPInspector(db, server, serve=serve)
     app.run()
 
 
@@ -256,4 +281,11 @@ manipulate an LSP session interactively.
     connect.add_argument(
         "-p", "--port", type=int, default=8765, help="the port to connect to."
     )
+    connect.add_argument(
+        "--socket",
+        type=pathlib.Path,
+        default=None,
+        metavar="PATH",
+        help="listen on the Unix domain socket at PATH, instead of a TCP port.",
+    )
     cmd.set_defaults(run=inspector)
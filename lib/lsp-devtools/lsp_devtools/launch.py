@@ -0,0 +1,77 @@
+"""Start a language server inside an agent daemon.
+
+Usage::
+
+   python -m lsp_devtools.launch --socket PATH -- <server command>
+
+Hands this process' stdin, stdout and stderr over to the daemon started with
+``lsp-devtools agent --daemon PATH``, which then starts and proxies the server. The
+launcher waits for the server to exit and exits with the same code.
+
+Only the standard library is imported, so that the launcher starts quickly and uses
+as little memory as possible while it waits.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import socket
+import sys
+
+
+def launch(path: str, command: list[str]) -> int:
+    """Ask the daemon listening at ``path`` to start the given server command,
+    returning the server's exit code."""
+    request = {"command": command, "cwd": os.getcwd(), "env": dict(os.environ)}
+    data = json.dumps(request).encode("utf8") + b"\n"
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+
+        sent = socket.send_fds(sock, [data], [0, 1, 2])
+        if sent < len(data):
+            sock.sendall(data[sent:])
+
+        response = sock.makefile("rb").readline()
+
+    try:
+        return int(response)
+    except ValueError:
+        print("Agent daemon exited unexpectedly", file=sys.stderr)
+        return 1
+
+
+def main(argv: list[str] | None = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    try:
+        idx = argv.index("--")
+        argv, command = argv[:idx], argv[idx + 1 :]
+    except ValueError:
+        command = []
+
+    cli = argparse.ArgumentParser(
+        prog="python -m lsp_devtools.launch",
+        description="start a language server inside an agent daemon",
+    )
+    cli.add_argument(
+        "--socket",
+        required=True,
+        metavar="PATH",
+        help="the Unix socket the daemon is listening on",
+    )
+    args = cli.parse_args(argv)
+
+    if len(command) == 0:
+        cli.error("missing server command, supply it after a '--'")
+
+    try:
+        return launch(args.socket, command)
+    except OSError as exc:
+        print(f"Unable to connect to agent daemon: {exc}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
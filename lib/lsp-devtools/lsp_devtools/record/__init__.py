@@ -2,9 +2,10 @@ from __future__ import annotations
 
 import argparse
 import asyncio
-import json
 import logging
 import pathlib
+import typing
+from collections.abc import Mapping
 from functools import partial
 from logging import LogRecord
 
@@ -13,13 +14,19 @@ from rich.console import ConsoleRenderable
 from rich.logging import RichHandler
 from rich.traceback import Traceback
 
+from lsp_devtools import codec
 from lsp_devtools.agent import AgentServer
 from lsp_devtools.agent import parse_rpc_message
+from lsp_devtools.agent.capture import read_capture
+from lsp_devtools.agent.filters import setup_filter_args
 from lsp_devtools.handlers.sql import SqlHandler
 
 from .filters import LSPFilter
 from .visualize import SpinnerHandler
 
+if typing.TYPE_CHECKING:
+    from lsp_devtools.agent.metadata import MessageMetadata
+
 EXPORTERS = {
     ".html": ("save_html", {}),
     ".svg": ("save_svg", {"title": ""}),
@@ -59,8 +66,8 @@ class RichLSPHandler(RichHandler):
 
     def format(self, record: LogRecord) -> str:
         # Pretty print json messages
-        if isinstance(record.args, dict):
-            record.args = (json.dumps(record.args, indent=2),)
+        if isinstance(record.args, Mapping):
+            record.args = (codec.dumps(dict(record.args), indent=2),)
         return super().format(record)
 
 
@@ -83,14 +90,7 @@ def setup_stdout_output(args, logger: logging.Logger, console: Console):
 
     handler = RichLSPHandler(level=logging.INFO, console=console)
     handler.addFilter(
-        LSPFilter(
-            message_source=args.message_source,
-            include_message_types=args.include_message_types,
-            exclude_message_types=args.exclude_message_types,
-            include_methods=args.include_methods,
-            exclude_methods=args.exclude_methods,
-            formatter=args.format_message or "{.|json}",
-        )
+        LSPFilter.from_args(args, formatter=args.format_message or "{.|json}")
     )
 
     logger.addHandler(handler)
@@ -102,14 +102,7 @@ def setup_file_output(args, logger: logging.Logger, console: Console | None = No
     handler = logging.FileHandler(filename=str(args.to_file))
     handler.setLevel(logging.INFO)
     handler.addFilter(
-        LSPFilter(
-            message_source=args.message_source,
-            include_message_types=args.include_message_types,
-            exclude_message_types=args.exclude_message_types,
-            include_methods=args.include_methods,
-            exclude_methods=args.exclude_methods,
-            formatter=args.format_message or "{.|json-compact}",
-        )
+        LSPFilter.from_args(args, formatter=args.format_message or "{.|json-compact}")
     )
 
     if console:
@@ -126,15 +119,7 @@ def setup_sqlite_output(args, logger: logging.Logger, console: Console | None =
     """Log messages to SQLite."""
     handler = SqlHandler(args.to_sqlite)
     handler.setLevel(logging.INFO)
-    handler.addFilter(
-        LSPFilter(
-            message_source=args.message_source,
-            include_message_types=args.include_message_types,
-            exclude_message_types=args.exclude_message_types,
-            include_methods=args.include_methods,
-            exclude_methods=args.exclude_methods,
-        )
-    )
+    handler.addFilter(LSPFilter.from_args(args))
 
     if console:
         spinner = SpinnerHandler(console)
@@ -146,14 +131,23 @@ def setup_sqlite_output(args, logger: logging.Logger, console: Console | None =
     logger.propagate = False
 
 
-def log_message(logger: logging.Logger, message: bytes):
+def log_message(logger: logging.Logger, message: bytes, metadata: MessageMetadata):
     try:
-        rpc = parse_rpc_message(message)
+        rpc = parse_rpc_message(message, lazy=True)
     except ValueError:
         # TODO: report the error.
         return
 
-    logger.info("%s", rpc.body, extra=rpc.headers)
+    logger.info("%s", rpc.body, extra=metadata.headers)
+
+
+def replay_capture(path: pathlib.Path, handler, logger: logging.Logger):
+    """Pass the messages stored in the given capture file to the handler."""
+    try:
+        for message, metadata in read_capture(path):
+            handler(message, metadata)
+    except (OSError, ValueError):
+        logger.exception("Unable to read capture file")
 
 
 def start_recording(args, extra: list[str]):
@@ -177,16 +171,24 @@ def start_recording(args, extra: list[str]):
     else:
         setup_stdout_output(args, rpc_logger, console)
 
-    try:
-        host = args.host
-        port = args.port
+    if args.from_capture is not None:
+        replay_capture(args.from_capture, handler, logger)
 
-        print(f"Waiting for connection on {host}:{port}...", end="\r", flush=True)
-        asyncio.run(server.start_tcp(host, port))
-    except asyncio.CancelledError:
-        pass
-    except KeyboardInterrupt:
-        server.stop()
+    else:
+        try:
+            if args.socket is not None:
+                address = str(args.socket)
+                serve = server.start_unix(address)
+            else:
+                address = f"{args.host}:{args.port}"
+                serve = server.start_tcp(args.host, args.port)
+
+            print(f"Waiting for connection on {address}...", end="\r", flush=True)
+            asyncio.run(serve)
+        except asyncio.CancelledError:
+            pass
+        except KeyboardInterrupt:
+            server.stop()
 
     if console is not None:
         console.show_cursor(True)
@@ -202,56 +204,6 @@ def start_recording(args, extra: list[str]):
             exporter(str(destination), **kwargs)
 
 
-def setup_filter_args(cmd: argparse.ArgumentParser):
-    """Add arguments that can be used to filter messages."""
-
-    filter_ = cmd.add_argument_group(
-        title="filter options",
-        description=(
-            "select which messages to record, mutliple options will be ANDed together. "
-            "Does not apply to raw message capture"
-        ),
-    )
-    filter_.add_argument(
-        "--message-source",
-        default="both",
-        choices=["client", "server", "both"],
-        help="only include messages from the given source",
-    )
-    filter_.add_argument(
-        "--include-message-type",
-        action="append",
-        default=[],
-        dest="include_message_types",
-        choices=["request", "response", "result", "error", "notification"],
-        help="only include the given message type(s)",
-    )
-    filter_.add_argument(
-        "--exclude-message-type",
-        action="append",
-        dest="exclude_message_types",
-        default=[],
-        choices=["request", "response", "result", "error", "notification"],
-        help="omit the given message type(s)",
-    )
-    filter_.add_argument(
-        "--include-method",
-        action="append",
-        dest="include_methods",
-        default=[],
-        metavar="METHOD",
-        help="only include the given messages for the given method(s)",
-    )
-    filter_.add_argument(
-        "--exclude-method",
-        action="append",
-        dest="exclude_methods",
-        default=[],
-        metavar="METHOD",
-        help="omit messages for the given method(s)",
-    )
-
-
 def cli(commands: argparse._SubParsersAction):
     cmd: argparse.ArgumentParser = commands.add_parser(
         "record",
@@ -274,6 +226,23 @@ default) and push messages to it and have them be recorded.
     connect.add_argument(
         "-p", "--port", type=int, default=8765, help="the port to connect to."
     )
+    connect.add_argument(
+        "--socket",
+        default=None,
+        metavar="PATH",
+        type=pathlib.Path,
+        help="listen on the Unix domain socket at PATH, instead of a TCP port.",
+    )
+    connect.add_argument(
+        "--from-capture",
+        default=None,
+        metavar="FILE",
+        type=pathlib.Path,
+        help=(
+            "read messages from a file written by 'lsp-devtools agent --record-to', "
+            "rather than waiting for an agent to connect"
+        ),
+    )
 
     capture = cmd.add_mutually_exclusive_group()
     capture.add_argument(
@@ -288,7 +257,13 @@ default) and push messages to it and have them be recorded.
         help="capture the rpc messages sent between client and server.",
     )
 
-    setup_filter_args(cmd)
+    setup_filter_args(
+        cmd,
+        description=(
+            "select which messages to record, mutliple options will be ANDed together. "
+            "Does not apply to raw message capture"
+        ),
+    )
     format_ = cmd.add_argument_group(
         title="formatting options",
         description=(
@@ -8,6 +8,8 @@ from functools import partial
 
 import lsprotocol.types
 
+from lsp_devtools import codec
+
 if typing.TYPE_CHECKING:
     from typing import Any
     from typing import Callable
@@ -17,7 +19,16 @@ def format_json(obj: dict, *, indent: str | int | None = 2) -> str:
     if isinstance(obj, str):
         return obj
 
-    return json.dumps(obj, indent=indent)
+    if indent is None:
+        # Compact output keeps the standard library's separators, so that files
+        # written by ``lsp-devtools record`` look the same whichever backend is used.
+        return json.dumps(obj)
+
+    if isinstance(indent, str):
+        # Only the standard library supports indenting with an arbitrary string.
+        return json.dumps(obj, indent=indent)
+
+    return codec.dumps(obj, indent=indent)
 
 
 def format_position(position: dict) -> str:
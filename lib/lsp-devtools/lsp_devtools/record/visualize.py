@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import logging
 import typing
+from collections.abc import Mapping
 
 from rich import progress
 from rich.measure import Measurement
@@ -9,6 +10,8 @@ from rich.segment import Segment
 from rich.style import Style
 
 if typing.TYPE_CHECKING:
+    from typing import Any
+
     from rich.console import Console
     from rich.console import ConsoleOptions
     from rich.console import RenderResult
@@ -147,20 +150,22 @@ class SpinnerHandler(logging.Handler):
     def emit(self, record: logging.LogRecord):
         message = record.args
 
-        if not isinstance(message, dict):
+        if not isinstance(message, Mapping):
             return
 
         self.progress.start()
 
         method = message.get("method", None)
         source = record.__dict__["Message-Source"]
-        args = {}
+
+        # The task's custom fields, rather than any of update's own arguments.
+        fields: dict[str, Any] = {}
 
         if method:
-            args[f"{source}_method"] = method
+            fields[f"{source}_method"] = method
             count = getattr(self, f"{source}_count") + 1
 
             setattr(self, f"{source}_count", count)
-            args[f"{source}_count"] = count
+            fields[f"{source}_count"] = count
 
-        self.progress.update(self.task, **args)
+        self.progress.update(self.task, **fields)
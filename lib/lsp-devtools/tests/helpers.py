@@ -0,0 +1,42 @@
+"""Helpers shared by the tests."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+
+
+def format_message(obj, headers: list[str] | None = None) -> bytes:
+    """Return the given object as a ``Content-Length`` framed message, with any
+    additional headers."""
+    content = json.dumps(obj).encode("utf8")
+    header_lines = [f"Content-Length: {len(content)}", *(headers or [])]
+    return "".join(f"{h}\r\n" for h in header_lines).encode() + b"\r\n" + content
+
+
+def make_message(**kwargs) -> bytes:
+    """Return a framed JSON-RPC message with the given fields."""
+    return format_message(dict(jsonrpc="2.0", **kwargs))
+
+
+class Destination:
+    """A stand in for a ``StreamWriter``, keeping everything written to it."""
+
+    def __init__(self):
+        self.data: list[bytes] = []
+        self.times: list[float] = []
+        """The loop time of each write."""
+        self.drains = 0
+
+    def write(self, data: bytes):
+        self.data.append(data)
+        self.times.append(asyncio.get_running_loop().time())
+
+    def writelines(self, data: list[bytes]):
+        self.write(b"".join(data))
+
+    async def drain(self):
+        self.drains += 1
+
+    def is_closing(self) -> bool:
+        return False
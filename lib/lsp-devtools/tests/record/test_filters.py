@@ -3,6 +3,7 @@ import logging
 
 import pytest
 
+from lsp_devtools.agent import parse_rpc_message
 from lsp_devtools.record.filters import LSPFilter
 
 
@@ -384,3 +385,21 @@ def test_filter_format_message():
 
     assert lsp.filter(record) is True
     assert record.msg == "file:///path/to/file.txt"
+
+
+def test_filter_lazy_message():
+    """Ensure that filtering a lazily parsed message does not require it to be
+    decoded."""
+
+    lsp = LSPFilter(include_methods=["initialize"], include_message_types=["request"])
+    message = parse_rpc_message(
+        b'Content-Length: 53\r\n\r\n{"id": 1, "method": "initialize", "params": {"a": 1}}',
+        lazy=True,
+    ).body
+
+    record = logging.LogRecord("example", logging.INFO, "", 0, "%s", message, None)
+    record.__dict__["Message-Source"] = "client"
+
+    assert record.args is message
+    assert lsp.filter(record) is True
+    assert message._body is None  # type: ignore[attr-defined]
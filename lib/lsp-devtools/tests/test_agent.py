@@ -1,29 +1,37 @@
+from __future__ import annotations
+
 import asyncio
+import io
 import json
 import os
 import pathlib
 import subprocess
 import sys
+import time
 
 import pytest
+from helpers import Destination
+from helpers import format_message
 
 from lsp_devtools.agent import Agent
+from lsp_devtools.agent import LazyMessageBody
+from lsp_devtools.agent import MessageFilter
+from lsp_devtools.agent import parse_rpc_message
+from lsp_devtools.agent.agent import aio_copy_lines
+from lsp_devtools.agent.framing import FramePiece
+from lsp_devtools.agent.metadata import SOURCES
+from lsp_devtools.agent.metadata import unpack_records
+from lsp_devtools.agent.netsim import LinkConditions
+from lsp_devtools.agent.observer import ObservationQueue
+from lsp_devtools.agent.observer import ObserverThread
+from lsp_devtools.agent.policies import Policy
+from lsp_devtools.agent.policies import RecordPolicies
+from lsp_devtools.agent.stalls import StallDetector
+from lsp_devtools.agent.truncate import TRUNCATED
 
 SERVER_DIR = pathlib.Path(__file__).parent / "servers"
 
 
-def format_message(obj):
-    content = json.dumps(obj)
-    message = "".join(
-        [
-            f"Content-Length: {len(content)}\r\n",
-            "\r\n",
-            f"{content}",
-        ]
-    )
-    return message.encode()
-
-
 def echo_handler(d: bytes):
     sys.stdout.buffer.write(d)
     sys.stdout.flush()
@@ -84,3 +92,566 @@ async def test_agent_exits():
             raise RuntimeError("Server process did not exit") from exc
 
         exc.add_note("lsp-devtools agent did not stop")
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        dict(jsonrpc="2.0", id=1, method="initialize", params=dict(capabilities={})),
+        dict(jsonrpc="2.0", method="textDocument/didOpen", params=dict(text="ü")),
+        dict(jsonrpc="2.0", id=1, result=None),
+        dict(jsonrpc="2.0", id=1, error=dict(code=-32601, message="Not found")),
+    ],
+)
+def test_parse_rpc_message_lazy(message: dict):
+    """Ensure that lazily parsed messages behave the same as eagerly parsed ones."""
+
+    data = b"Message-Source: client\r\n" + format_message(message)
+
+    eager = parse_rpc_message(data)
+    lazy = parse_rpc_message(data, lazy=True)
+
+    assert (
+        eager.headers
+        == lazy.headers
+        == {
+            "Message-Source": "client",
+            "Content-Length": str(len(json.dumps(message))),
+        }
+    )
+    assert eager.body == message
+
+    body = lazy.body
+    assert isinstance(body, LazyMessageBody)
+
+    # Routing fields should be available without decoding the message
+    assert body.get("id") == message.get("id")
+    assert body.get("method") == message.get("method")
+    assert ("result" in body) is ("result" in message)
+    assert len(body) == len(message)
+    assert body._body is None
+
+    # Everything else requires decoding
+    assert body.get("params") == message.get("params")
+    assert body._body is not None
+    assert dict(body) == message
+
+
+@pytest.mark.parametrize(
+    "data, error",
+    [
+        (b'{"id": 1}', "Missing message body"),
+        (b"Content-Type: application/json\r\n\r\n{}", "Missing 'Content-Length'"),
+        (b"Content-Length: 3\r\n\r\n{}", "Incorrect 'Content-Length'"),
+        (b"Content-Length 2\r\n\r\n{}", "Invalid header"),
+    ],
+)
+def test_parse_rpc_message_invalid(data: bytes, error: str):
+    """Ensure that we reject invalid messages."""
+
+    with pytest.raises(ValueError, match=error):
+        parse_rpc_message(data)
+
+
+@pytest.mark.asyncio
+async def test_agent_filter():
+    """Ensure that the agent only passes the messages accepted by its filter onto the
+    handler, while still forwarding everything."""
+
+    observed: list[bytes] = []
+    agent = Agent(
+        None,  # type: ignore[arg-type]
+        None,  # type: ignore[arg-type]
+        None,  # type: ignore[arg-type]
+        observed.append,
+        message_filter=MessageFilter(include_methods=["textDocument/completion"]),
+    )
+
+    messages = [
+        ("client", dict(jsonrpc="2.0", id=1, method="textDocument/completion")),
+        ("client", dict(jsonrpc="2.0", method="textDocument/didChange", params={})),
+        ("server", dict(jsonrpc="2.0", id=1, method="textDocument/completion")),
+        ("server", dict(jsonrpc="2.0", id=1, result=[])),
+        ("client", dict(jsonrpc="2.0", id=1, result=None)),
+    ]
+
+    dest = Destination()
+    for source, message in messages:
+        await agent.forward_message(source, dest, format_message(message))  # type: ignore[arg-type]
+
+    assert dest.data == [format_message(m) for _, m in messages]
+
+    assert len(observed) == 4
+    for data in observed:
+        assert b"textDocument/didChange" not in data
+
+
+def test_agent_clock():
+    """Ensure that the agent's clock is anchored to the wall clock and never goes
+    backwards."""
+    agent = Agent(None, None, None, print)  # type: ignore[arg-type]
+
+    before = time.time_ns()
+    timestamps = [agent.now() for _ in range(1000)]
+
+    assert timestamps == sorted(timestamps)
+    assert abs(timestamps[0] - before) < 1_000_000_000
+
+
+def test_agent_latency():
+    """Ensure that the agent measures the time taken to respond to requests."""
+    agent = Agent(None, None, None, print)  # type: ignore[arg-type]
+
+    def latency(source: str, message: dict, timestamp: int):
+        return agent.measure_latency(source, format_message(message), timestamp)
+
+    assert latency("client", dict(jsonrpc="2.0", id=1, method="a"), 100) is None
+    assert latency("server", dict(jsonrpc="2.0", id=1, method="b"), 150) is None
+    assert latency("client", dict(jsonrpc="2.0", method="c"), 200) is None
+
+    # Responses are matched with requests from the other side
+    assert latency("server", dict(jsonrpc="2.0", id=1, result=None), 300) == 200
+    assert latency("client", dict(jsonrpc="2.0", id=1, result=None), 350) == 200
+
+    # Unknown, or already answered requests
+    assert latency("server", dict(jsonrpc="2.0", id=1, result=None), 400) is None
+    assert latency("server", dict(jsonrpc="2.0", id=2, error={}), 400) is None
+    assert agent._pending == {}
+
+
+@pytest.mark.asyncio
+async def test_copy_lines():
+    """Ensure that data is copied as-is, while lines are assembled across reads and
+    long lines are split."""
+    reader = asyncio.StreamReader()
+    for chunk in [b"one\ntw", b"o\r\n", b"x" * 10, b"y\nthree"]:
+        reader.feed_data(chunk)
+    reader.feed_eof()
+
+    dest = io.BytesIO()
+    lines: list[bytes] = []
+    await aio_copy_lines(reader, dest, lines.append, max_length=8)
+
+    assert dest.getvalue() == b"one\ntwo\r\n" + b"x" * 10 + b"y\nthree"
+    assert lines == [b"one", b"two", b"x" * 8, b"xxy", b"three"]
+
+
+@pytest.mark.asyncio
+async def test_copy_lines_slow_dest():
+    """Ensure that a slow destination does not block the event loop."""
+
+    class SlowDest(io.BytesIO):
+        def write(self, data):
+            time.sleep(0.2)
+            return super().write(data)
+
+    reader = asyncio.StreamReader()
+    reader.feed_data(b"hello\n")
+    reader.feed_eof()
+
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    ticker = asyncio.create_task(tick())
+    dest = SlowDest()
+    await aio_copy_lines(reader, dest)
+    ticker.cancel()
+
+    assert dest.getvalue() == b"hello\n"
+    assert ticks >= 5
+
+
+@pytest.mark.asyncio
+async def test_agent_stderr():
+    """Ensure that lines of stderr are recorded as notifications from the server."""
+    observed: list[bytes] = []
+    agent = Agent(None, None, None, observed.append)  # type: ignore[arg-type]
+
+    before = agent.now()
+    await agent.observe_stderr(b"Starting server \xff")
+
+    assert len(observed) == 1
+    ((source, _, timestamp, _, message),) = unpack_records(observed[0])
+    assert SOURCES[source] == "server"
+    assert timestamp >= before
+
+    parsed = parse_rpc_message(message)
+    assert parsed.body == {
+        "jsonrpc": "2.0",
+        "method": "$/lsp-devtools/stderr",
+        "params": {"message": "Starting server \ufffd"},
+    }
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["inline", "queue", "observer"])
+async def test_agent_stderr_policies(mode: str):
+    """Ensure that lines of stderr are prepared the same way as any other message,
+    however they are observed."""
+    observed: list[bytes] = []
+    queue = ObservationQueue() if mode == "queue" else None
+    observer = ObserverThread() if mode == "observer" else None
+    agent = Agent(
+        None,  # type: ignore[arg-type]
+        None,  # type: ignore[arg-type]
+        None,  # type: ignore[arg-type]
+        observed.append,
+        queue=queue,
+        observer=observer,
+        policies=RecordPolicies(
+            [Policy.parse("$/lsp-devtools/stderr:params.message=drop")]
+        ),
+    )
+    if observer is not None:
+        observer.start()
+
+    await agent.observe_stderr(b"x" * 100)
+    if queue is not None:
+        agent._prepare_and_observe(queue.get_nowait())  # type: ignore[arg-type]
+
+    if observer is not None:
+        await observer.stop()
+
+    ((_, _, _, _, message),) = unpack_records(observed[0])
+    assert parse_rpc_message(message).body["params"] == {}
+    assert set(agent._policy_bytes.values) == {"server"}
+
+
+@pytest.mark.asyncio
+async def test_agent_network_conditions():
+    """Ensure that messages are delayed according to the simulated network conditions,
+    while still being observed as soon as they are seen."""
+    observed: list[bytes] = []
+    agent = Agent(
+        None,  # type: ignore[arg-type]
+        None,  # type: ignore[arg-type]
+        None,  # type: ignore[arg-type]
+        observed.append,
+        network={"server": LinkConditions(latency=0.05), "client": LinkConditions()},
+    )
+    assert list(agent.links) == ["server"]
+
+    client, server = Destination(), Destination()
+    request = format_message(dict(jsonrpc="2.0", id=1, method="initialize"))
+    response = format_message(dict(jsonrpc="2.0", id=1, result={}))
+
+    await agent.forward_message("client", server, request)  # type: ignore[arg-type]
+    await agent.forward_message("server", client, response)  # type: ignore[arg-type]
+
+    assert server.data == [request]
+    assert client.data == []
+    assert len(observed) == 2
+
+    await asyncio.sleep(0.1)
+    assert client.data == [response]
+
+
+@pytest.mark.asyncio
+async def test_agent_forward_burst():
+    """Ensure that a burst of messages is written, and drained, once while each
+    message is still observed individually."""
+    observed: list[bytes] = []
+    agent = Agent(None, None, None, observed.append)  # type: ignore[arg-type]
+
+    messages = [
+        format_message(dict(jsonrpc="2.0", method="$/progress", params={"n": idx}))
+        for idx in range(10)
+    ]
+
+    dest = Destination()
+    await agent.forward_messages("server", dest, messages)  # type: ignore[arg-type]
+
+    assert dest.data == [b"".join(messages)]
+    assert dest.drains == 1
+    assert len(observed) == 10
+    assert agent._messages.values == {"server": 10}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("max_record_size", [None, 1024])
+async def test_agent_forward_pieces(max_record_size: int | None):
+    """Ensure that a large message is forwarded piece by piece, and is recorded once
+    complete, truncated if necessary."""
+    observed: list[bytes] = []
+    agent = Agent(
+        None,  # type: ignore[arg-type]
+        None,  # type: ignore[arg-type]
+        None,  # type: ignore[arg-type]
+        observed.append,
+        max_record_size=max_record_size,
+    )
+
+    request = format_message(dict(jsonrpc="2.0", id=1, method="workspace/symbol"))
+    await agent.forward_message("client", Destination(), request)  # type: ignore[arg-type]
+
+    response = format_message(dict(jsonrpc="2.0", id=1, result=["x" * 100_000]))
+    pieces = [
+        FramePiece(response[idx : idx + 8192], idx, len(response))
+        for idx in range(0, len(response), 8192)
+    ]
+
+    dest = Destination()
+    for piece in pieces[:-1]:
+        await agent.forward_piece("server", dest, piece)  # type: ignore[arg-type]
+
+    assert dest.data == [p.data for p in pieces[:-1]]
+    assert len(observed) == 1
+
+    await agent.forward_piece("server", dest, pieces[-1])  # type: ignore[arg-type]
+    assert b"".join(dest.data) == response
+    assert dest.drains == len(pieces)
+
+    assert len(observed) == 2
+    ((_, _, _, latency, message),) = unpack_records(observed[1])
+    assert latency is not None
+
+    if max_record_size is None:
+        assert message == response
+        assert agent._truncated.values == {}
+    else:
+        body = parse_rpc_message(message).body
+        assert body["id"] == 1
+        length = len(response) - response.index(b"\r\n\r\n") - 4
+        assert body["result"][TRUNCATED]["length"] == length
+        assert agent._truncated.values == {"server": 1}
+
+    assert agent._messages.values == {"client": 1, "server": 1}
+    assert agent._streams == {}
+
+
+@pytest.mark.asyncio
+async def test_agent_policies():
+    """Ensure that the agent applies its policies to the messages it records, while
+    still forwarding them as-is."""
+    observed: list[bytes] = []
+    agent = Agent(
+        None,  # type: ignore[arg-type]
+        None,  # type: ignore[arg-type]
+        None,  # type: ignore[arg-type]
+        observed.append,
+        policies=RecordPolicies(
+            [Policy.parse("textDocument/didOpen:params.textDocument.text=drop")]
+        ),
+    )
+
+    message = format_message(
+        dict(
+            jsonrpc="2.0",
+            method="textDocument/didOpen",
+            params=dict(textDocument=dict(uri="file:///a", text="x" * 1000)),
+        )
+    )
+
+    dest = Destination()
+    await agent.forward_message("client", dest, message)  # type: ignore[arg-type]
+    assert dest.data == [message]
+
+    ((_, _, _, _, record),) = unpack_records(observed[0])
+    assert parse_rpc_message(record).body["params"] == {
+        "textDocument": {"uri": "file:///a"}
+    }
+    assert agent._policy_bytes.values == {"client": len(message) - len(record)}
+
+
+@pytest.mark.asyncio
+async def test_agent_policies_filtered():
+    """Ensure that policies are only applied to the messages kept by the filter, while
+    responses are still matched with requests the filter discards."""
+    observed: list[bytes] = []
+    agent = Agent(
+        None,  # type: ignore[arg-type]
+        None,  # type: ignore[arg-type]
+        None,  # type: ignore[arg-type]
+        observed.append,
+        message_filter=MessageFilter(message_source="server"),
+        policies=RecordPolicies(
+            [
+                Policy.parse("*:params.textDocument.text=drop"),
+                Policy.parse("textDocument/completion:result.items=drop"),
+            ]
+        ),
+    )
+    messages = [
+        ("client", dict(jsonrpc="2.0", id=1, method="textDocument/completion")),
+        (
+            "client",
+            dict(
+                jsonrpc="2.0",
+                method="textDocument/didOpen",
+                params=dict(textDocument=dict(uri="file:///a", text="x" * 1000)),
+            ),
+        ),
+        ("server", dict(jsonrpc="2.0", id=1, result=dict(items=["x" * 100]))),
+    ]
+
+    dest = Destination()
+    for source, message in messages:
+        await agent.forward_message(source, dest, format_message(message))  # type: ignore[arg-type]
+
+    assert len(observed) == 1
+    ((source, _, _, _, record),) = unpack_records(observed[0])
+    assert SOURCES[source] == "server"
+    assert parse_rpc_message(record).body["result"] == {}
+    assert set(agent._policy_bytes.values) == {"server"}
+
+
+@pytest.mark.asyncio
+async def test_agent_observer_thread():
+    """Ensure that messages are recorded the same way when observed on a dedicated
+    thread."""
+
+    messages = [
+        ("client", dict(jsonrpc="2.0", id=1, method="textDocument/completion")),
+        ("client", dict(jsonrpc="2.0", method="textDocument/didChange", params={})),
+        ("server", dict(jsonrpc="2.0", id=1, result=dict(items=["x" * 100]))),
+        ("server", dict(jsonrpc="2.0", method="window/logMessage", params={})),
+    ]
+
+    async def record(observer: ObserverThread | None):
+        observed: list[bytes] = []
+        agent = Agent(
+            None,  # type: ignore[arg-type]
+            None,  # type: ignore[arg-type]
+            None,  # type: ignore[arg-type]
+            observed.append,
+            message_filter=MessageFilter(exclude_methods=["window/logMessage"]),
+            policies=RecordPolicies(
+                [Policy.parse("textDocument/completion:result.items=drop")]
+            ),
+            observer=observer,
+        )
+
+        dest = Destination()
+        for source, message in messages:
+            await agent.forward_message(source, dest, format_message(message))  # type: ignore[arg-type]
+
+        await agent.observe_stderr(b"hello")
+        if observer is not None:
+            await observer.stop()
+
+        assert dest.data == [format_message(m) for _, m in messages]
+        return [
+            (source, message, latency is not None)
+            for data in observed
+            for (source, _, _, latency, message) in unpack_records(data)
+        ]
+
+    observer = ObserverThread()
+    observer.start()
+
+    expected = await record(None)
+    assert len(expected) == 4
+    assert await record(observer) == expected
+
+
+@pytest.mark.asyncio
+async def test_agent_queue():
+    """Ensure that queued messages are prepared by the queue's consumer, off the
+    forwarding path, and that a burst larger than the queue is not lost while the
+    consumer keeps up."""
+    observed: list[bytes] = []
+    queue = ObservationQueue(maxsize=16, overflow="drop-oldest")
+    agent = Agent(
+        None,  # type: ignore[arg-type]
+        None,  # type: ignore[arg-type]
+        None,  # type: ignore[arg-type]
+        observed.append,
+        queue=queue,
+        policies=RecordPolicies([Policy.parse("window/logMessage:params=drop")]),
+    )
+    messages = [
+        format_message(
+            dict(jsonrpc="2.0", method="window/logMessage", params=dict(message=f"{i}"))
+        )
+        for i in range(101)
+    ]
+
+    dest = Destination()
+    await agent.forward_message("server", dest, messages[0])  # type: ignore[arg-type]
+    assert len(queue) == 1
+    assert agent._policy_bytes.values == {}
+
+    consumer = asyncio.create_task(agent._process_queue(queue))
+    await agent.forward_messages("server", dest, messages[1:])  # type: ignore[arg-type]
+    await asyncio.sleep(0)
+    consumer.cancel()
+
+    assert len(observed) == len(messages)
+    assert queue.dropped == 0
+    for data in observed:
+        ((_, _, _, _, record),) = unpack_records(data)
+        assert "params" not in parse_rpc_message(record).body
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("queue_size", [0, 16])
+async def test_agent_stalls(capsys, queue_size: int):
+    """Ensure that requests left unanswered beyond their threshold are reported, along
+    with their eventual response, in order with the other observed messages."""
+    observed: list[bytes] = []
+    queue = ObservationQueue(maxsize=queue_size) if queue_size > 0 else None
+    agent = Agent(
+        None,  # type: ignore[arg-type]
+        None,  # type: ignore[arg-type]
+        None,  # type: ignore[arg-type]
+        observed.append,
+        queue=queue,
+        stalls=StallDetector({"slow": 0.05, "fast": 0.01}),
+    )
+    dest = Destination()
+    if queue is not None:
+        consumer = asyncio.create_task(agent._process_queue(queue))
+
+    async def send(source: str, **message):
+        data = format_message(dict(jsonrpc="2.0", **message))
+        await agent.forward_message(source, dest, data)  # type: ignore[arg-type]
+
+    await send("client", id=1, method="slow")
+    await send("client", id=2, method="fast")
+    await send("server", id=1, method="fast")
+    await send("client", id=3, method="other")
+    await send("client", id=1, result=None)  # Answered in time
+
+    await asyncio.sleep(0.1)
+    await send("server", id=1, result=None)
+    await send("server", id=3, result=None)
+    await asyncio.sleep(0.01)
+
+    if queue is not None:
+        consumer.cancel()
+
+    events = []
+    for data in observed:
+        ((source, _, timestamp, _, message),) = unpack_records(data)
+        body = parse_rpc_message(message).body
+        if body.get("method") == "$/lsp-devtools/stall":
+            params = body["params"]
+            events.append((SOURCES[source], params["state"], params["id"]))
+            assert params["elapsed"] >= (0.05 if params["method"] == "slow" else 0.01)
+        else:
+            events.append((SOURCES[source], body.get("method"), body["id"]))
+
+    assert events == [
+        ("client", "slow", 1),
+        ("client", "fast", 2),
+        ("server", "fast", 1),
+        ("client", "other", 3),
+        ("client", None, 1),
+        ("server", "stalled", 2),
+        ("server", "stalled", 1),
+        ("server", None, 1),
+        ("server", None, 3),
+        ("server", "resolved", 1),
+    ]
+    assert agent.stalls.stalled == 1  # type: ignore[union-attr]
+    assert agent._stalled.values == {"fast": 1, "slow": 1}
+
+    err = capsys.readouterr().err
+    assert "Request 'slow' (1) from the client has not been answered" in err
+    assert "Request 'fast' (2) from the client has not been answered" in err
+    assert "Request 'slow' (1) from the client was answered" in err
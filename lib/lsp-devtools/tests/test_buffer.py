@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import socket
+
+import pytest
+
+from lsp_devtools.agent import AgentClient
+from lsp_devtools.agent import AgentServer
+from lsp_devtools.agent import MessageBuffer
+from lsp_devtools.agent.metadata import pack_record
+
+
+def test_buffer_max_messages():
+    """Ensure that the oldest messages are discarded once the buffer is full."""
+    buffer = MessageBuffer(max_messages=3)
+    for idx in range(5):
+        buffer.append(str(idx).encode())
+
+    assert len(buffer) == 3
+    assert buffer.dropped == 2
+    assert buffer.dropped_bytes == 2
+    assert list(buffer.drain()) == [b"2", b"3", b"4"]
+    assert len(buffer) == 0
+    assert buffer.nbytes == 0
+
+
+def test_buffer_max_bytes():
+    """Ensure that the oldest messages are discarded once the buffer is too large."""
+    buffer = MessageBuffer(max_bytes=10)
+    buffer.append(b"a" * 4)
+    buffer.append(b"b" * 4)
+    buffer.append(b"c" * 4)
+
+    assert buffer.nbytes == 8
+    assert buffer.dropped == 1
+    assert buffer.dropped_bytes == 4
+    assert list(buffer.drain()) == [b"b" * 4, b"c" * 4]
+
+    # Messages too large to ever fit are discarded
+    buffer.append(b"d" * 11)
+    assert len(buffer) == 0
+    assert buffer.dropped == 2
+
+
+def test_buffer_invalid():
+    with pytest.raises(ValueError):
+        MessageBuffer(max_messages=0)
+
+
+@pytest.mark.asyncio
+async def test_client_reports_dropped(caplog):
+    """Ensure that the client reports the messages it discarded before connecting."""
+    received: list[bytes] = []
+    done = asyncio.Event()
+
+    def handler(data, metadata):
+        received.append(data)
+        if len(received) == 2:
+            done.set()
+
+    frames = [f'Content-Length: 8\r\n\r\n{{"x": {idx}}}'.encode() for idx in range(5)]
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    server = AgentServer(handler=handler)
+    server_task = asyncio.create_task(server.start_tcp("127.0.0.1", port))
+    while server._tcp_server is None:
+        await asyncio.sleep(0.01)
+
+    client = AgentClient(buffer=MessageBuffer(max_messages=2))
+    for frame in frames:
+        client.forward_message(pack_record("client", 0, 0, frame))
+
+    with caplog.at_level(logging.WARNING):
+        await client.start_tcp("127.0.0.1", port)
+        await asyncio.wait_for(done.wait(), timeout=5)
+
+    assert [data[-8:] for data in received] == [f[-8:] for f in frames[-2:]]
+    assert "discarded 3 message(s)" in caplog.text
+
+    client.protocol.writer.close()
+    await client.stop()
+    server.stop()
+    server_task.cancel()
+
+
+class CongestedWriter:
+    """A writer whose transport is always holding ``size`` bytes."""
+
+    def __init__(self):
+        self.size = 0
+        self.data: list[bytes] = []
+        self.drained = asyncio.Event()
+        self.transport = self
+
+    def get_write_buffer_size(self) -> int:
+        return self.size
+
+    def write(self, data: bytes):
+        self.data.append(data)
+
+    async def drain(self):
+        await self.drained.wait()
+
+
+@pytest.mark.asyncio
+async def test_client_write_buffer_limit():
+    """Ensure that the client holds onto messages while the server catches up."""
+    client = AgentClient(buffer=MessageBuffer(max_messages=2), write_buffer_limit=100)
+    writer = CongestedWriter()
+    client.protocol.set_writer(writer)  # type: ignore[arg-type]
+    client.connected = True
+
+    frames = [f'Content-Length: 8\r\n\r\n{{"x": {idx}}}'.encode() for idx in range(4)]
+    client.forward_message(pack_record("client", 0, 0, frames[0]))
+    assert len(writer.data) == 1
+
+    writer.size = 200
+    for frame in frames[1:]:
+        client.forward_message(pack_record("client", 0, 0, frame))
+
+    assert len(writer.data) == 1
+    assert client.buffered == 2
+
+    writer.size = 0
+    writer.drained.set()
+    while client._drain_task is not None:
+        await asyncio.sleep(0)
+
+    # The oldest buffered message was discarded, and reported to the server.
+    assert len(writer.data) == 4
+    assert b"$/lsp-devtools/dropped" in writer.data[1]
+    for data, frame in zip(
+        [writer.data[0], *writer.data[2:]], [frames[0], *frames[2:]]
+    ):
+        assert data.endswith(frame)
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import pytest
+from helpers import format_message
+
+from lsp_devtools.agent.capture import CAPTURE_HEADER
+from lsp_devtools.agent.capture import CAPTURE_MAGIC
+from lsp_devtools.agent.capture import CaptureWriter
+from lsp_devtools.agent.capture import read_capture
+from lsp_devtools.agent.metadata import MessageMetadata
+from lsp_devtools.agent.metadata import pack_record
+
+
+def test_capture_roundtrip(tmp_path):
+    """Ensure that captured messages can be read back, across multiple sessions."""
+    path = tmp_path / "session.capture"
+
+    writer = CaptureWriter(path, "session-a")
+    for idx in range(100):
+        writer.write(pack_record("client", 0, idx, format_message(dict(x=idx))))
+    writer.write(
+        pack_record("server", 0, 100, format_message(dict(x=100)), latency_ns=5)
+    )
+    writer.close()
+
+    writer = CaptureWriter(path, "session-b")
+    writer.write(pack_record("client", 0, 101, format_message(dict(x=101))))
+    writer.close()
+
+    messages = list(read_capture(path))
+    assert len(messages) == 102
+    assert [m for m, _ in messages] == [
+        format_message(dict(x=idx)) for idx in range(102)
+    ]
+
+    assert messages[0][1] == MessageMetadata("client", "session-a", 0)
+    assert messages[100][1] == MessageMetadata("server", "session-a", 100, 5)
+    assert messages[101][1] == MessageMetadata("client", "session-b", 101)
+
+
+def test_capture_nbytes(tmp_path):
+    path = tmp_path / "session.capture"
+    record = pack_record("client", 0, 0, format_message(dict(x=0)))
+
+    writer = CaptureWriter(path, "abc")
+    writer.write(record)
+    writer.write(record)
+    writer.close()
+
+    assert writer.nbytes == 2 * len(record)
+    assert path.stat().st_size == CAPTURE_HEADER.size + 3 + 2 * len(record)
+
+
+@pytest.mark.parametrize(
+    "contents",
+    [
+        b"Content-Length: 2\r\n\r\n{}",
+        pack_record("client", 0, 0, format_message(dict(x=0))),
+        CAPTURE_HEADER.pack(CAPTURE_MAGIC, 3) + b"abc" + b"\x00\x00",
+        CAPTURE_HEADER.pack(CAPTURE_MAGIC, 3)
+        + b"abc"
+        + pack_record("client", 0, 0, format_message(dict(x=0)))[:-1],
+    ],
+)
+def test_capture_invalid(tmp_path, contents: bytes):
+    """Ensure that invalid capture files are rejected."""
+    path = tmp_path / "session.capture"
+    path.write_bytes(contents)
+
+    with pytest.raises(ValueError):
+        list(read_capture(path))
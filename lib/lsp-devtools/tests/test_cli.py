@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import argparse
+import subprocess
+import sys
+
+import pytest
+
+from lsp_devtools import codec
+from lsp_devtools.cli import BUILTIN_COMMANDS
+from lsp_devtools.cli import find_command
+
+CHECK_IMPORTS = """\
+import sys
+from lsp_devtools.cli import main
+
+sys.argv = ["lsp-devtools", *{args!r}]
+try:
+    main()
+except SystemExit:
+    pass
+
+print(",".join(sorted(sys.modules)), file=sys.stderr)
+"""
+
+
+def run_cli(*args: str) -> tuple[str, set[str]]:
+    """Run the cli with the given arguments, returning its output and the modules it
+    imported."""
+    result = subprocess.run(
+        [sys.executable, "-c", CHECK_IMPORTS.format(args=list(args))],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout, set(result.stderr.strip().splitlines()[-1].split(","))
+
+
+def test_cli_lists_commands():
+    """Ensure that all commands are listed, without importing any of them."""
+    output, modules = run_cli("--help")
+
+    for name in BUILTIN_COMMANDS:
+        assert name in output
+
+    for module, _ in BUILTIN_COMMANDS.values():
+        assert module not in modules
+
+
+@pytest.mark.parametrize("name", list(BUILTIN_COMMANDS))
+def test_cli_loads_selected_command(name: str):
+    """Ensure that the selected command is loaded in full."""
+    output, modules = run_cli(name, "--help")
+
+    assert f"usage: lsp-devtools {name}" in output
+    assert BUILTIN_COMMANDS[name][0] in modules
+
+
+@pytest.mark.parametrize(
+    "args, expected",
+    [
+        (["record", "--to-file", "agent"], "record"),
+        (["--json-backend", "stdlib", "agent", "--record-to", "record"], "agent"),
+        (["recrod", "--to-file", "agent"], None),
+        (["--json-backend", "unknown", "agent"], None),
+        (["--version"], None),
+    ],
+)
+def test_cli_find_command(args: list[str], expected: str | None):
+    """Ensure that the selected command is the first positional argument, rather than
+    any argument that happens to match the name of a command."""
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument("--json-backend", choices=codec.BACKEND_CHOICES)
+
+    assert find_command(options, args) == expected
+
+
+def test_cli_agent_imports():
+    """The agent runs in front of the editor's language server, so it should not pull in
+    any of the UI libraries."""
+    _, modules = run_cli("agent", "--help")
+
+    for name, (module, _) in BUILTIN_COMMANDS.items():
+        assert (module in modules) == (name == "agent")
+
+    assert "textual" not in modules
+    assert "aiosqlite" not in modules
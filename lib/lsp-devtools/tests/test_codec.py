@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from lsp_devtools import codec
+
+
+def available_backends() -> list[str]:
+    backends = []
+    for name, loader in codec.BACKENDS.items():
+        try:
+            loader()
+            backends.append(name)
+        except ImportError:
+            pass
+
+    return backends
+
+
+@pytest.fixture(params=available_backends())
+def backend(request):
+    """Run the test with each of the available JSON backends."""
+    previous = codec.get_backend()
+    yield codec.set_backend(request.param)
+
+    codec._backend = previous
+
+
+MESSAGE = dict(
+    jsonrpc="2.0",
+    id=1,
+    method="textDocument/completion",
+    params=dict(position=dict(line=1, character=2), items=[1.5, None, True, "a"]),
+)
+
+
+def test_roundtrip(backend: codec.JsonBackend):
+    """Ensure that each backend can encode and decode messages."""
+
+    assert codec.loads(codec.dumps(MESSAGE)) == MESSAGE
+    assert codec.loads(codec.dumps(MESSAGE).encode("utf8")) == MESSAGE
+
+
+def test_dumps_indent(backend: codec.JsonBackend):
+    """Ensure that pretty printed output is consistent across backends."""
+
+    assert codec.dumps(MESSAGE, indent=2) == json.dumps(MESSAGE, indent=2)
+
+
+def test_dumps_default(backend: codec.JsonBackend):
+    """Ensure that the ``default`` hook is used for unknown types."""
+
+    class Position:
+        line = 1
+
+    assert codec.loads(codec.dumps(Position(), default=lambda p: {"line": p.line})) == {
+        "line": 1
+    }
+
+
+@pytest.mark.parametrize("data", [b"{", b'{"a": }', "nope"])
+def test_loads_invalid(backend: codec.JsonBackend, data: bytes | str):
+    """Ensure that invalid JSON is reported as a ``ValueError``."""
+
+    with pytest.raises(ValueError):
+        codec.loads(data)
+
+
+def test_set_backend_unknown():
+    """Ensure that we reject unknown backends."""
+
+    with pytest.raises(ValueError, match="Unknown JSON backend"):
+        codec.set_backend("simdjson")
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import asyncio
+import socket
+import sys
+
+import pytest
+
+from lsp_devtools.agent.daemon import AgentDaemon
+from lsp_devtools.agent.daemon import LaunchRequest
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(socket, "send_fds"), reason="requires passing file descriptors"
+)
+
+
+async def launch(path, *command: str, input_: bytes = b""):
+    """Run the launcher, returning its exit code and output."""
+    launcher = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-m",
+        "lsp_devtools.launch",
+        "--socket",
+        str(path),
+        "--",
+        *command,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await asyncio.wait_for(launcher.communicate(input_), timeout=10)
+    return launcher.returncode, stdout, stderr
+
+
+@pytest.mark.asyncio
+async def test_daemon_launch(tmp_path):
+    """Ensure that the launcher hands its streams over to the daemon, and exits with
+    the server's exit code."""
+    requests: list[LaunchRequest] = []
+
+    async def handler(request: LaunchRequest) -> int:
+        requests.append(request)
+        data = request.stdin.read()
+        request.stdout.write(data.upper())
+        request.stderr.write(b"log message\n")
+        return 3
+
+    path = tmp_path / "daemon.sock"
+    daemon = AgentDaemon(handler)
+    task = asyncio.create_task(daemon.serve(str(path)))
+    while not path.exists():
+        await asyncio.sleep(0.01)
+
+    results = await asyncio.gather(
+        launch(path, "server-a", "--stdio", input_=b"hello"),
+        launch(path, "server-b", input_=b"world"),
+    )
+
+    assert sorted(results) == [
+        (3, b"HELLO", b"log message\n"),
+        (3, b"WORLD", b"log message\n"),
+    ]
+    assert sorted(r.command for r in requests) == [
+        ["server-a", "--stdio"],
+        ["server-b"],
+    ]
+    assert all(r.stdin.closed and r.stdout.closed for r in requests)
+
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert not path.exists()
+
+
+@pytest.mark.asyncio
+async def test_daemon_launcher_exits(tmp_path):
+    """Ensure that the session is cancelled if the launcher goes away."""
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def handler(request: LaunchRequest) -> int:
+        started.set()
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+        return 0
+
+    path = tmp_path / "daemon.sock"
+    daemon = AgentDaemon(handler)
+    task = asyncio.create_task(daemon.serve(str(path)))
+    while not path.exists():
+        await asyncio.sleep(0.01)
+
+    launcher = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-m",
+        "lsp_devtools.launch",
+        "--socket",
+        str(path),
+        "--",
+        "server",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+    )
+    await asyncio.wait_for(started.wait(), timeout=10)
+
+    launcher.kill()
+    await launcher.wait()
+    await asyncio.wait_for(cancelled.wait(), timeout=5)
+
+    while len(daemon.sessions) > 0:
+        await asyncio.sleep(0.01)
+
+    task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_launcher_no_daemon(tmp_path):
+    """Ensure that the launcher fails cleanly if the daemon is not running."""
+    returncode, _, stderr = await launch(tmp_path / "missing.sock", "server")
+
+    assert returncode == 1
+    assert b"Unable to connect to agent daemon" in stderr
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import asyncio
+import socket
+
+import pytest
+from helpers import format_message
+
+from lsp_devtools.agent.client import AgentClient
+from lsp_devtools.agent.envelope import COMPRESSORS
+from lsp_devtools.agent.envelope import MIN_COMPRESS_SIZE
+from lsp_devtools.agent.envelope import decode_batch
+from lsp_devtools.agent.envelope import encode_batch
+from lsp_devtools.agent.envelope import is_batch
+from lsp_devtools.agent.envelope import negotiate_compression
+from lsp_devtools.agent.framing import get_header
+from lsp_devtools.agent.metadata import MessageMetadata
+from lsp_devtools.agent.metadata import pack_record
+from lsp_devtools.agent.server import AgentServer
+
+MESSAGES = [
+    format_message(
+        dict(jsonrpc="2.0", method="$/progress", params=dict(value=i)),
+        ["Message-Source: client"],
+    )
+    for i in range(100)
+]
+
+
+@pytest.mark.parametrize("compression", [None, *COMPRESSORS.keys()])
+def test_batch_roundtrip(compression: str | None):
+    """Ensure that frames survive being packed into a batch."""
+    batch = encode_batch(MESSAGES, compression)
+
+    assert is_batch(batch)
+    assert get_header(batch, "Batch-Count") == str(len(MESSAGES))
+    assert get_header(batch, "Content-Encoding") == compression
+    assert list(decode_batch(batch)) == MESSAGES
+
+    if compression is not None:
+        assert len(batch) < len(b"".join(MESSAGES))
+
+
+def test_batch_small():
+    """Ensure that small batches are not compressed."""
+    batch = encode_batch(MESSAGES[:1], "zlib")
+
+    assert len(MESSAGES[0]) < MIN_COMPRESS_SIZE
+    assert get_header(batch, "Content-Encoding") is None
+    assert list(decode_batch(batch)) == MESSAGES[:1]
+
+
+@pytest.mark.parametrize(
+    "batch",
+    [
+        b"Content-Length: 3\r\nContent-Encoding: brotli\r\n\r\nabc",
+        b"Content-Length: 3\r\nContent-Encoding: zlib\r\n\r\nabc",
+        b"Content-Length: 19\r\n\r\nContent-Length: 5\r\n",
+    ],
+)
+def test_batch_invalid(batch: bytes):
+    """Ensure that invalid batches are reported."""
+    with pytest.raises(ValueError):
+        list(decode_batch(batch))
+
+
+def test_negotiate_compression():
+    assert negotiate_compression([]) is None
+    assert negotiate_compression(["brotli"]) is None
+    assert negotiate_compression(["brotli", "zlib"]) == "zlib"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("batch_size", [0, 4096])
+@pytest.mark.parametrize("compression", [[], ["zlib"]])
+async def test_agent_records(batch_size: int, compression: list[str]):
+    """Ensure that the server transparently unpacks the records sent by the client,
+    however they are sent."""
+    session_id = "a-session"
+    frames = [m.replace(b"Message-Source: client\r\n", b"") for m in MESSAGES]
+    records = [
+        pack_record("client", 0, 1_000_000_000 * idx, frame)
+        for idx, frame in enumerate(frames)
+    ]
+
+    received: list[tuple[bytes, MessageMetadata]] = []
+    done = asyncio.Event()
+
+    def handler(data: bytes, metadata: MessageMetadata):
+        received.append((data, metadata))
+        if len(received) == len(records):
+            done.set()
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    server = AgentServer(handler=handler)
+    server_task = asyncio.create_task(server.start_tcp("127.0.0.1", port))
+
+    # Wait for the server to start listening
+    while server._tcp_server is None:
+        await asyncio.sleep(0.01)
+
+    client = AgentClient(
+        session_id=session_id,
+        batch_size=batch_size,
+        batch_delay=0.01,
+        compression=compression,
+    )
+    await client.start_tcp("127.0.0.1", port)
+
+    # Until the server replies, messages are sent with text headers
+    for record in records[:10]:
+        client.forward_message(record)
+
+    while not client.binary:
+        await asyncio.sleep(0.01)
+
+    assert client.batching == (batch_size > 0)
+    assert client.compression == (compression[0] if compression else None)
+
+    for record in records[10:]:
+        client.forward_message(record)
+
+    await asyncio.wait_for(done.wait(), timeout=5)
+
+    for idx, (data, metadata) in enumerate(received):
+        assert data.endswith(frames[idx])
+        assert metadata == MessageMetadata("client", session_id, 1_000_000_000 * idx)
+
+    client.protocol.writer.close()
+    await client.stop()
+    server.stop()
+    server_task.cancel()
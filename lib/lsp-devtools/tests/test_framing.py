@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+from helpers import format_message
+
+from lsp_devtools.agent.agent import aio_read_bursts
+from lsp_devtools.agent.agent import aio_readline
+from lsp_devtools.agent.framing import FrameDecoder
+from lsp_devtools.agent.framing import FramePiece
+from lsp_devtools.agent.framing import get_header
+
+MESSAGES = [
+    format_message(dict(jsonrpc="2.0", id=1, method="initialize", params={})),
+    format_message(
+        dict(jsonrpc="2.0", method="$/progress", params=dict(value="ü")),
+        headers=["Content-Type: application/vscode-jsonrpc; charset=utf-8"],
+    ),
+    format_message(dict(jsonrpc="2.0", id=1, result={})),
+]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 64, 1024])
+def test_decoder_chunked(chunk_size: int):
+    """Ensure that frames are reassembled correctly, no matter how the input stream
+    is split up."""
+
+    data = b"".join(MESSAGES)
+    decoder = FrameDecoder()
+    frames = []
+
+    for idx in range(0, len(data), chunk_size):
+        decoder.feed(data[idx : idx + chunk_size])
+        frames.extend(decoder)
+
+    assert frames == MESSAGES
+    assert len(decoder) == 0
+
+
+@pytest.mark.parametrize(
+    "headers",
+    [
+        "Content-Type: application/vscode-jsonrpc\r\nContent-Length: 2\r\n",
+        "content-length: 2\r\n",
+        "Content-Length:2\r\n",
+        "X-Content-Length: 5\r\nContent-Length: 2\r\n",
+    ],
+)
+def test_decoder_header_order(headers: str):
+    """Ensure that the ``Content-Length`` header is found wherever it appears."""
+
+    frame = headers.encode() + b"\r\n{}"
+    decoder = FrameDecoder()
+    decoder.feed(frame)
+
+    assert list(decoder) == [frame]
+
+
+def test_decoder_missing_content_length():
+    """Ensure that invalid header blocks are reported and skipped."""
+
+    decoder = FrameDecoder()
+    decoder.feed(b"Content-Type: application/vscode-jsonrpc\r\n\r\n" + MESSAGES[0])
+
+    with pytest.raises(ValueError, match="Missing 'Content-Length' header"):
+        decoder.next_frame()
+
+    assert list(decoder) == [MESSAGES[0]]
+
+
+LARGE_MESSAGE = format_message(
+    dict(jsonrpc="2.0", method="textDocument/didOpen", params=dict(text="x" * 1000))
+)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1024, 4096])
+def test_decoder_pieces(chunk_size: int):
+    """Ensure that large frames are returned in pieces as they arrive, while smaller
+    frames are still returned whole."""
+
+    data = MESSAGES[0] + LARGE_MESSAGE + MESSAGES[1]
+    decoder = FrameDecoder(stream_threshold=256)
+    frames: list[bytes] = []
+    pieces: list[FramePiece] = []
+
+    for idx in range(0, len(data), chunk_size):
+        decoder.feed(data[idx : idx + chunk_size])
+
+        while True:
+            if (frame := decoder.next_frame()) is not None:
+                frames.append(frame)
+            elif (piece := decoder.next_piece()) is not None:
+                pieces.append(piece)
+            else:
+                break
+
+        # The large frame is never held in memory in full
+        assert len(decoder) < 256 + chunk_size
+
+    assert len(decoder) == 0
+
+    if chunk_size > len(data):
+        # The large frame was complete by the time it was seen.
+        assert frames == [MESSAGES[0], LARGE_MESSAGE, MESSAGES[1]]
+        assert pieces == []
+        return
+
+    assert frames == [MESSAGES[0], MESSAGES[1]]
+    assert b"".join(p.data for p in pieces) == LARGE_MESSAGE
+    assert pieces[0].is_first
+    assert pieces[0].data.startswith(b"Content-Length")
+    assert pieces[-1].is_last
+    assert not any(p.is_last for p in pieces[:-1])
+    assert all(p.length == len(LARGE_MESSAGE) for p in pieces)
+
+
+@pytest.mark.asyncio
+async def test_aio_readline():
+    """Ensure that ``aio_readline`` passes each message to the handler."""
+
+    reader = asyncio.StreamReader()
+    reader.feed_data(b"".join(MESSAGES))
+    reader.feed_eof()
+
+    frames: list[bytes] = []
+    await aio_readline(reader, frames.append)
+
+    assert frames == MESSAGES
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("max_burst_size", [0, 1024 * 1024])
+async def test_aio_read_bursts(max_burst_size: int):
+    """Ensure that ``aio_read_bursts`` passes the messages available after each read
+    to the handler together, up to the given size."""
+
+    reader = asyncio.StreamReader()
+    reader.feed_data(b"".join(MESSAGES))
+    reader.feed_eof()
+
+    bursts: list[list[bytes]] = []
+
+    async def handler(burst: list[bytes]):
+        bursts.append(burst)
+
+    await aio_read_bursts(reader, handler, max_burst_size)
+
+    if max_burst_size == 0:
+        assert bursts == [[m] for m in MESSAGES]
+    else:
+        assert bursts == [MESSAGES]
+
+
+@pytest.mark.asyncio
+async def test_aio_read_bursts_pieces():
+    """Ensure that ``aio_read_bursts`` passes large messages to the piece handler as
+    they arrive, in order with the other messages."""
+
+    reader = asyncio.StreamReader()
+    events: list[bytes | FramePiece] = []
+
+    async def burst_handler(burst: list[bytes]):
+        events.extend(burst)
+
+    async def piece_handler(piece: FramePiece):
+        events.append(piece)
+
+    task = asyncio.create_task(
+        aio_read_bursts(reader, burst_handler, 0, piece_handler, stream_threshold=256)
+    )
+
+    reader.feed_data(MESSAGES[0] + LARGE_MESSAGE[:300])
+    await asyncio.sleep(0)
+    assert events == [
+        MESSAGES[0],
+        FramePiece(LARGE_MESSAGE[:300], 0, len(LARGE_MESSAGE)),
+    ]
+
+    reader.feed_data(LARGE_MESSAGE[300:] + MESSAGES[1])
+    reader.feed_eof()
+    await task
+
+    assert events[2:] == [
+        FramePiece(LARGE_MESSAGE[300:], 300, len(LARGE_MESSAGE)),
+        MESSAGES[1],
+    ]
+
+
+@pytest.mark.parametrize(
+    "frame, name, expected",
+    [
+        (b"Content-Length: 2\r\n\r\n{}", "Content-Length", "2"),
+        (b"Content-Length: 2\r\n\r\n{}", "content-length", "2"),
+        (b"Content-Length: 2\r\nContent-Type: a/b\r\n\r\n{}", "Content-Type", "a/b"),
+        (b"Content-Length: 2\r\nX-Content-Type: a\r\n\r\n{}", "Content-Type", None),
+        (b'Content-Length: 17\r\n\r\n{"Content-Type":1}', "Content-Type", None),
+        (b"Content-Length: 2", "Content-Length", None),
+    ],
+)
+def test_get_header(frame: bytes, name: str, expected: str | None):
+    """Ensure that we can find the value of a header in a frame."""
+    assert get_header(frame, name) == expected
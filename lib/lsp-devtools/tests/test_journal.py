@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import mmap
+import socket
+
+import pytest
+from helpers import format_message
+
+from lsp_devtools.agent import AgentClient
+from lsp_devtools.agent import AgentServer
+from lsp_devtools.agent.journal import JOURNAL_HEADER
+from lsp_devtools.agent.journal import JOURNAL_MAGIC
+from lsp_devtools.agent.journal import SpillJournal
+from lsp_devtools.agent.metadata import pack_record
+from lsp_devtools.agent.metadata import split_records
+
+
+def make_record(idx: int, size: int = 64) -> bytes:
+    frame = format_message(dict(x=idx, pad="a" * size))
+    return pack_record("client", 0, idx, frame)
+
+
+def test_journal_roundtrip(tmp_path):
+    """Ensure that records written across multiple windows can be read back."""
+    window = mmap.ALLOCATIONGRANULARITY
+    journal = SpillJournal(tmp_path / "test.journal", window_size=window)
+
+    records = [make_record(idx, size=idx * 100) for idx in range(50)]
+    for record in records:
+        journal.append(record)
+
+    assert len(journal) == 50
+    assert journal.length == sum(len(r) for r in records)
+    assert journal.length > 2 * window
+
+    batches = list(journal.read_batches(window))
+    assert sum(count for count, _ in batches) == 50
+    assert all(len(data) <= window or count == 1 for count, data in batches)
+
+    data = b"".join(data for _, data in batches)
+    assert list(split_records(data)) == records
+
+    journal.close(delete=False)
+    contents = (tmp_path / "test.journal").read_bytes()
+    assert JOURNAL_HEADER.unpack_from(contents) == (JOURNAL_MAGIC, journal.length)
+    assert contents[JOURNAL_HEADER.size :] == b"".join(records)
+
+
+def test_journal_large_record(tmp_path):
+    """Ensure that records larger than the batch size are returned on their own."""
+    journal = SpillJournal(tmp_path / "test.journal")
+    records = [make_record(0), make_record(1, size=4096), make_record(2)]
+    for record in records:
+        journal.append(record)
+
+    batches = list(journal.read_batches(1024))
+    assert batches == [(1, records[0]), (1, records[1]), (1, records[2])]
+
+    journal.close()
+    assert not (tmp_path / "test.journal").exists()
+
+
+def test_journal_max_bytes(tmp_path):
+    """Ensure that records are discarded once the journal is full."""
+    record = make_record(0)
+    journal = SpillJournal(tmp_path / "test.journal", max_bytes=2 * len(record))
+
+    for _ in range(5):
+        journal.append(record)
+
+    assert len(journal) == 2
+    assert journal.dropped == 3
+    assert journal.dropped_bytes == 3 * len(record)
+    journal.close()
+
+
+def test_journal_invalid_window(tmp_path):
+    with pytest.raises(ValueError):
+        SpillJournal(tmp_path / "test.journal", window_size=1000)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("batch_size", [0, 1024])
+async def test_client_replays_journal(tmp_path, caplog, batch_size):
+    """Ensure that the client replays the journal once connected."""
+    received: list[bytes] = []
+    done = asyncio.Event()
+
+    records = [make_record(idx) for idx in range(100)]
+    journal = SpillJournal(
+        tmp_path / "test.journal", max_bytes=sum(len(r) for r in records[:95])
+    )
+
+    def handler(data, metadata):
+        received.append(data)
+        if len(received) >= 95:
+            done.set()
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    server = AgentServer(handler=handler)
+    server_task = asyncio.create_task(server.start_tcp("127.0.0.1", port))
+    while server._tcp_server is None:
+        await asyncio.sleep(0.01)
+
+    client = AgentClient(batch_size=batch_size, journal=journal)
+    for record in records:
+        client.forward_message(record)
+
+    with caplog.at_level(logging.WARNING):
+        await client.start_tcp("127.0.0.1", port)
+        await asyncio.wait_for(done.wait(), timeout=5)
+
+    assert [data[-16:] for data in received] == [r[-16:] for r in records[:95]]
+    assert "discarded 5 message(s)" in caplog.text
+    assert not (tmp_path / "test.journal").exists()
+
+    # Once the journal has been replayed, messages are sent directly.
+    while client._journal is not None:
+        await asyncio.sleep(0.01)
+
+    done.clear()
+    client.forward_message(make_record(100))
+    await asyncio.wait_for(done.wait(), timeout=5)
+    assert received[-1][-16:] == make_record(100)[-16:]
+
+    client.protocol.writer.close()
+    await client.stop()
+    server.stop()
+    server_task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_client_replays_journal_without_hello(tmp_path):
+    """Ensure that the journal is still replayed to a server that never replies to the
+    hello."""
+    received = bytearray()
+    records = [make_record(idx) for idx in range(5)]
+
+    async def on_connect(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        while data := await reader.read(65536):
+            received.extend(data)
+
+    server = await asyncio.start_server(on_connect, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+
+    journal = SpillJournal(tmp_path / "test.journal")
+    client = AgentClient(journal=journal, hello_timeout=0.1)
+    for record in records:
+        client.forward_message(record)
+
+    await client.start_tcp("127.0.0.1", port)
+    while client._journal is not None:
+        await asyncio.sleep(0.01)
+
+    # Replayed with text headers, in order.
+    await asyncio.sleep(0.05)
+    positions = [received.find(b'{"x": %d,' % idx) for idx in range(5)]
+    assert -1 not in positions
+    assert positions == sorted(positions)
+    assert b"Message-Source: client" in received
+    assert not (tmp_path / "test.journal").exists()
+
+    client.protocol.writer.close()
+    await client.stop()
+    server.close()
+
+
+@pytest.mark.asyncio
+async def test_client_stop_closes_journal(tmp_path):
+    """Ensure that stopping a client that never connected closes its journal."""
+    journal = SpillJournal(tmp_path / "test.journal")
+    client = AgentClient(journal=journal)
+    client.forward_message(make_record(0))
+    assert client.journal_bytes == len(make_record(0))
+
+    await client.stop()
+    assert client.journal_bytes == 0
+    assert not (tmp_path / "test.journal").exists()
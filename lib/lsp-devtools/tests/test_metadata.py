@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+from datetime import datetime
+from datetime import timezone
+
+import pytest
+
+from lsp_devtools.agent.metadata import RECORD_PREFIX
+from lsp_devtools.agent.metadata import MessageMetadata
+from lsp_devtools.agent.metadata import pack_record
+from lsp_devtools.agent.metadata import record_to_frame
+from lsp_devtools.agent.metadata import unpack_records
+
+FRAME = b"Content-Length: 2\r\n\r\n{}"
+TIMESTAMP_NS = 1_700_000_000_123_456_789
+
+
+def test_record_roundtrip():
+    """Ensure that records can be unpacked."""
+    data = pack_record("client", 0, TIMESTAMP_NS, FRAME) + pack_record(
+        "server", 3, 0, FRAME, latency_ns=1234
+    )
+
+    assert len(data) == 2 * (RECORD_PREFIX.size + len(FRAME))
+    assert list(unpack_records(data)) == [
+        (0, 0, TIMESTAMP_NS, None, FRAME),
+        (1, 3, 0, 1234, FRAME),
+    ]
+
+
+@pytest.mark.parametrize("length", [1, RECORD_PREFIX.size, RECORD_PREFIX.size + 1])
+def test_record_incomplete(length: int):
+    """Ensure that truncated records are reported."""
+    data = pack_record("client", 0, TIMESTAMP_NS, FRAME)
+
+    with pytest.raises(ValueError):
+        list(unpack_records(data[:length]))
+
+
+def test_metadata_timestamp():
+    """Ensure that the timestamp is converted to a datetime correctly."""
+    metadata = MessageMetadata("client", "abc", TIMESTAMP_NS, latency_ns=12_345_678)
+    expected = datetime(2023, 11, 14, 22, 13, 20, 123456, tzinfo=timezone.utc)
+
+    assert metadata.timestamp == expected
+    assert metadata.headers == {
+        "Message-Source": "client",
+        "Message-Session": "abc",
+        "Message-Timestamp": expected,
+        "Message-Latency": 12.345678,
+    }
+
+
+def test_record_to_frame():
+    """Ensure that a record can be converted to a frame with the equivalent headers,
+    and back again."""
+    record = pack_record("server", 1, TIMESTAMP_NS, FRAME, latency_ns=42)
+    frame = record_to_frame(record, ["a", "b"])
+
+    assert frame.endswith(FRAME)
+    assert MessageMetadata.from_headers(frame) == MessageMetadata(
+        "server", "b", (TIMESTAMP_NS // 1000) * 1000, latency_ns=42
+    )
+
+
+def test_metadata_from_headers_missing():
+    """Ensure that frames without metadata are recognised."""
+    assert MessageMetadata.from_headers(FRAME) is None
+
+
+@pytest.mark.parametrize(
+    "header",
+    [
+        b"Message-Timestamp: 2023-11-14T22:13:20.123456",
+        b"Message-Timestamp: yesterday",
+        b"Message-Latency: slow",
+    ],
+)
+def test_metadata_from_headers_invalid(header: bytes):
+    """Ensure that invalid metadata is rejected with a ``ValueError``."""
+    frame = b"Message-Source: client\r\n" + header + b"\r\n" + FRAME
+
+    with pytest.raises(ValueError):
+        MessageMetadata.from_headers(frame)
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+
+import pytest
+from helpers import Destination
+from helpers import make_message
+
+from lsp_devtools.agent import Agent
+from lsp_devtools.agent.metrics import Metrics
+from lsp_devtools.agent.metrics import start_metrics_server
+
+
+def test_counter():
+    """Ensure that counters are rendered correctly."""
+    metrics = Metrics(prefix="test")
+    counter = metrics.counter("things_total", "Number of things", label="kind")
+    counter.inc(1, "a")
+    counter.inc(2, "b")
+    counter.inc(3, "a")
+
+    assert counter.render() == [
+        "# HELP test_things_total Number of things",
+        "# TYPE test_things_total counter",
+        'test_things_total{kind="a"} 4',
+        'test_things_total{kind="b"} 2',
+    ]
+
+
+def test_counter_threads():
+    """Ensure that no increments are lost when a counter is shared between threads."""
+    counter = Metrics(prefix="test").counter("things_total", "Things", label="kind")
+
+    def work(kind: str):
+        for _ in range(10_000):
+            counter.inc(1, kind)
+            counter.inc(1, None)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=work, args=(k,)) for k in "abcd"]
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert counter.values == {
+        None: 40_000,
+        "a": 10_000,
+        "b": 10_000,
+        "c": 10_000,
+        "d": 10_000,
+    }
+
+
+def test_gauge():
+    """Ensure that gauges read their value when rendered."""
+    metrics = Metrics(prefix="test")
+    values = [1, 2, 3]
+    gauge = metrics.gauge("size", "The size", lambda: len(values))
+
+    assert gauge.render()[-1] == "test_size 3"
+
+    values.pop()
+    assert gauge.render()[-1] == "test_size 2"
+
+
+def test_histogram():
+    """Ensure that histograms are rendered correctly."""
+    metrics = Metrics(prefix="test")
+    histogram = metrics.histogram("duration_seconds", "How long")
+    histogram.buckets = (0.1, 1.0)
+
+    for value in [0.05, 0.1, 0.5, 2.0]:
+        histogram.observe(value)
+
+    assert histogram.render() == [
+        "# HELP test_duration_seconds How long",
+        "# TYPE test_duration_seconds histogram",
+        'test_duration_seconds_bucket{le="0.1"} 2',
+        'test_duration_seconds_bucket{le="1.0"} 3',
+        'test_duration_seconds_bucket{le="+Inf"} 4',
+        "test_duration_seconds_sum 2.65",
+        "test_duration_seconds_count 4",
+    ]
+
+
+def test_duplicate_metric():
+    """Ensure that metric names are unique."""
+    metrics = Metrics(prefix="test")
+    metrics.counter("a", "A")
+
+    with pytest.raises(ValueError, match="Duplicate metric"):
+        metrics.gauge("a", "A", lambda: 1)
+
+
+@pytest.mark.asyncio
+async def test_agent_metrics():
+    """Ensure that the agent records metrics on the messages it forwards."""
+    observed: list[bytes] = []
+    agent = Agent(None, None, None, observed.append)  # type: ignore[arg-type]
+    dest = Destination()
+
+    messages = [
+        ("client", make_message(id=1, method="textDocument/completion")),
+        ("server", make_message(method="window/logMessage", params={})),
+    ]
+    size = 0
+    for source, frame in messages:
+        size += len(frame) if source == "client" else 0
+
+        await agent.forward_message(source, dest, frame)  # type: ignore[arg-type]
+
+    text = agent.metrics.render()
+    assert 'lsp_devtools_agent_messages_total{source="client"} 1' in text
+    assert 'lsp_devtools_agent_messages_total{source="server"} 1' in text
+    assert f'lsp_devtools_agent_bytes_total{{source="client"}} {size}' in text
+    assert 'lsp_devtools_agent_drain_seconds_count{source="client"} 1' in text
+    assert "lsp_devtools_agent_requests_in_flight 1" in text
+    assert len(observed) == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(sys.platform == "win32", reason="Requires Unix sockets")
+async def test_metrics_server(tmp_path):
+    """Ensure that metrics can be fetched over HTTP."""
+    metrics = Metrics(prefix="test")
+    metrics.counter("things_total", "Number of things").inc()
+
+    path = str(tmp_path / "metrics.sock")
+    server = await start_metrics_server(metrics, path)
+
+    try:
+        reader, writer = await asyncio.open_unix_connection(path)
+        writer.write(b"GET /metrics HTTP/1.0\r\n\r\n")
+        response = await reader.read()
+        writer.close()
+    finally:
+        server.close()
+        await server.wait_closed()
+
+    headers, _, body = response.partition(b"\r\n\r\n")
+    assert headers.startswith(b"HTTP/1.0 200 OK")
+    assert b"test_things_total 1" in body
+
+
+def test_gauge_labels():
+    """Ensure that labelled gauges render a value for each label value."""
+    metrics = Metrics(prefix="test")
+    values = {"b": 2, "a": 1}
+    gauge = metrics.gauge("size", "The size", lambda: values, label="name")
+
+    assert gauge.render()[2:] == ['test_size{name="a"} 1', 'test_size{name="b"} 2']
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+from helpers import Destination
+from helpers import make_message
+
+from lsp_devtools.agent.netsim import LinkConditions
+from lsp_devtools.agent.netsim import SimulatedLink
+
+
+def test_link_latency():
+    """Ensure that every message is delayed by the latency, plus some jitter."""
+    link = SimulatedLink(LinkConditions(latency=0.1, jitter=0.05), seed=1)
+
+    for now in [0.0, 1.0, 2.0]:
+        delay = link.delivery_time(b"x", now) - now
+        assert 0.1 <= delay <= 0.15
+
+
+def test_link_bandwidth():
+    """Ensure that messages are queued behind each other on a limited link."""
+    link = SimulatedLink(LinkConditions(bandwidth=100))
+
+    assert link.delivery_time(b"x" * 100, 0.0) == 1.0
+    assert link.delivery_time(b"x" * 50, 0.0) == 1.5
+
+    # Once the link is idle, messages are only delayed by their own size.
+    assert link.delivery_time(b"x" * 50, 5.0) == 5.5
+
+
+def test_link_notifications_only():
+    """Ensure that only notifications are delayed, without reordering messages."""
+    link = SimulatedLink(LinkConditions(latency=1.0, notifications_only=True))
+
+    request = make_message(id=1, method="textDocument/completion")
+    notification = make_message(method="textDocument/didChange")
+
+    assert link.delivery_time(request, 0.0) == 0.0
+    assert link.delivery_time(notification, 0.0) == 1.0
+
+    # The request cannot overtake the notification sent before it.
+    assert link.delivery_time(request, 0.5) == 1.0
+    assert link.delivery_time(request, 2.0) == 2.0
+
+
+@pytest.mark.asyncio
+async def test_link_send():
+    """Ensure that messages are written to the destination in order, once due."""
+    link = SimulatedLink(LinkConditions(latency=0.05, jitter=0.05), seed=2)
+    dest = Destination()
+
+    start = asyncio.get_running_loop().time()
+    messages = [str(idx).encode() for idx in range(20)]
+    for message in messages:
+        link.send(dest, message)
+
+    assert len(link) == 20
+    while len(link) > 0:
+        await asyncio.sleep(0.01)
+
+    assert dest.data == messages
+    assert all(when - start >= 0.05 for when in dest.times)
+
+
+@pytest.mark.asyncio
+async def test_link_backpressure():
+    """Ensure that the sender is made to wait once the link is full."""
+    link = SimulatedLink(LinkConditions(latency=0.05), max_pending=2)
+    dest = Destination()
+
+    link.send(dest, b"0")
+    await asyncio.wait_for(link.drain(), timeout=0.01)
+
+    link.send(dest, b"1")
+    drain = asyncio.create_task(link.drain())
+    await asyncio.sleep(0.01)
+    assert not drain.done()
+
+    await asyncio.wait_for(drain, timeout=1)
+    assert len(link) < 2
+    assert dest.data[0] == b"0"
+
+
+@pytest.mark.asyncio
+async def test_link_close_wakes_sender():
+    """Ensure that closing the link does not leave the sender waiting."""
+    link = SimulatedLink(LinkConditions(latency=10), max_pending=1)
+    link.send(Destination(), b"0")
+
+    drain = asyncio.create_task(link.drain())
+    await asyncio.sleep(0)
+    link.close()
+
+    await asyncio.wait_for(drain, timeout=1)
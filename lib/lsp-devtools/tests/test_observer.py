@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import typing
+
+import pytest
+
+from lsp_devtools.agent.observer import Observation
+from lsp_devtools.agent.observer import ObservationQueue
+from lsp_devtools.agent.observer import ObserverThread
+
+if typing.TYPE_CHECKING:
+    from lsp_devtools.agent.observer import OverflowPolicy
+
+REQUEST = b'Content-Length: 31\r\n\r\n{"id": 1, "method": "shutdown"}'
+NOTIFICATION = b'Content-Length: 18\r\n\r\n{"method": "exit"}'
+
+
+def observation(message: bytes, idx: int = 0) -> Observation:
+    return Observation(source="client", timestamp=idx, message=message)
+
+
+@pytest.mark.asyncio
+async def test_queue_block():
+    """Ensure that the block policy waits for space to become available."""
+
+    queue = ObservationQueue(maxsize=1, overflow="block")
+    await queue.put(observation(NOTIFICATION, 0))
+
+    put = asyncio.create_task(queue.put(observation(NOTIFICATION, 1)))
+    await asyncio.sleep(0)
+    assert not put.done()
+
+    assert (await queue.get()).timestamp == 0
+    await asyncio.wait_for(put, timeout=1)
+
+    assert (await queue.get()).timestamp == 1
+    assert queue.dropped == 0
+
+
+@pytest.mark.asyncio
+async def test_queue_drop_oldest():
+    """Ensure that the drop-oldest policy discards the oldest message."""
+
+    queue = ObservationQueue(maxsize=2, overflow="drop-oldest")
+    for idx in range(5):
+        await queue.put(observation(REQUEST, idx))
+
+    assert queue.dropped == 3
+    assert [queue.get_nowait().timestamp for _ in range(2)] == [3, 4]  # type: ignore
+    assert queue.get_nowait() is None
+
+
+@pytest.mark.asyncio
+async def test_queue_drop_notifications():
+    """Ensure that the drop-notifications policy only discards notifications."""
+
+    queue = ObservationQueue(maxsize=1, overflow="drop-notifications")
+    await queue.put(observation(REQUEST, 0))
+    await queue.put(observation(NOTIFICATION, 1))
+
+    assert queue.dropped == 1
+
+    put = asyncio.create_task(queue.put(observation(REQUEST, 2)))
+    await asyncio.sleep(0)
+    assert not put.done()
+
+    assert (await queue.get()).timestamp == 0
+    await asyncio.wait_for(put, timeout=1)
+
+    assert (await queue.get()).timestamp == 2
+    assert queue.dropped == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("overflow", ["drop-oldest", "drop-notifications"])
+async def test_queue_idle_consumer(overflow: OverflowPolicy):
+    """Ensure that nothing is dropped if the consumer is able to keep up with a burst
+    larger than the queue."""
+
+    queue = ObservationQueue(maxsize=16, overflow=overflow)
+    observed: list[int] = []
+
+    async def consume():
+        while True:
+            observed.append((await queue.get()).timestamp)
+
+    consumer = asyncio.create_task(consume())
+    for idx in range(100):
+        await queue.put(observation(NOTIFICATION, idx))
+
+    await asyncio.sleep(0)
+    consumer.cancel()
+
+    assert observed == list(range(100))
+    assert queue.dropped == 0
+
+
+def test_queue_invalid_policy():
+    """Ensure that we reject unknown overflow policies."""
+
+    with pytest.raises(ValueError, match="Unknown overflow policy"):
+        ObservationQueue(overflow="drop-everything")  # type: ignore[arg-type]
+
+
+@pytest.mark.asyncio
+async def test_observer_thread():
+    """Ensure that messages are observed, in order, on the observer's own thread."""
+
+    observer = ObserverThread()
+    observed: list[tuple[int, threading.Thread]] = []
+    finished: list[int] = []
+
+    async def finish(item: Observation):
+        finished.append(item.timestamp)
+
+    def handler(item: Observation):
+        observed.append((item.timestamp, threading.current_thread()))
+        return finish(item) if item.timestamp == 0 else None
+
+    observer.handler = handler
+    observer.start()
+
+    observer.put([observation(NOTIFICATION, idx) for idx in range(5)])
+    observer.put([observation(REQUEST, 5)])
+
+    async def get_thread():
+        return threading.current_thread()
+
+    thread = await observer.run(get_thread())
+    assert thread is not threading.current_thread()
+
+    await observer.flush()
+    assert observed == [(idx, thread) for idx in range(6)]
+
+    await observer.stop()
+    assert finished == [0]
+    assert not thread.is_alive()
+
+
+@pytest.mark.asyncio
+async def test_observer_thread_drop_oldest():
+    """Ensure that the oldest messages are discarded if the observer falls behind."""
+
+    observer = ObserverThread(maxsize=2)
+    observed: list[int] = []
+    observer.handler = lambda item: observed.append(item.timestamp)
+
+    # Not yet started, so nothing is observed
+    observer.put([observation(NOTIFICATION, idx) for idx in range(3)])
+    observer.put([observation(NOTIFICATION, 3)])
+    assert len(observer) == 2
+    assert observer.dropped == 2
+
+    observer.start()
+    await observer.stop()
+    assert observed == [2, 3]
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import hashlib
+
+import pytest
+from helpers import make_message
+
+from lsp_devtools.agent import parse_rpc_message
+from lsp_devtools.agent.policies import Policy
+from lsp_devtools.agent.policies import RecordPolicies
+
+
+def sha256(value: str) -> str:
+    return f"sha256:{hashlib.sha256(value.encode()).hexdigest()}"
+
+
+@pytest.mark.parametrize(
+    "spec, expected",
+    [
+        ("a/b:params.text=drop", Policy("a/b", ("params", "text"), "drop")),
+        ("*:result.*.detail=hash", Policy("*", ("result", "*", "detail"), "hash")),
+        ("$/a:params=truncate:10", Policy("$/a", ("params",), "truncate", 10)),
+    ],
+)
+def test_parse_policy(spec: str, expected: Policy):
+    """Ensure that we can parse policies."""
+    assert Policy.parse(spec) == expected
+
+
+@pytest.mark.parametrize(
+    "spec, error",
+    [
+        ("params.text=drop", "Expected METHOD:PATH=ACTION"),
+        ("a/b:params.text", "Expected METHOD:PATH=ACTION"),
+        ("a/b:text=drop", "Path must start with"),
+        ("a/b:params..text=drop", "Path must start with"),
+        ("a/b:params.text=delete", "as the action"),
+        ("a/b:params.text=truncate", "as the action"),
+        ("a/b:params.text=hash:2", "as the action"),
+    ],
+)
+def test_parse_policy_invalid(spec: str, error: str):
+    """Ensure that we reject invalid policies."""
+    with pytest.raises(ValueError, match=error):
+        Policy.parse(spec)
+
+
+TEXT = "ü" + "x" * 100
+ITEMS = [dict(label="a", documentation="doc a"), dict(label="b")]
+
+
+@pytest.mark.parametrize(
+    "spec, params, expected",
+    [
+        ("params.text=drop", dict(text=TEXT, n=1), dict(n=1)),
+        ("params.text=hash", dict(text=TEXT), dict(text=sha256(TEXT))),
+        ("params.text=truncate:2", dict(text=TEXT), dict(text="ü")),
+        ("params.text=truncate:3", dict(text=TEXT), dict(text="üx")),
+        ("params.text=truncate:2", dict(text=[10, 20]), dict(text="[1")),
+        ("params.text=truncate:1000", dict(text=TEXT), dict(text=TEXT)),
+        ("params.missing=drop", dict(text=TEXT), dict(text=TEXT)),
+        ("params.text.x=drop", dict(text=TEXT), dict(text=TEXT)),
+        (
+            "params.items.*.documentation=drop",
+            dict(items=ITEMS),
+            dict(items=[dict(label="a"), dict(label="b")]),
+        ),
+        ("params.items.*=drop", dict(items=ITEMS), dict(items=[])),
+        ("params.items.1=drop", dict(items=ITEMS), dict(items=ITEMS[:1])),
+        ("params.items.2=drop", dict(items=ITEMS), dict(items=ITEMS)),
+        ("params.*=hash", dict(a="1", b="2"), dict(a=sha256("1"), b=sha256("2"))),
+    ],
+)
+def test_policy_apply(spec: str, params: dict, expected: dict):
+    """Ensure that policies are applied correctly."""
+    policies = RecordPolicies([Policy.parse(f"a/b:{spec}")])
+
+    message = make_message(method="a/b", params=params)
+    record = policies.apply("client", message)
+
+    assert parse_rpc_message(record).body["params"] == expected
+    if params == expected:
+        assert record is message
+
+
+def test_policy_responses():
+    """Ensure that policies are applied to the responses of the requests they apply to,
+    without decoding any other messages."""
+    policies = RecordPolicies(
+        [
+            Policy.parse("textDocument/completion:result.items.*.documentation=drop"),
+            Policy.parse("textDocument/didOpen:params.textDocument.text=hash"),
+        ]
+    )
+
+    def apply(source: str, **kwargs) -> bytes:
+        return policies.apply(source, make_message(**kwargs))
+
+    request = apply("client", id=1, method="textDocument/completion", params={})
+    assert parse_rpc_message(request).body["params"] == {}
+
+    # The same id, but not the response to our request.
+    other = make_message(id=1, result=dict(items=ITEMS))
+    assert policies.apply("client", other) is other
+
+    response = apply("server", id=1, result=dict(items=ITEMS))
+    assert parse_rpc_message(response).body["result"] == dict(
+        items=[dict(label="a"), dict(label="b")]
+    )
+
+    # Only requests with policies for their responses are tracked
+    apply("client", id=2, method="textDocument/hover", params={})
+    assert policies._response_method_map == {}
+
+    notification = apply(
+        "client",
+        method="textDocument/didOpen",
+        params=dict(textDocument=dict(text="x")),
+    )
+    assert parse_rpc_message(notification).body["params"] == dict(
+        textDocument=dict(text=sha256("x"))
+    )
+
+    invalid = b"Content-Length: 8\r\n\r\nnot json"
+    assert policies.apply("client", invalid) is invalid
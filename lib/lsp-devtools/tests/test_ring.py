@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import asyncio
+import socket
+
+import pytest
+from helpers import format_message
+
+from lsp_devtools.agent import AgentClient
+from lsp_devtools.agent import AgentServer
+from lsp_devtools.agent.metadata import pack_record
+from lsp_devtools.agent.ring import RingBuffer
+from lsp_devtools.agent.ring import is_available
+
+pytestmark = pytest.mark.skipif(not is_available(), reason="requires shared memory")
+
+
+def make_frame(idx: int) -> bytes:
+    # Every so often, send a record too large to fit in the ring.
+    pad = "y" * 5000 if idx % 250 == 125 else ""
+    return format_message(dict(x=idx, pad=pad))
+
+
+def test_ring_wraparound():
+    """Ensure that data written across the end of the ring is read back intact."""
+    ring = RingBuffer.create(100)
+    try:
+        assert ring.read() == b""
+
+        for idx in range(10):
+            data = bytes([idx]) * 60
+            assert ring.write(data)
+            assert len(ring) == 60
+            assert ring.read() == data
+            assert len(ring) == 0
+    finally:
+        ring.close()
+
+
+def test_ring_full():
+    """Ensure that writes are rejected once the ring is full."""
+    ring = RingBuffer.create(100)
+    try:
+        assert ring.write(b"a" * 60)
+        assert not ring.write(b"b" * 60)
+        assert ring.write(b"c" * 40)
+        assert not ring.write(b"d")
+
+        assert ring.read() == b"a" * 60 + b"c" * 40
+        assert ring.write(b"b" * 60)
+    finally:
+        ring.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="requires unix sockets")
+async def test_client_shared_memory(tmp_path):
+    """Ensure that the client can send records through the ring, including when it is
+    too small to hold them all at once, or a single record, in order."""
+    received: list[bytes] = []
+    done = asyncio.Event()
+
+    def handler(data, metadata):
+        received.append(data)
+        if len(received) == 1000:
+            done.set()
+
+    path = tmp_path / "agent.sock"
+    server = AgentServer(handler=handler, ring_size=4096)
+    server_task = asyncio.create_task(server.start_unix(str(path)))
+    while server._tcp_server is None:
+        await asyncio.sleep(0.01)
+
+    client = AgentClient(shared_memory=True)
+    await client.start_unix(str(path))
+    while client._ring is None:
+        await asyncio.sleep(0.01)
+
+    for idx in range(1000):
+        client.forward_message(pack_record("client", 0, idx, make_frame(idx)))
+
+        if idx % 100 == 0:
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(done.wait(), timeout=10)
+    assert received == [make_frame(idx) for idx in range(1000)]
+
+    client.protocol.writer.close()
+    await client.stop()
+
+    # The server destroys the ring once the client disconnects.
+    while len(server._connections) > 0:
+        await asyncio.sleep(0.01)
+
+    server.stop()
+    server_task.cancel()
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import itertools
+import json
+
+import pytest
+
+from lsp_devtools.agent.scan import RoutingFields
+from lsp_devtools.agent.scan import is_notification
+from lsp_devtools.agent.scan import scan_routing_fields
+from lsp_devtools.agent.scan import scan_truncated_fields
+
+MESSAGES = [
+    dict(jsonrpc="2.0", id=1, method="initialize", params=dict(id=2, method="x")),
+    dict(jsonrpc="2.0", method="textDocument/didOpen", params=dict(text='"}]\\')),
+    dict(jsonrpc="2.0", id="a\\", result=[{"id": 3}, "]"]),
+    dict(jsonrpc="2.0", id=-1, error=dict(code=-32601, message="}")),
+    dict(jsonrpc="2.0", id=2, method="shutdown", params=None),
+    dict(jsonrpc="2.0", id=2, result=None),
+    dict(jsonrpc="2.0", method='say "hi", "id": 1', params=[]),
+]
+
+
+@pytest.mark.parametrize(
+    "message, kwargs",
+    [
+        (dict(zip(order, [message[k] for k in order])), kwargs)
+        for message in MESSAGES
+        for order in itertools.permutations(message.keys())
+        for kwargs in [{}, {"indent": 2}, {"separators": (",", ":")}]
+    ],
+)
+def test_scan_routing_fields(message: dict, kwargs: dict):
+    """Ensure that we extract the routing fields correctly, no matter how the message
+    is laid out."""
+
+    data = json.dumps(message, **kwargs).encode()
+    expected = RoutingFields(set(message), message.get("id"), message.get("method"))
+
+    assert scan_routing_fields(data) == expected
+    assert scan_routing_fields(b"  " + data + b"\r\n", 2) == expected
+
+
+@pytest.mark.parametrize("data", [b"", b"null", b"[1, 2]", b'{"id": ', b'{"id": 1'])
+def test_scan_routing_fields_invalid(data: bytes):
+    """Ensure that we report invalid messages."""
+
+    with pytest.raises(ValueError):
+        scan_routing_fields(data)
+
+
+@pytest.mark.parametrize(
+    "message, expected",
+    [
+        (
+            dict(jsonrpc="2.0", id=1, method="a", params=dict(text="x" * 100)),
+            RoutingFields({"jsonrpc", "id", "method", "params"}, 1, "a"),
+        ),
+        (
+            dict(params=dict(text="x" * 100), method="a", id=1, jsonrpc="2.0"),
+            RoutingFields({"jsonrpc", "id", "method", "params"}, 1, "a"),
+        ),
+        (
+            dict(id=12345, result=["x" * 100], jsonrpc="2.0"),
+            RoutingFields({"jsonrpc", "id", "result"}, 12345, None),
+        ),
+        (
+            # The id in the head is cut short, so must not be trusted.
+            dict(jsonrpc="2.0", method="a" * 20, id=123456789, params=["x" * 100]),
+            RoutingFields({"jsonrpc", "method", "id"}, None, "a" * 20),
+        ),
+        (dict(method="a" * 100), RoutingFields({"method"})),
+    ],
+)
+def test_scan_truncated_fields(message: dict, expected: RoutingFields):
+    """Ensure that we find what routing fields we can, given only the start and end of
+    a message."""
+
+    data = json.dumps(message).encode()
+    assert scan_truncated_fields(data[:60], data[-60:]) == expected
+
+
+@pytest.mark.parametrize(
+    "frame, expected",
+    [
+        (b'Content-Length: 18\r\n\r\n{"method": "exit"}', True),
+        (b'Content-Length: 36\r\n\r\n{"method": "a", "params": {"id": 1}}', True),
+        (b'Content-Length: 22\r\n\r\n{"id": 1, "result": 2}', False),
+        (b"Content-Length: 3\r\n\r\nnot json", False),
+    ],
+)
+def test_is_notification(frame: bytes, expected: bool):
+    """Ensure that we can detect notifications."""
+    assert is_notification(frame) is expected
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import asyncio
+import socket
+
+import pytest
+from helpers import format_message
+
+from lsp_devtools.agent import AgentClient
+from lsp_devtools.agent import AgentServer
+from lsp_devtools.agent import FanOut
+from lsp_devtools.agent.metadata import MessageMetadata
+from lsp_devtools.agent.metadata import pack_record
+from lsp_devtools.agent.server import AgentConnection
+
+
+@pytest.mark.asyncio
+async def test_server_multiple_agents():
+    """Ensure that each connected agent's messages are attributed to its own session."""
+    received: list[tuple[bytes, str]] = []
+    done = asyncio.Event()
+
+    def handler(data, metadata):
+        received.append((data, metadata.session))
+        if len(received) == 30:
+            done.set()
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    server = AgentServer(handler=handler)
+    server_task = asyncio.create_task(server.start_tcp("127.0.0.1", port))
+    while server._tcp_server is None:
+        await asyncio.sleep(0.01)
+
+    clients = [AgentClient(session_id=f"session-{idx}") for idx in range(3)]
+    for client in clients:
+        await client.start_tcp("127.0.0.1", port)
+
+    # Wait for the agents to finish negotiating with the server.
+    while not all(client.binary for client in clients):
+        await asyncio.sleep(0.01)
+
+    for idx in range(10):
+        for client in clients:
+            client.forward_message(
+                pack_record("client", 0, idx, format_message(dict(x=idx)))
+            )
+
+    await asyncio.wait_for(done.wait(), timeout=5)
+
+    for client in clients:
+        messages = [data for data, session in received if session == client.session_id]
+        assert messages == [format_message(dict(x=idx)) for idx in range(10)]
+
+        client.protocol.writer.close()
+        await client.stop()
+
+    server.stop()
+    server_task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_server_fair_share():
+    """Ensure that a busy connection cannot starve the others."""
+    handled: list[str] = []
+
+    def handler(data, metadata):
+        handled.append(data.decode())
+
+    server = AgentServer(handler=handler, fair_share=4)
+
+    busy = AgentConnection(None)  # type: ignore[arg-type]
+    quiet = AgentConnection(None)  # type: ignore[arg-type]
+    server._connections.extend([busy, quiet])
+
+    metadata = MessageMetadata("client", "abc", 0)
+    for idx in range(20):
+        await server._queue(busy, f"busy-{idx}".encode(), metadata)
+
+    for idx in range(2):
+        await server._queue(quiet, f"quiet-{idx}".encode(), metadata)
+
+    quiet.closed = True
+
+    task = asyncio.create_task(server._drain_connections())
+    while len(handled) < 22:
+        await asyncio.sleep(0.01)
+
+    task.cancel()
+
+    assert handled[:6] == [*[f"busy-{idx}" for idx in range(4)], "quiet-0", "quiet-1"]
+    assert handled[6:] == [f"busy-{idx}" for idx in range(4, 20)]
+
+    # Closed connections are forgotten once all their messages have been handled.
+    assert server._connections == [busy]
+
+
+@pytest.mark.asyncio
+async def test_server_batch_handler():
+    """Ensure that a batch handler is given the messages taken from a connection in
+    each turn as a single list."""
+    batches: list[list[str]] = []
+
+    async def batch_handler(batch):
+        batches.append([data.decode() for data, _ in batch])
+
+    server = AgentServer(batch_handler=batch_handler, fair_share=4)
+
+    busy = AgentConnection(None)  # type: ignore[arg-type]
+    quiet = AgentConnection(None)  # type: ignore[arg-type]
+    server._connections.extend([busy, quiet])
+
+    metadata = MessageMetadata("client", "abc", 0)
+    for idx in range(6):
+        await server._queue(busy, f"busy-{idx}".encode(), metadata)
+
+    await server._queue(quiet, b"quiet-0", metadata)
+
+    task = asyncio.create_task(server._drain_connections())
+    while sum(len(batch) for batch in batches) < 7:
+        await asyncio.sleep(0.01)
+
+    task.cancel()
+    assert batches == [
+        [f"busy-{idx}" for idx in range(4)],
+        ["quiet-0"],
+        ["busy-4", "busy-5"],
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="requires unix sockets")
+async def test_server_unix_socket(tmp_path):
+    """Ensure that agents can connect over a Unix domain socket."""
+    received: list[bytes] = []
+    done = asyncio.Event()
+
+    def handler(data, metadata):
+        received.append(data)
+        done.set()
+
+    path = tmp_path / "agent.sock"
+    server = AgentServer(handler=handler)
+    server_task = asyncio.create_task(server.start_unix(str(path)))
+    while server._tcp_server is None:
+        await asyncio.sleep(0.01)
+
+    client = AgentClient()
+    await client.start_unix(str(path))
+    client.forward_message(pack_record("client", 0, 0, format_message(dict(x=0))))
+
+    await asyncio.wait_for(done.wait(), timeout=5)
+    assert len(received) == 1
+    assert received[0].endswith(format_message(dict(x=0)))
+
+    client.protocol.writer.close()
+    await client.stop()
+    server.stop()
+
+    # The socket is cleaned up once the server stops.
+    with pytest.raises(asyncio.CancelledError):
+        await server_task
+
+    assert not path.exists()
+
+
+@pytest.mark.asyncio
+async def test_agent_fan_out():
+    """Ensure that an agent can send its messages to multiple servers at once."""
+    received: list[list[bytes]] = [[], []]
+    done = [asyncio.Event(), asyncio.Event()]
+
+    def make_handler(idx: int):
+        def handler(data, metadata):
+            received[idx].append(data)
+            if len(received[idx]) == 10:
+                done[idx].set()
+
+        return handler
+
+    servers, tasks, clients = [], [], []
+    for idx in range(2):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+
+        server = AgentServer(handler=make_handler(idx))
+        tasks.append(asyncio.create_task(server.start_tcp("127.0.0.1", port)))
+        while server._tcp_server is None:
+            await asyncio.sleep(0.01)
+
+        client = AgentClient(session_id="abc")
+        await client.start_tcp("127.0.0.1", port)
+        servers.append(server)
+        clients.append(client)
+
+    handler = FanOut([client.forward_message for client in clients])
+    for idx in range(10):
+        handler(pack_record("client", 0, idx, format_message(dict(x=idx))))
+
+    await asyncio.wait_for(asyncio.gather(*(d.wait() for d in done)), timeout=5)
+    for messages in received:
+        assert [
+            m[-len(format_message(dict(x=i))) :] for i, m in enumerate(messages)
+        ] == [format_message(dict(x=idx)) for idx in range(10)]
+
+    for client, server, task in zip(clients, servers, tasks):
+        client.protocol.writer.close()
+        await client.stop()
+        server.stop()
+        task.cancel()
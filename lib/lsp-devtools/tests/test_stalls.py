@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import pytest
+
+from lsp_devtools.agent.stalls import StallDetector
+from lsp_devtools.agent.stalls import parse_threshold
+
+SECOND = 1_000_000_000
+
+
+@pytest.mark.parametrize(
+    "spec, expected",
+    [
+        ("5", ("*", 5.0)),
+        ("*=0.5", ("*", 0.5)),
+        ("textDocument/completion=2", ("textDocument/completion", 2.0)),
+    ],
+)
+def test_parse_threshold(spec: str, expected: tuple[str, float]):
+    """Ensure that we can parse stall thresholds."""
+    assert parse_threshold(spec) == expected
+
+
+@pytest.mark.parametrize(
+    "spec, error",
+    [
+        ("a/b", "Expected METHOD=SECONDS"),
+        ("a/b=", "Expected METHOD=SECONDS"),
+        ("a/b=0", "Expected a positive number"),
+        ("-1", "Expected a positive number"),
+    ],
+)
+def test_parse_threshold_invalid(spec: str, error: str):
+    """Ensure that we reject invalid thresholds."""
+    with pytest.raises(ValueError, match=error):
+        parse_threshold(spec)
+
+
+def test_stall_detector():
+    """Ensure that requests are reported as stalled once their deadline passes, in
+    order, and only once."""
+    detector = StallDetector({"slow": 10, "*": 1})
+
+    detector.request("client", 1, "slow", 0)
+    detector.request("client", 2, "fast", 0)
+    detector.request("server", 1, "fast", SECOND // 2)
+    assert len(detector) == 3
+    assert detector.next_deadline() == SECOND
+
+    assert detector.expired(SECOND - 1) == []
+    assert [(r.source, r.id) for r in detector.expired(2 * SECOND)] == [
+        ("client", 2),
+        ("server", 1),
+    ]
+    assert detector.expired(2 * SECOND) == []
+    assert detector.stalled == 2
+    assert detector.next_deadline() == 10 * SECOND
+
+    # Only stalled requests are returned once answered.
+    assert detector.response("server", 1).id == 1  # type: ignore[union-attr]
+    assert detector.response("client", 1) is None
+    assert detector.response("client", 1) is None
+    assert detector.next_deadline() is None
+    assert detector.expired(20 * SECOND) == []
+    assert detector.stalled == 1
+
+
+def test_stall_detector_untracked():
+    """Ensure that requests without a threshold are not tracked."""
+    detector = StallDetector({"slow": 10})
+    detector.request("client", 1, "fast", 0)
+
+    assert len(detector) == 0
+    assert detector.next_deadline() is None
+
+
+def test_stall_detector_compact():
+    """Ensure that answered requests do not accumulate in the heap."""
+    detector = StallDetector({"*": 10})
+    for idx in range(10_000):
+        detector.request("client", idx, "a", idx)
+        detector.response("client", idx)
+
+    assert len(detector) == 0
+    assert len(detector._heap) <= 64
+    assert detector.next_deadline() is None
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import hashlib
+
+import pytest
+from helpers import format_message
+
+from lsp_devtools.agent import parse_rpc_message
+from lsp_devtools.agent.framing import FramePiece
+from lsp_devtools.agent.truncate import PREVIEW_SIZE
+from lsp_devtools.agent.truncate import TRUNCATED
+from lsp_devtools.agent.truncate import MessageTee
+from lsp_devtools.agent.truncate import truncate_message
+
+MESSAGES = [
+    dict(jsonrpc="2.0", method="textDocument/didOpen", params=dict(text="ü" * 5000)),
+    dict(jsonrpc="2.0", id=1, result=[dict(name=f"symbol{i}") for i in range(500)]),
+    dict(result=[dict(name=f"symbol{i}") for i in range(500)], id="a", jsonrpc="2.0"),
+    dict(jsonrpc="2.0", id=2, error=dict(code=-1, message="x" * 5000)),
+]
+
+
+@pytest.mark.parametrize("message", MESSAGES)
+@pytest.mark.parametrize("max_size", [16, 4096])
+def test_truncate_message(message: dict, max_size: int):
+    """Ensure that large messages are replaced with a preview, while keeping their
+    routing fields."""
+
+    frame = format_message(message)
+    body = frame[frame.index(b"\r\n\r\n") + 4 :]
+
+    record = truncate_message(frame, max_size)
+    parsed = parse_rpc_message(record).body
+
+    assert parsed.get("id") == message.get("id")
+    assert parsed.get("method") == message.get("method")
+
+    member = next(k for k in ("params", "result", "error") if k in message)
+    details = parsed[member][TRUNCATED]
+
+    assert details["length"] == len(body)
+    assert details["sha256"] == hashlib.sha256(body).hexdigest()
+
+    preview_size = min(max_size, PREVIEW_SIZE)
+    assert details["preview"] == body[:preview_size].decode("utf8", errors="replace")
+
+    # Small messages are recorded as-is
+    assert truncate_message(frame, len(body)) is frame
+
+
+@pytest.mark.parametrize("message", MESSAGES)
+@pytest.mark.parametrize("max_size", [None, 16, 4096, 1024 * 1024])
+@pytest.mark.parametrize("piece_size", [1000, 4096])
+def test_message_tee(message: dict, max_size: int | None, piece_size: int):
+    """Ensure that a message forwarded in pieces is recorded the same as it would be if
+    it were forwarded in one go."""
+
+    frame = format_message(message)
+    tee = MessageTee(0, max_size)
+
+    for idx in range(0, len(frame), piece_size):
+        tee.add(FramePiece(frame[idx : idx + piece_size], idx, len(frame)))
+
+    if max_size is None:
+        assert tee.message() == frame
+        assert not tee.is_truncated
+    else:
+        assert tee.message() == truncate_message(frame, max_size)
+        assert tee.is_truncated == (tee.message() != frame)
+
+    # Only the parts of the message needed for the preview are kept
+    if tee.is_truncated:
+        assert len(tee.head) <= 64 + PREVIEW_SIZE
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import inspect
 import logging
+import os
 import sys
 import textwrap
 import typing
@@ -40,6 +41,10 @@ class ClientServerConfig:
     def _get_devtools_command(self, server: str) -> list[str]:
         """Get the lsp-devtools command required to connect to the given ``server``"""
 
+        # Anything that looks like a path is taken to be a Unix domain socket.
+        if "/" in server or os.sep in server:
+            return ["lsp-devtools", "agent", "--socket", server, "--"]
+
         if ":" in server:
             host, port = server.split(":")
         else:
@@ -71,6 +76,8 @@ class ClientServerConfig:
            If set, enable ``lsp-devtools`` integration, should be of the form
            ``<port>`` or ``<host>:<port>``. Where ``<host>`` and ``<port>``
            describe how to connect to an ``lsp-devtools`` server program.
+           Alternatively, the path to the Unix domain socket the ``lsp-devtools``
+           server program is listening on.
 
         Returns
         -------
@@ -93,7 +100,10 @@ def pytest_addoption(parser):
         action="store",
         default=None,
         const="localhost:8765",
-        help="Enable lsp-devtools integration.",
+        help=(
+            "Enable lsp-devtools integration. Optionally takes the [host:]port or "
+            "Unix socket path of the lsp-devtools server to connect to."
+        ),
     )
 
 
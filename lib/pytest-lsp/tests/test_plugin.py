@@ -59,6 +59,18 @@ if typing.TYPE_CHECKING:
                 "command",
             ],
         ),
+        (
+            ClientServerConfig(server_command=["command"]),
+            {"devtools": "/tmp/lsp-devtools.sock"},
+            [
+                "lsp-devtools",
+                "agent",
+                "--socket",
+                "/tmp/lsp-devtools.sock",
+                "--",
+                "command",
+            ],
+        ),
     ],
 )
 def test_get_server_command(